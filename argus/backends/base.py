@@ -18,6 +18,7 @@ import os
 
 import six
 
+from argus.backends import console
 from argus import util
 
 
@@ -75,6 +76,13 @@ class BaseBackend(object):
 class CloudBackend(BaseBackend):
     """Base backend for cloud related tasks."""
 
+    golden_image = None
+    """The id of the golden image used for booting the instance, if any.
+
+    When this is set before calling :meth:`setup_instance`, the
+    instance will be booted from it instead of the configured image.
+    """
+
     @abc.abstractmethod
     def get_remote_client(self, username=None, password=None, **kwargs):
         """Get a remote client
@@ -111,6 +119,38 @@ class CloudBackend(BaseBackend):
         with open(path, "wb") as stream:
             stream.write(content)
 
+    @util.cached_property
+    def console(self):
+        """A :class:`argus.backends.console.ConsoleWatcher` for the instance."""
+        return console.ConsoleWatcher.from_config(
+            self._conf, self.instance_output_from)
+
+    _console_collector = None
+
+    def start_console_collector(self):
+        """Collect the console output in background, if enabled.
+
+        The output is streamed to a file from *output_directory*,
+        so it is complete even if the scenario crashes.
+        """
+        if not (self._conf.argus.console_collector and
+                self._conf.argus.output_directory):
+            return
+
+        template = self._get_log_template("console")
+        path = os.path.join(self._conf.argus.output_directory,
+                            template.format(self.internal_instance_id()))
+        LOG.info("Collecting instance console output to: %s", path)
+        self._console_collector = console.ConsoleCollector.from_config(
+            self._conf, self.console, path)
+        self._console_collector.start()
+
+    def stop_console_collector(self):
+        """Stop the collector started by :meth:`start_console_collector`."""
+        if self._console_collector:
+            self._console_collector.stop()
+            self._console_collector = None
+
     @abc.abstractmethod
     def instance_output(self, limit=None):
         """Get the underlying's instance output, if any.
@@ -119,6 +159,21 @@ class CloudBackend(BaseBackend):
             Number of lines to fetch from the end of console log.
         """
 
+    def instance_output_from(self, offset):
+        """Get the console output following *offset*, with the next offset.
+
+        The offsets are opaque, except for 0 which is the beginning of
+        the output. By default, the whole output is fetched every time
+        and the offsets are positions in it.
+        """
+        content = self.instance_output()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'replace')
+        if len(content) < offset:
+            # The console output was started over.
+            offset = 0
+        return content[offset:], len(content)
+
     @abc.abstractmethod
     def internal_instance_id(self):
         """Get the underlying's instance id, depending on the internals of the backend."""
@@ -142,3 +197,15 @@ class CloudBackend(BaseBackend):
     @abc.abstractmethod
     def floating_ip(self):
         """Get the floating ip that was attached to the underlying instance."""
+
+    def snapshot_instance(self, name):
+        """Snapshot the underlying instance and return the new image id.
+
+        Backends which can't boot instances from snapshots
+        don't have to implement this.
+        """
+        raise NotImplementedError
+
+    def delete_snapshot(self, image_id):
+        """Delete an image created by :meth:`snapshot_instance`."""
+        raise NotImplementedError
@@ -0,0 +1,294 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Utilities for following the console output of an instance."""
+
+import collections
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+import six
+
+from argus import util
+
+
+__all__ = (
+    'ConsoleCollector',
+    'ConsoleWatcher',
+    'RotatingFile',
+    'BOOT_COMPLETED',
+    'CBINIT_FINISHED',
+)
+
+LOG = util.get_logger()
+
+BOOT_COMPLETED = 'boot_completed'
+CBINIT_FINISHED = 'cbinit_finished'
+# How many rotated console logs are kept.
+BACKUP_COUNT = 5
+
+
+class ConsoleWatcher(object):
+    """Follow the console output of an instance and fire events.
+
+    An event is a name associated with a regular expression. When
+    a line matching the pattern appears in the console output, the
+    event is set and any subscriber is called with the matching line.
+
+    :param get_output:
+        A callable which receives an offset and returns the console
+        output of the instance which follows it, together with the
+        offset of the next read, usually
+        :meth:`argus.backends.base.CloudBackend.instance_output_from`.
+    :param interval:
+        The number of seconds between two console output fetches.
+    """
+
+    def __init__(self, get_output, interval=5):
+        self._get_output = get_output
+        self._interval = interval
+        self._patterns = {}
+        self._fired = {}
+        self._subscribers = collections.defaultdict(list)
+        self._offset = 0
+        self._partial = ''
+        self._lock = threading.RLock()
+        self._poll_lock = threading.Lock()
+        self._fired_cond = threading.Condition(self._lock)
+        self._collector = None
+
+    def add_event(self, name, pattern):
+        """Fire the event *name* when the regex *pattern* is found."""
+        with self._lock:
+            self._patterns[name] = re.compile(pattern)
+
+    def has_event(self, name):
+        return name in self._patterns
+
+    def is_set(self, name):
+        return name in self._fired
+
+    def subscribe(self, name, callback):
+        """Call *callback* with the matching line when *name* fires.
+
+        A subscription to ``None`` receives every new line.
+        """
+        with self._lock:
+            self._subscribers[name].append(callback)
+
+    def _notify(self, name, line):
+        for callback in self._subscribers.get(name, ()):
+            try:
+                callback(line)
+            except Exception:
+                LOG.exception("Console subscriber for %r failed", name)
+
+    def feed(self, data):
+        """Process new console output and fire the matching events."""
+        with self._lock:
+            lines = (self._partial + data).split('\n')
+            # The last line might not be complete yet.
+            self._partial = lines.pop()
+            for line in lines:
+                line = line.rstrip('\r')
+                self._notify(None, line)
+                for name, pattern in self._patterns.items():
+                    if name not in self._fired and pattern.search(line):
+                        LOG.info("Console event %r fired by %r", name, line)
+                        self._fired[name] = line
+                        self._notify(name, line)
+                        self._fired_cond.notify_all()
+            return lines
+
+    def poll(self):
+        """Fetch the console output and process what wasn't seen yet."""
+        with self._poll_lock:
+            new, self._offset = self._get_output(self._offset)
+            if isinstance(new, bytes):
+                new = new.decode('utf-8', 'replace')
+            return self.feed(new)
+
+    def _collecting(self):
+        return self._collector is not None and self._collector.is_alive()
+
+    def wait(self, name, timeout):
+        """Wait at most *timeout* seconds for the event *name*.
+
+        Return True if the event fired, False otherwise. When a
+        :class:`ConsoleCollector` is running, it does the polling.
+        """
+        deadline = time.time() + timeout
+        if self._collecting():
+            with self._lock:
+                while not self.is_set(name):
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or not self._collecting():
+                        break
+                    self._fired_cond.wait(min(self._interval, remaining))
+            if self.is_set(name) or time.time() >= deadline:
+                return self.is_set(name)
+            # The collector stopped, continue polling from here.
+        while True:
+            try:
+                self.poll()
+            except Exception as exc:
+                LOG.debug("Fetching the console output failed with %r", exc)
+            if self.is_set(name):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                LOG.debug("Console event %r didn't fire in %s seconds.",
+                          name, timeout)
+                return False
+            time.sleep(min(self._interval, remaining))
+
+    @classmethod
+    def from_config(cls, conf, get_output):
+        """Build a watcher with the events found in the argus config."""
+        watcher = cls(get_output, interval=conf.argus.console_poll_interval)
+        events = (
+            (BOOT_COMPLETED, conf.argus.boot_console_marker),
+            (CBINIT_FINISHED, conf.argus.cbinit_console_marker),
+        )
+        for name, pattern in events:
+            if pattern:
+                watcher.add_event(name, pattern)
+        return watcher
+
+
+class RotatingFile(object):
+    """A file which is rotated when it grows over a given size.
+
+    The rotated files get a numeric suffix, the most recent one
+    being ``.1``, and they can be compressed with gzip.
+
+    :param path:
+        The location of the file.
+    :param max_bytes:
+        The size after which the file is rotated, 0 for never.
+    :param compress:
+        Whether the rotated files are compressed.
+    """
+
+    def __init__(self, path, max_bytes=0, compress=False,
+                 backup_count=BACKUP_COUNT):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._compress = compress
+        self._backup_count = backup_count
+        self._stream = open(path, 'ab')
+
+    def _name(self, index):
+        name = "{}.{}".format(self._path, index)
+        return name + ".gz" if self._compress else name
+
+    def _rotate(self):
+        self._stream.close()
+        for index in range(self._backup_count - 1, 0, -1):
+            if os.path.exists(self._name(index)):
+                os.rename(self._name(index), self._name(index + 1))
+        if self._compress:
+            with open(self._path, 'rb') as source:
+                with gzip.open(self._name(1), 'wb') as destination:
+                    shutil.copyfileobj(source, destination)
+            os.remove(self._path)
+        else:
+            os.rename(self._path, self._name(1))
+        self._stream = open(self._path, 'ab')
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        self._stream.write(data)
+        self._stream.flush()
+        if self._max_bytes and self._stream.tell() >= self._max_bytes:
+            self._rotate()
+
+    def close(self):
+        self._stream.close()
+
+
+class ConsoleCollector(threading.Thread):
+    """Poll the console output of an instance in background.
+
+    The new console lines are written to a file and they are
+    processed by a :class:`ConsoleWatcher`, firing its events and
+    notifying its subscribers. The polling is frequent while the
+    output grows and it slows down when it doesn't.
+
+    :param watcher:
+        The :class:`ConsoleWatcher` of the instance.
+    :param stream:
+        A file-like object, such as a :class:`RotatingFile`,
+        where the new lines are written.
+    :param min_interval:
+        The number of seconds between two polls while there is
+        new output.
+    :param max_interval:
+        The maximum number of seconds between two polls.
+    """
+
+    def __init__(self, watcher, stream, min_interval, max_interval):
+        super(ConsoleCollector, self).__init__()
+        self.daemon = True
+        self._watcher = watcher
+        self._stream = stream
+        self._min_interval = min_interval
+        self._max_interval = max(max_interval, min_interval)
+        self._stopped = threading.Event()
+
+    def start(self):
+        # pylint: disable=protected-access
+        self._watcher._collector = self
+        super(ConsoleCollector, self).start()
+
+    def _collect(self):
+        try:
+            lines = self._watcher.poll()
+        except Exception as exc:
+            LOG.debug("Collecting the console output failed with %r", exc)
+            return False
+        if lines:
+            self._stream.write(u''.join(line + u'\n' for line in lines))
+        return bool(lines)
+
+    def run(self):
+        interval = self._min_interval
+        while not self._stopped.is_set():
+            if self._collect():
+                interval = self._min_interval
+            else:
+                interval = min(interval * 2, self._max_interval)
+            self._stopped.wait(interval)
+
+    def stop(self):
+        """Collect what is left of the console output and stop."""
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self._collect()
+        self._stream.close()
+
+    @classmethod
+    def from_config(cls, conf, watcher, path):
+        """Build a collector writing to *path*, as configured."""
+        stream = RotatingFile(path, conf.argus.console_log_max_bytes,
+                              conf.argus.console_log_compress)
+        return cls(watcher, stream, conf.argus.console_poll_interval,
+                   conf.argus.console_collector_max_interval)
@@ -0,0 +1,313 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A fake cloud, running in the argus process.
+
+:class:`FakeCloudBackend` simulates the instances, with their
+floating IPs, console output, passwords, reboots and rescues, while
+:class:`FakeRemoteClient` answers the commands sent to them. With
+these, a scenario goes through its whole lifecycle without a cloud,
+which makes the overhead of argus itself, such as the scheduling,
+the waiting and the cleanup, measurable and reproducible.
+"""
+
+import collections
+import functools
+import re
+import random
+import socket
+import threading
+import time
+import uuid
+
+from argus.backends import base
+from argus.client import windows
+from argus import exceptions
+from argus import util
+
+
+__all__ = (
+    'FakeCloudBackend',
+    'FakeRemoteClient',
+)
+
+LOG = util.get_logger()
+# The addresses reserved for documentation, which are never routed.
+FLOATING_IP_TEMPLATE = "192.0.2.{}"
+
+
+class FakeRemoteClient(windows.WinRemoteClient):
+    """A remote client whose commands are answered locally.
+
+    :param responses:
+        A sequence of ``(pattern, stdout, stderr, exit_code)`` tuples.
+        A command gets the result of the first pattern found in it,
+        with :func:`re.search`, while the commands not matching any
+        pattern succeed without any output. The *stdout* can be a
+        callable, called with the command, which can also raise an
+        exception, as the transport would.
+    :param latency:
+        An optional callable, giving how many seconds a command takes.
+    """
+
+    def __init__(self, hostname, username, password, responses=(),
+                 latency=None, **kwargs):
+        super(FakeRemoteClient, self).__init__(hostname, username, password,
+                                               **kwargs)
+        self._responses = [(re.compile(pattern), stdout, stderr, exit_code)
+                           for pattern, stdout, stderr, exit_code
+                           in responses]
+        self._latency = latency
+        self.commands = []
+        """The commands received so far, in order."""
+
+    def _answer(self, command):
+        for pattern, stdout, stderr, exit_code in self._responses:
+            if pattern.search(command):
+                if callable(stdout):
+                    stdout = stdout(command)
+                return stdout, stderr, exit_code
+        return "", "", 0
+
+    def _run_commands(self, commands):
+        results = []
+        for command in commands:
+            if self._latency:
+                time.sleep(self._latency())
+            self.commands.append(command)
+            results.append(self._check_result(command,
+                                              *self._answer(command)))
+        return results
+
+    def _probe_port(self):
+        return True
+
+    def _probe_auth(self):
+        return True
+
+
+class FakeCloudBackend(base.CloudBackend):
+    """A backend whose instances exist only in memory.
+
+    The behaviour of the fake cloud is given by the class attributes,
+    so a scenario tunes it by using a subclass. The latencies are
+    ``(mean, standard deviation)`` pairs, in seconds, of a normal
+    distribution. The random draws are seeded with :attr:`seed` and
+    the name of the backend, so a run can be repeated exactly.
+    """
+
+    api_latency = (0, 0)
+    """How long an API call takes."""
+
+    boot_latency = (0, 0)
+    """How long it takes for an instance to become active."""
+
+    reboot_latency = (0, 0)
+    """How long a reboot, a rescue or an unrescue takes."""
+
+    command_latency = (0, 0)
+    """How long a command sent to the instance takes."""
+
+    failure_rate = 0
+    """The probability of an API call failing."""
+
+    failure_rates = {}
+    """The failure rates of specific API calls, such as ``create_server``."""
+
+    seed = 0
+    """The seed of the random draws, None for a different run every time."""
+
+    remote_responses = ()
+    """The *responses* of the :class:`FakeRemoteClient`.
+
+    They take precedence over :meth:`default_responses`.
+    """
+
+    def __init__(self, conf, name=None, userdata=None, metadata=None,
+                 availability_zone=None):
+        super(FakeCloudBackend, self).__init__(
+            conf, name=name, userdata=userdata, metadata=metadata,
+            availability_zone=availability_zone)
+        seed = None if self.seed is None else "{}:{}".format(self.seed, name)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._server = None
+        self._floating_ip = None
+        self._console_lines = []
+        self._boots = 0
+        self._sysprepped = False
+        self.calls = collections.Counter()
+        """How many times each API call was made."""
+
+    def _delay(self, latency):
+        mean, deviation = latency
+        with self._random_lock:
+            value = self._random.gauss(mean, deviation) if deviation else mean
+        return max(value, 0)
+
+    def _call(self, action, latency=None):
+        """Simulate an API call, which can take a while and fail."""
+        self.calls[action] += 1
+        time.sleep(self._delay(latency or self.api_latency))
+        rate = self.failure_rates.get(action, self.failure_rate)
+        with self._random_lock:
+            failed = self._random.random() < rate
+        if failed:
+            raise exceptions.ArgusError(
+                "Simulated failure of {}".format(action))
+
+    def _new_id(self):
+        with self._random_lock:
+            return str(uuid.UUID(int=self._random.getrandbits(128),
+                                 version=4))
+
+    def _boot(self, status='ACTIVE'):
+        self._boots += 1
+        self._server['status'] = status
+        self._console_lines.append("fake: boot {} of {}".format(
+            self._boots, self._server['id']))
+        # The markers are expected to be plain text, as the default ones.
+        # Cloudbaseinit runs only once the instance was sysprepped.
+        markers = [self._conf.argus.boot_console_marker]
+        if self._sysprepped:
+            markers.append(self._conf.argus.cbinit_console_marker)
+        self._console_lines.extend(marker for marker in markers if marker)
+
+    def _boot_id(self, command):
+        # pylint: disable=unused-argument
+        return "fake-boot-{}".format(self._boots)
+
+    def _sysprep(self, command):
+        # pylint: disable=unused-argument
+        self._sysprepped = True
+        self._boot()
+        raise socket.error("The fake instance restarted")
+
+    def default_responses(self):
+        """Get the answers of a healthy instance to the usual commands.
+
+        These are the commands of
+        :class:`argus.recipes.cloud.windows.CloudbaseinitRecipe`, of
+        :class:`argus.introspection.cloud.windows.InstanceIntrospection`
+        and of :class:`argus.backends.reboot.RebootTracker`. The
+        instance reboots when running sysprep, which breaks the
+        connection, as a real one does.
+        """
+        return (
+            (r'LastBootUpTime', self._boot_id, '', 0),
+            (r'^powershell C:\\sysprep\.ps1$', self._sysprep, '', 0),
+            (r'Win32_Account', self._conf.openstack.image_username, '', 0),
+            (r'OSArchitecture', '64-bit', '', 0),
+            (r'ProgramFiles\(x86\)', 'C:\\Program Files (x86)', '', 0),
+            (r'\$ENV:ProgramFiles', 'C:\\Program Files', '', 0),
+            (r'^dir ".*Cloudbase-Init" /b$', 'bin\nconf\nPython', '', 0),
+            (r'Test-Path', 'True', '', 0),
+            (r'Get-Service', 'Stopped', '', 0),
+            (r'Win32_OperatingSystem\)\.Version', '10.0.14393', '', 0),
+        )
+
+    def setup_instance(self):
+        LOG.info("Creating fake server...")
+        self._call('create_server', self.boot_latency)
+        image_ref = self.golden_image or self._conf.openstack.image_ref
+        self._server = {
+            'id': self._new_id(),
+            'name': util.rand_name(self._name) + "-instance",
+            'image': {'id': image_ref},
+            'flavor': {'id': self._conf.openstack.flavor_ref},
+            'metadata': self.metadata or {},
+            'OS-EXT-AZ:availability_zone': self._availability_zone,
+        }
+        self._boot()
+        self._call('create_floating_ip')
+        with self._random_lock:
+            host = self._random.randint(1, 254)
+        self._floating_ip = FLOATING_IP_TEMPLATE.format(host)
+
+    def cleanup(self):
+        if self._server is None:
+            return
+        LOG.info("Cleaning up fake server %s...", self._server['id'])
+        self._call('delete_floating_ip')
+        self._call('delete_server')
+        self._server = self._floating_ip = None
+        LOG.debug("API calls of %s: %s", self._name, dict(self.calls))
+
+    # pylint: disable=unused-argument
+    def get_remote_client(self, username=None, password=None,
+                          protocol='http', **kwargs):
+        if username is None:
+            username = self._conf.openstack.image_username
+        if password is None:
+            password = self._conf.openstack.image_password
+        return FakeRemoteClient(
+            self.floating_ip(), username, password,
+            responses=(tuple(self.remote_responses) +
+                       self.default_responses()),
+            latency=functools.partial(self._delay, self.command_latency),
+            transport_protocol=protocol)
+
+    remote_client = util.cached_property(get_remote_client, 'remote_client')
+
+    def instance_output(self, limit=None):
+        self._call('get_console_output')
+        lines = self._console_lines[-limit:] if limit else self._console_lines
+        return "".join(line + "\n" for line in lines)
+
+    def internal_instance_id(self):
+        return self._server['id']
+
+    def instance_server(self):
+        """Get the fake server, as a compute API would describe it."""
+        self._call('show_server')
+        return dict(self._server)
+
+    def get_image_by_ref(self):
+        self._call('show_image')
+        return {'id': self._conf.openstack.image_ref,
+                'OS-EXT-IMG-SIZE:size': 0}
+
+    def reboot_instance(self):
+        self._call('reboot_server', self.reboot_latency)
+        self._boot()
+        self.remote_client.mark_not_ready()
+
+    def rescue_server(self):
+        self._call('rescue_server', self.reboot_latency)
+        self._boot('RESCUE')
+
+    def unrescue_server(self):
+        self._call('unrescue_server', self.reboot_latency)
+        self._boot()
+
+    def instance_password(self):
+        self._call('get_password')
+        return self._conf.openstack.image_password
+
+    def private_key(self):
+        return "fake private key"
+
+    def public_key(self):
+        return "ssh-rsa fake"
+
+    def floating_ip(self):
+        return self._floating_ip
+
+    def snapshot_instance(self, name):
+        self._call('create_image', self.boot_latency)
+        return self._new_id()
+
+    def delete_snapshot(self, image_id):
+        self._call('delete_image')
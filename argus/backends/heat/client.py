@@ -13,115 +13,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from six.moves import urllib_parse as urlparse
-
 from heatclient import client
-from heatclient.common import utils
-from heatclient import exc
-from keystoneclient.auth.identity import v2 as v2_auth
-from keystoneclient.auth.identity import v3 as v3_auth
-from keystoneclient import discover
-from keystoneclient.openstack.common.apiclient import exceptions as ks_exc
-from keystoneclient import session as kssession
-
-
-def _discover_auth_versions(session, auth_url):
-    # discover the API versions the server is supporting base on the
-    # given URL
-    v2_auth_url = None
-    v3_auth_url = None
-    try:
-        ks_discover = discover.Discover(session=session, auth_url=auth_url)
-        v2_auth_url = ks_discover.url_for('2.0')
-        v3_auth_url = ks_discover.url_for('3.0')
-    except ks_exc.ClientException:
-        # Identity service may not support discover API version.
-        # Lets trying to figure out the API version from the original URL.
-        path = urlparse.urlparse(auth_url).path
-        path = path.lower()
-        if path.startswith('/v3'):
-            v3_auth_url = auth_url
-        elif path.startswith('/v2'):
-            v2_auth_url = auth_url
-        else:
-            # not enough information to determine the auth version
-            msg = ('Unable to determine the Keystone version '
-                   'to authenticate with using the given '
-                   'auth_url. Identity service may not support API '
-                   'version discovery. Please provide a versioned '
-                   'auth_url instead.')
-            raise exc.CommandError(msg)
-
-    return v2_auth_url, v3_auth_url
-
-
-def _get_keystone_v3_auth(v3_auth_url, **kwargs):
-    auth_token = kwargs.pop('auth_token', None)
-    if auth_token:
-        return v3_auth.Token(v3_auth_url, auth_token)
-    else:
-        return v3_auth.Password(v3_auth_url, **kwargs)
-
-
-def _get_keystone_v2_auth(v2_auth_url, **kwargs):
-    auth_token = kwargs.pop('auth_token', None)
-    tenant_id = kwargs.pop('project_id', None)
-    tenant_name = kwargs.pop('project_name', None)
-    if auth_token:
-        return v2_auth.Token(v2_auth_url, auth_token,
-                             tenant_id=tenant_id,
-                             tenant_name=tenant_name)
-    else:
-        return v2_auth.Password(v2_auth_url,
-                                username=kwargs.pop('username', None),
-                                password=kwargs.pop('password', None),
-                                tenant_id=tenant_id,
-                                tenant_name=tenant_name)
-
-
-def _get_keystone_auth(session, auth_url, **kwargs):
-    # discover the supported keystone versions using the given url
-    (v2_auth_url, v3_auth_url) = _discover_auth_versions(
-        session=session,
-        auth_url=auth_url)
-
-    # Determine which authentication plugin to use. First inspect the
-    # auth_url to see the supported version. If both v3 and v2 are
-    # supported, then use the highest version if possible.
-    auth = None
-    if v3_auth_url and v2_auth_url:
-        user_domain_name = kwargs.get('user_domain_name', None)
-        user_domain_id = kwargs.get('user_domain_id', None)
-        project_domain_name = kwargs.get('project_domain_name', None)
-        project_domain_id = kwargs.get('project_domain_id', None)
 
-        # support both v2 and v3 auth. Use v3 if domain information is
-        # provided.
-        if (user_domain_name or user_domain_id or project_domain_name or
-                project_domain_id):
-            auth = _get_keystone_v3_auth(v3_auth_url, **kwargs)
-        else:
-            auth = _get_keystone_v2_auth(v2_auth_url, **kwargs)
-    elif v3_auth_url:
-        # support only v3
-        auth = _get_keystone_v3_auth(v3_auth_url, **kwargs)
-    elif v2_auth_url:
-        # support only v2
-        auth = _get_keystone_v2_auth(v2_auth_url, **kwargs)
-    else:
-        raise exc.CommandError('Unable to determine the Keystone version '
-                               'to authenticate with using the given '
-                               'auth_url.')
+from argus.backends import keystone
 
-    return auth
 
+def heat_client(credentials, api_version=1, token_cache=None):
+    """Get a new Heat client using the given credentials.
 
-def heat_client(credentials, api_version=1):
-    """Get a new Heat client using the given credentials."""
+    :param token_cache:
+        An optional :class:`argus.identity.TokenCache`, for reusing
+        the token and the version discovery of the previous clients.
+    """
     endpoint = ''
     service_type = 'orchestration'
-    keystone_session = kssession.Session(verify=True)
-    os_auth_url = utils.env('OS_AUTH_URL')
+    os_auth_url = keystone.auth_url()
     kwargs = {
         'username': credentials.username,
         'user_id': credentials.user_id,
@@ -129,8 +35,8 @@ def heat_client(credentials, api_version=1):
         'project_id': credentials.tenant_id,
         'project_name': credentials.tenant_name,
     }
-    keystone_auth = _get_keystone_auth(keystone_session,
-                                       os_auth_url, **kwargs)
+    keystone_session, keystone_auth = keystone.get_session(
+        os_auth_url, token_cache=token_cache, **kwargs)
     endpoint = keystone_auth.get_endpoint(keystone_session,
                                           service_type=service_type,
                                           region_name=None)
@@ -21,24 +21,36 @@ import six
 
 from argus.backends import base
 from argus.backends.heat import client
+from argus.backends import parking
 from argus.backends import windows
 from argus.backends.tempest import manager as api_manager
+from argus.backends.tempest import tenants
 from argus import exceptions
+from argus import identity
 from argus import util
 
 
-OS_NOVA_RESOURCE = 'OS::Nova::Server'
-OS_NEUTRON_FLOATING_IP = "OS::Neutron::FloatingIP"
-RESOURCE_COMPLETED_STATUS = "CREATE_COMPLETE"
-RESOURCE_DELETED_STATUS = "DELETE_CREATE"
-HEAT_RESOURCE_LIMIT = 10
-HEAT_RESOURCE_TIMEOUT = 0.5
+LOG = util.get_logger()
+STACK_CREATE_COMPLETE = "CREATE_COMPLETE"
+STACK_DELETE_COMPLETE = "DELETE_COMPLETE"
+STACK_UPDATE_COMPLETE = "UPDATE_COMPLETE"
+# How long it can take for a stack to be created or deleted.
+HEAT_STACK_TIMEOUT = 1800
+# The delays between two stack status checks grow between these.
+HEAT_POLL_INITIAL = 0.5
+HEAT_POLL_MAXIMUM = 10
 
 
 # pylint: disable=abstract-method; FP: https://bitbucket.org/logilab/pylint/issues/565
 @six.add_metaclass(abc.ABCMeta)
 class BaseHeatBackend(base.CloudBackend):
-    """A backend which uses Heat as the driving core."""
+    """A backend which uses Heat as the driving core.
+
+    When *heat_stack_reuse* is enabled, the stack isn't deleted
+    when the backend is cleaned up, but it is kept for the next
+    backend using the same image and flavor, which updates
+    only what differs in its template.
+    """
 
     def __init__(self, conf, name=None, userdata=None, metadata=None,
                  availability_zone=None):
@@ -46,10 +58,32 @@ class BaseHeatBackend(base.CloudBackend):
             conf, name=name, userdata=userdata, metadata=metadata,
             availability_zone=availability_zone)
 
-        self._manager = api_manager.APIManager()
+        parked = None
+        if self._conf.argus.heat_stack_reuse:
+            parked = parking.get_parked_backends().take(self._stack_key())
+        if parked is not None:
+            # pylint: disable=protected-access
+            LOG.info("Reusing stack %s", parked._stack_name)
+            self._manager = parked._manager
+            self._heat_client = parked._heat_client
+            self._keypair = parked._keypair
+            self._stack_name = parked._stack_name
+            self._template = parked._template
+            self._outputs = parked._outputs
+            return
+
+        self._manager = tenants.acquire_manager(self._conf)
         self._heat_client = client.heat_client(
-            self._manager.primary_credentials())
+            self._manager.primary_credentials(),
+            token_cache=identity.get_token_cache(self._conf))
         self._keypair = None
+        self._stack_name = self._name
+        self._template = None
+        self._outputs = None
+
+    def _stack_key(self):
+        return (type(self), self._conf.openstack.image_ref,
+                self._conf.openstack.flavor_ref)
 
     @staticmethod
     def _build_template(instance_name, key,
@@ -109,6 +143,18 @@ class BaseHeatBackend(base.CloudBackend):
                         u'description': u'Add security group rules for server',
                         u'name': u'security-group'}
                 }
+            },
+            u'outputs': {
+                u'server_id': {
+                    u'value': {u'get_resource': instance_name},
+                },
+                u'floating_ip_id': {
+                    u'value': {u'get_resource': u'server_floating_ip'},
+                },
+                u'floating_ip': {
+                    u'value': {u'get_attr': [u'server_floating_ip',
+                                             u'floating_ip_address']},
+                },
             }
         }
 
@@ -122,25 +168,36 @@ class BaseHeatBackend(base.CloudBackend):
         super(BaseHeatBackend, self).setup_instance()
 
         # Get the image and the flavor name
-        image_name = self._manager.image_client.get_image_meta(
-            self._conf.openstack.image_ref)['name']
-        flavor_name = self._manager.flavors_client.show_flavor(
+        if self.golden_image:
+            # Heat resolves image ids as well.
+            image_name = self.golden_image
+        else:
+            image_name = self._manager.get_image_meta(
+                self._conf.openstack.image_ref)['name']
+        flavor_name = self._manager.show_flavor(
             self._conf.openstack.flavor_ref)['flavor']['name']
-        self._keypair = self._manager.create_keypair(
-            name=self.__class__.__name__)
+        reused = self._template is not None
+        if not reused:
+            self._keypair = self._manager.create_keypair(
+                name=self.__class__.__name__)
 
         # Get network info.
         credentials = self._manager.primary_credentials()
-        self._configure_networking(credentials)
+        if not reused:
+            self._configure_networking(credentials)
         floating_network_id = credentials.router['external_gateway_info']['network_id']
         private_net_id = credentials.network['id']
 
         template = self._build_template(
-            self._name, self._keypair.name,
+            self._stack_name, self._keypair.name,
             image_name, flavor_name, self.userdata,
             floating_network_id, private_net_id)
+        if reused:
+            self._update_stack(template)
+            return
+
         fields = {
-            'stack_name': self._name,
+            'stack_name': self._stack_name,
             'disable_rollback': True,
             'parameters': {},
             'template': template,
@@ -149,71 +206,130 @@ class BaseHeatBackend(base.CloudBackend):
         }
 
         self._heat_client.stacks.create(**fields)
+        self._template = template
+        self._read_outputs(self._wait_for_stack(STACK_CREATE_COMPLETE))
+
+    def _read_outputs(self, stack):
+        self._outputs = {output['output_key']: output['output_value']
+                         for output in stack.outputs}
+
+    def _update_stack(self, template):
+        """Bring a kept stack to the given template.
+
+        Heat replaces the resources affected by the changes, such
+        as the server when its userdata changes, while the network
+        resources are kept. If nothing changed, the server is
+        rebuilt, since it was already used by another scenario.
+        """
+        # The console output of the previous scenario isn't ours,
+        # even if the server is kept.
+        self._manager.forget_instance(self.internal_instance_id())
+        if template == self._template:
+            LOG.info("Stack %s is unchanged, rebuilding its server",
+                     self._stack_name)
+            self._manager.rebuild_instance(
+                self.internal_instance_id(),
+                self.golden_image or self._conf.openstack.image_ref)
+            return
+
+        LOG.info("Updating stack %s", self._stack_name)
+        previous = self._heat_client.stacks.get(stack_id=self._stack_name)
+        self._heat_client.stacks.update(
+            self._stack_name,
+            disable_rollback=True,
+            parameters={},
+            template=template,
+            files={},
+            environment={})
+        self._template = template
+        self._read_outputs(self._wait_for_stack(STACK_UPDATE_COMPLETE,
+                                                previous=previous))
+
+    def _wait_for_stack(self, status, timeout=HEAT_STACK_TIMEOUT,
+                        previous=None):
+        """Wait for the stack to reach the given status.
+
+        The status of the whole stack is checked, with growing
+        delays, until it either reaches *status*, fails or the
+        deadline passes. Return the stack or None if it is gone.
+
+        :param previous:
+            The stack as it was before an update. Heat starts the
+            update asynchronously, so the status is ignored while
+            the stack wasn't updated since, otherwise the status and
+            the outputs of the previous update would be taken.
+        """
+        deadline = time.time() + timeout
+        delay = HEAT_POLL_INITIAL
+        while True:
+            try:
+                stack = self._heat_client.stacks.get(stack_id=self._stack_name)
+            except exc.HTTPNotFound:
+                return None
+
+            started = (previous is None or
+                       stack.updated_time != previous.updated_time)
+            if started and stack.stack_status == status:
+                return stack
+            if started and stack.stack_status.endswith('_FAILED'):
+                raise exceptions.ArgusError(
+                    "Stack %s failed with status %s: %s"
+                    % (self._stack_name, stack.stack_status,
+                       stack.stack_status_reason))
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise exceptions.ArgusTimeoutError(
+                    "Stack %s didn't reach %s, it is still %s"
+                    % (self._stack_name, status, stack.stack_status))
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, HEAT_POLL_MAXIMUM)
 
     def cleanup(self):
+        if self._conf.argus.heat_stack_reuse and self._outputs:
+            LOG.info("Keeping stack %s for the next scenario",
+                     self._stack_name)
+            parking.get_parked_backends().park(self._stack_key(), self,
+                                               self._destroy)
+            return
+        self._destroy()
+
+    def _destroy(self):
         if self._keypair:
             self._keypair.destroy()
+        if self._outputs:
+            self._manager.forget_instance(self.internal_instance_id())
 
         try:
-            self._heat_client.stacks.delete(stack_id=self._name)
-        finally:
+            self._heat_client.stacks.delete(stack_id=self._stack_name)
             self._delete_floating_ip()
+            self._wait_for_stack(STACK_DELETE_COMPLETE)
+        finally:
             self._manager.cleanup_credentials()
 
     def _delete_floating_ip(self):
-        self._manager.floating_ips_client.delete_floating_ip(
-            self._floating_ip_resource['id'])
-        try:
-            self._search_resource_until_status(OS_NEUTRON_FLOATING_IP,
-                                               status=RESOURCE_DELETED_STATUS)
-        except exceptions.ArgusError:
-            # Can't find it, just quit.
+        if not self._outputs:
             return
-
-    def _search_resource_until_status(self, resource_name, limit=HEAT_RESOURCE_LIMIT,
-                                      status=RESOURCE_COMPLETED_STATUS):
-        fields = {
-            'stack_id': self._name,
-            'nested_depth': 1,
-        }
-        while limit > 0:
-            try:
-                resources = self._heat_client.resources.list(**fields)
-            except exc.HTTPNotFound:
-                raise exceptions.ArgusError('Stack not found: %s' % self._name)
-            else:
-                for resource in resources:
-                    if resource.resource_type == resource_name:
-                        # Found the resource we were needing
-                        if resource.resource_status == status:
-                            return resource.physical_resource_id
-                        else:
-                            limit -= 1
-                            time.sleep(HEAT_RESOURCE_TIMEOUT)
-                            break
-                else:
-                    break
-
-        raise exceptions.ArgusError("No resource %s found with name %s"
-                                    % (resource_name, self._name))
-
-    @util.cached_property
-    def _internal_id(self):
-        return self._search_resource_until_status(OS_NOVA_RESOURCE)
+        try:
+            self._manager.floating_ips_client.delete_floating_ip(
+                self._outputs['floating_ip_id'])
+        except Exception as exc_info:
+            # Heat is deleting it as well.
+            LOG.debug("Deleting the floating IP failed with %r", exc_info)
+
+    def _output(self, key):
+        if not self._outputs:
+            raise exceptions.ArgusError("Stack %s is not ready"
+                                        % self._stack_name)
+        return self._outputs[key]
 
     def internal_instance_id(self):
         """Get the underlying's instance id, depending on the internals of the backend."""
-        return self._internal_id
-
-    @util.cached_property
-    def _floating_ip_resource(self):
-        resource = self._search_resource_until_status(OS_NEUTRON_FLOATING_IP)
-        floating_ip = self._manager.floating_ips_client.show_floating_ip(resource)
-        return floating_ip['floating_ip']
+        return self._output('server_id')
 
     def floating_ip(self):
         """Get the underlying floating ip."""
-        return self._floating_ip_resource['ip']
+        return self._output('floating_ip')
 
     def instance_output(self, limit=api_manager.OUTPUT_SIZE):
         """Get the console output, sent from the instance."""
@@ -221,10 +337,24 @@ class BaseHeatBackend(base.CloudBackend):
             self.internal_instance_id(),
             limit)
 
+    def instance_output_from(self, offset):
+        """Get the new console output, read incrementally."""
+        return self._manager.instance_output_from(
+            self.internal_instance_id(), offset, api_manager.OUTPUT_SIZE)
+
     def reboot_instance(self):
         """Reboot the underlying instance."""
         return self._manager.reboot_instance(self.internal_instance_id())
 
+    def snapshot_instance(self, name):
+        """Snapshot the underlying instance and return the new image id."""
+        return self._manager.create_snapshot(self.internal_instance_id(),
+                                             name)
+
+    def delete_snapshot(self, image_id):
+        """Delete an image created by :meth:`snapshot_instance`."""
+        self._manager.delete_image(image_id)
+
     def instance_password(self):
         """Get the underlying instance password, if any."""
         return self._manager.instance_password(
@@ -245,7 +375,7 @@ class BaseHeatBackend(base.CloudBackend):
 
     def get_image_by_ref(self):
         """Get the image object by its reference id."""
-        return self._manager.images_client.show_image(self._conf.openstack.image_ref)
+        return self._manager.show_image(self._conf.openstack.image_ref)
 
 
 class WindowsHeatBackend(windows.WindowsBackendMixin, BaseHeatBackend):
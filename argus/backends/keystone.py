@@ -0,0 +1,182 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Keystone sessions, used by the Heat client and by the native clients."""
+
+import os
+
+from keystoneclient import access
+from keystoneclient.auth.identity import v2 as v2_auth
+from keystoneclient.auth.identity import v3 as v3_auth
+from keystoneclient import discover
+from keystoneclient.openstack.common.apiclient import exceptions as ks_exc
+from keystoneclient import session as kssession
+from six.moves import urllib_parse as urlparse
+
+from argus import exceptions
+from argus import identity
+
+
+__all__ = (
+    'auth_url',
+    'get_keystone_auth',
+    'get_session',
+)
+
+
+def auth_url():
+    """Get the identity endpoint, as given by the environment."""
+    return os.environ.get('OS_AUTH_URL')
+
+
+def _discover_auth_versions(session, auth_url):
+    # discover the API versions the server is supporting base on the
+    # given URL
+    v2_auth_url = None
+    v3_auth_url = None
+    try:
+        ks_discover = discover.Discover(session=session, auth_url=auth_url)
+        v2_auth_url = ks_discover.url_for('2.0')
+        v3_auth_url = ks_discover.url_for('3.0')
+    except ks_exc.ClientException:
+        # Identity service may not support discover API version.
+        # Lets trying to figure out the API version from the original URL.
+        path = urlparse.urlparse(auth_url).path
+        path = path.lower()
+        if path.startswith('/v3'):
+            v3_auth_url = auth_url
+        elif path.startswith('/v2'):
+            v2_auth_url = auth_url
+        else:
+            # not enough information to determine the auth version
+            msg = ('Unable to determine the Keystone version '
+                   'to authenticate with using the given '
+                   'auth_url. Identity service may not support API '
+                   'version discovery. Please provide a versioned '
+                   'auth_url instead.')
+            raise exceptions.ArgusError(msg)
+
+    return v2_auth_url, v3_auth_url
+
+
+def _get_keystone_v3_auth(v3_auth_url, **kwargs):
+    auth_token = kwargs.pop('auth_token', None)
+    if auth_token:
+        return v3_auth.Token(v3_auth_url, auth_token)
+    else:
+        return v3_auth.Password(v3_auth_url, **kwargs)
+
+
+def _get_keystone_v2_auth(v2_auth_url, **kwargs):
+    auth_token = kwargs.pop('auth_token', None)
+    tenant_id = kwargs.pop('project_id', None)
+    tenant_name = kwargs.pop('project_name', None)
+    if auth_token:
+        return v2_auth.Token(v2_auth_url, auth_token,
+                             tenant_id=tenant_id,
+                             tenant_name=tenant_name)
+    else:
+        return v2_auth.Password(v2_auth_url,
+                                username=kwargs.pop('username', None),
+                                password=kwargs.pop('password', None),
+                                tenant_id=tenant_id,
+                                tenant_name=tenant_name)
+
+
+def get_keystone_auth(session, auth_url, token_cache=None, **kwargs):
+    """Get the auth plugin for the highest supported identity API.
+
+    :param token_cache:
+        An optional :class:`argus.identity.TokenCache`, which
+        remembers the version discovery of *auth_url*.
+    """
+    # discover the supported keystone versions using the given url
+    def discover():
+        return _discover_auth_versions(session=session, auth_url=auth_url)
+
+    if token_cache is None:
+        (v2_auth_url, v3_auth_url) = discover()
+    else:
+        (v2_auth_url, v3_auth_url) = token_cache.discovery(auth_url, discover)
+
+    # Determine which authentication plugin to use. First inspect the
+    # auth_url to see the supported version. If both v3 and v2 are
+    # supported, then use the highest version if possible.
+    auth = None
+    if v3_auth_url and v2_auth_url:
+        user_domain_name = kwargs.get('user_domain_name', None)
+        user_domain_id = kwargs.get('user_domain_id', None)
+        project_domain_name = kwargs.get('project_domain_name', None)
+        project_domain_id = kwargs.get('project_domain_id', None)
+
+        # support both v2 and v3 auth. Use v3 if domain information is
+        # provided.
+        if (user_domain_name or user_domain_id or project_domain_name or
+                project_domain_id):
+            auth = _get_keystone_v3_auth(v3_auth_url, **kwargs)
+        else:
+            auth = _get_keystone_v2_auth(v2_auth_url, **kwargs)
+    elif v3_auth_url:
+        # support only v3
+        auth = _get_keystone_v3_auth(v3_auth_url, **kwargs)
+    elif v2_auth_url:
+        # support only v2
+        auth = _get_keystone_v2_auth(v2_auth_url, **kwargs)
+    else:
+        raise exceptions.ArgusError('Unable to determine the Keystone '
+                                    'version to authenticate with using '
+                                    'the given auth_url.')
+
+    return auth
+
+
+def _restore_access(data):
+    data = dict(data)
+    auth_token = data.pop('auth_token', None)
+    return access.AccessInfo.factory(auth_token=auth_token, **data)
+
+
+def _authenticate(session, keystone_auth, token_cache, token_key):
+    """Authenticate with a cached token, if there is a valid one."""
+    cached = token_cache.get(token_key)
+    if cached is not None:
+        keystone_auth.auth_ref = _restore_access(cached)
+    auth_ref = keystone_auth.get_access(session)
+    if cached is None:
+        token_cache.set(token_key, dict(auth_ref),
+                        identity.parse_expiry(auth_ref.expires))
+
+
+def get_session(auth_url, token_cache=None, **kwargs):
+    """Get an authenticated keystone session and its auth plugin.
+
+    The session pools its HTTP connections, so it should be shared
+    by all the clients using the same credentials.
+
+    :param token_cache:
+        An optional :class:`argus.identity.TokenCache`, for reusing
+        the token and the version discovery of the previous sessions.
+    :param kwargs:
+        The credentials, such as *username*, *password* and
+        *project_name*.
+    """
+    session = kssession.Session(verify=True)
+    keystone_auth = get_keystone_auth(session, auth_url,
+                                      token_cache=token_cache, **kwargs)
+    if token_cache is not None:
+        token_key = identity.cache_key('keystoneclient', auth_url, kwargs)
+        _authenticate(session, keystone_auth, token_cache, token_key)
+    session.auth = keystone_auth
+    return session, keystone_auth
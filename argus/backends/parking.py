@@ -0,0 +1,85 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Keep the resources of finished backends for the next ones.
+
+A backend whose resources can be reused, for instance by rebuilding
+its instance, parks itself instead of destroying everything. A new
+backend with the same key can then take it over. Whatever is still
+parked when argus exits is destroyed.
+"""
+
+import atexit
+import threading
+
+from argus import util
+
+
+__all__ = (
+    'ParkedBackends',
+    'get_parked_backends',
+)
+
+LOG = util.get_logger()
+
+
+class ParkedBackends(object):
+    """The backends kept around, by their keys."""
+
+    def __init__(self):
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def park(self, key, backend, destroy):
+        """Park *backend* under *key*.
+
+        :param destroy:
+            A callable which destroys the resources of the backend,
+            if nobody takes it over. A backend already parked under
+            the same key is destroyed right away.
+        """
+        with self._lock:
+            previous = self._backends.get(key)
+            self._backends[key] = (backend, destroy)
+        if previous is not None:
+            self._destroy(*previous)
+
+    def take(self, key):
+        """Take over the backend parked under *key*, None if there is none."""
+        with self._lock:
+            backend, _ = self._backends.pop(key, (None, None))
+        return backend
+
+    @staticmethod
+    def _destroy(backend, destroy):
+        try:
+            destroy()
+        except Exception:
+            LOG.exception("Destroying the parked %r failed", backend)
+
+    def close(self):
+        """Destroy all the parked backends."""
+        with self._lock:
+            parked, self._backends = list(self._backends.values()), {}
+        for backend, destroy in parked:
+            self._destroy(backend, destroy)
+
+
+@util.run_once
+def get_parked_backends():
+    """Get the parked backends of this process."""
+    parked = ParkedBackends()
+    atexit.register(parked.close)
+    return parked
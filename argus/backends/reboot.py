@@ -0,0 +1,135 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Detect when an instance really went through a reboot."""
+
+import time
+
+from argus import exceptions
+from argus import util
+
+
+__all__ = (
+    'RebootTracker',
+)
+
+LOG = util.get_logger()
+
+BOOT_ID_CMD = ('powershell "(Get-WmiObject Win32_OperatingSystem)'
+               '.LastBootUpTime"')
+DEFAULT_TIMEOUT = 1200
+RECORD_TIMEOUT = 300
+# Every poll runs a command on the instance, the interval between
+# them doubles up to the maximum.
+POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 16
+
+
+class RebootTracker(object):
+    """Follow an instance through a reboot.
+
+    The time of the last boot is used as a boot id. It is recorded
+    before triggering the reboot, then the tracker confirms that the
+    instance went down, by not being reachable anymore or by having
+    a new boot id already, and that it came back, with a new boot id.
+    The polls are spaced out more and more, starting from
+    :data:`POLL_INTERVAL`.
+
+    :param remote_client:
+        A :class:`argus.client.windows.WinRemoteClient` connected to
+        the instance.
+    """
+
+    def __init__(self, remote_client):
+        self._remote_client = remote_client
+        self._boot_id = None
+
+    def boot_id(self):
+        """Get the current boot id of the instance, None if unreachable."""
+        try:
+            stdout, _, _ = self._remote_client.run_command(BOOT_ID_CMD)
+        except Exception as exc:
+            LOG.debug("Can't get the boot id: %r", exc)
+            self._remote_client.mark_not_ready()
+            return None
+        return stdout.strip() or None
+
+    def record(self, timeout=RECORD_TIMEOUT):
+        """Record the boot id, before rebooting the instance.
+
+        Without it, any boot id would pass for a new one, so this
+        fails if it can't be read in *timeout* seconds.
+        """
+        deadline = time.time() + timeout
+        interval = POLL_INTERVAL
+        while True:
+            self._boot_id = self.boot_id()
+            if self._boot_id is not None:
+                LOG.debug("Recorded boot id %r", self._boot_id)
+                return
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise exceptions.ArgusTimeoutError(
+                    "Can't get the boot id of the instance before "
+                    "rebooting it.")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def _rebooted(self, boot_id):
+        return boot_id is not None and boot_id != self._boot_id
+
+    def wait_down(self, timeout=DEFAULT_TIMEOUT):
+        """Wait until the instance is confirmed to be going down.
+
+        Return True if the down transition was observed in time.
+        """
+        deadline = time.time() + timeout
+        interval = POLL_INTERVAL
+        while time.time() < deadline:
+            if not self._remote_client.is_reachable():
+                return True
+            boot_id = self.boot_id()
+            if boot_id is None or self._rebooted(boot_id):
+                # Either going down or already back, too quick to notice.
+                return True
+            time.sleep(min(interval, max(deadline - time.time(), 0)))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+        return False
+
+    def wait_up(self, timeout=DEFAULT_TIMEOUT):
+        """Wait until the instance is back, with a new boot id."""
+        deadline = time.time() + timeout
+        interval = POLL_INTERVAL
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise exceptions.ArgusTimeoutError(
+                    "The instance didn't come back after rebooting.")
+            if self._remote_client.wait_until_ready(remaining):
+                boot_id = self.boot_id()
+                if self._rebooted(boot_id):
+                    LOG.info("Instance rebooted, new boot id %r", boot_id)
+                    self._boot_id = boot_id
+                    return
+            time.sleep(min(interval, max(deadline - time.time(), 0)))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def wait(self, timeout=DEFAULT_TIMEOUT):
+        """Wait for the instance to go down and come back."""
+        deadline = time.time() + timeout
+        if not self.wait_down(timeout):
+            raise exceptions.ArgusTimeoutError(
+                "The instance didn't go down for rebooting.")
+        self.wait_up(max(deadline - time.time(), 0))
@@ -0,0 +1,344 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Record the OpenStack API calls of argus and replay them.
+
+When recording, the requests made by the clients of
+:class:`argus.backends.tempest.manager.APIManager` are written to a
+cassette, with their responses and their durations. When replaying,
+the same requests are answered from the cassette, without a cloud,
+either instantly or at the recorded speed. The backends built on the
+manager can then be run and profiled offline, the same way every time.
+"""
+
+import atexit
+import json
+import re
+import threading
+import time
+
+import six
+from six.moves import urllib_parse as urlparse
+
+from argus.backends.tempest import rest
+from argus import cache
+from argus import exceptions
+from argus import util
+
+
+__all__ = (
+    'Cassette',
+    'CassetteError',
+    'ReplayCredentialProvider',
+    'get_cassette',
+)
+
+LOG = util.get_logger()
+RECORD = 'record'
+REPLAY = 'replay'
+# The path segments which hold an id or a generated name.
+VARIABLE_SEGMENT = re.compile(r'[^/?&=]*\d[^/?&=]*')
+# The credentials fields which are never written to a cassette.
+SECRET_FIELDS = ('password', )
+
+
+class CassetteError(exceptions.ArgusError):
+    """The cassette doesn't have what was asked for."""
+
+
+def _request_path(url):
+    """Get the path of *url*, relative to its endpoint's host."""
+    parts = urlparse.urlsplit(url)
+    path = parts.path.lstrip('/')
+    if parts.query:
+        path += "?" + parts.query
+    return path
+
+
+def _same_path(recorded, requested):
+    """Check if two paths name the same resource.
+
+    The paths of the tempest clients contain the version of the
+    API and the tenant, while the ones of the native clients don't,
+    so one path can be a suffix of the other.
+    """
+    return (recorded == requested or
+            recorded.endswith('/' + requested) or
+            requested.endswith('/' + recorded))
+
+
+def _same_template(recorded, requested):
+    """Check if two paths differ only by their ids and generated names."""
+    return _same_path(VARIABLE_SEGMENT.sub('*', recorded),
+                      VARIABLE_SEGMENT.sub('*', requested))
+
+
+def _decode(content):
+    if isinstance(content, six.binary_type):
+        return content.decode('utf-8', 'replace')
+    return content
+
+
+class Cassette(object):
+    """The API calls of a run, persisted as a JSON file.
+
+    :param path:
+        The location of the cassette. The calls recorded by every
+        argus process using the same cassette are appended to it.
+    :param mode:
+        Either ``record`` or ``replay``.
+    :param speed:
+        When replaying, how many times faster than recorded the
+        responses are given, 0 for giving them instantly.
+    """
+
+    def __init__(self, path, mode=RECORD, speed=0):
+        if mode not in (RECORD, REPLAY):
+            raise exceptions.ArgusError(
+                "Unknown cassette mode {!r}".format(mode))
+        self._file = cache.FileCache(path)
+        self._mode = mode
+        self._speed = speed
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._credentials = []
+        self._interactions = []
+        # The calls of the credentials providers, which use their own
+        # admin clients: the extra network resources and the cleanup.
+        self._provider_calls = []
+        # The last interaction given for a request, which is given
+        # again when the cassette runs out of them, as for polling.
+        self._last = {}
+        if mode == REPLAY:
+            data = self._file.load()
+            if not data:
+                raise CassetteError("Cassette {} is empty".format(path))
+            self._credentials = data['credentials']
+            self._interactions = data['interactions']
+            self._provider_calls = data.get('provider_calls', [])
+        self._pending = list(range(len(self._interactions)))
+
+    @property
+    def path(self):
+        return self._file.path
+
+    @property
+    def replaying(self):
+        return self._mode == REPLAY
+
+    def record_credentials(self, credentials):
+        """Remember the primary credentials of a manager.
+
+        They are handed out again by :meth:`replay_credentials`,
+        without their secrets.
+        """
+        fields = {field: getattr(credentials, field, None)
+                  for field in rest.Credentials.FIELDS
+                  if field not in SECRET_FIELDS}
+        with self._lock:
+            self._credentials.append(fields)
+
+    def replay_credentials(self):
+        """Get the next recorded credentials, as :class:`rest.Credentials`."""
+        with self._lock:
+            if not self._credentials:
+                raise CassetteError(
+                    "No more credentials in {}".format(self.path))
+            fields = self._credentials.pop(0)
+        return rest.get_credentials(**fields)
+
+    def wrap_provider(self, provider):
+        """Record the admin calls of a dynamic credentials provider.
+
+        The network resources made by ``_create_network_resources``
+        are recorded, together with how long their creation and
+        the final ``clear_creds`` took, so a
+        :class:`ReplayCredentialProvider` can give them back.
+        """
+        if self.replaying:
+            return
+        for name in ('_create_network_resources', 'clear_creds'):
+            method = getattr(provider, name, None)
+            if method is not None:
+                setattr(provider, name, self._recorded_call(name, method))
+
+    def _recorded_call(self, name, method):
+        def recorded(*args, **kwargs):
+            started = time.time()
+            result = method(*args, **kwargs)
+            call = {
+                'call': name,
+                'result': list(result) if result is not None else None,
+                'offset': started - self._start,
+                'duration': time.time() - started,
+            }
+            with self._lock:
+                self._provider_calls.append(call)
+            return result
+
+        return recorded
+
+    def replay_provider_call(self, name):
+        """Get the result of the next recorded provider call *name*."""
+        with self._lock:
+            for index, call in enumerate(self._provider_calls):
+                if call['call'] == name:
+                    del self._provider_calls[index]
+                    break
+            else:
+                raise CassetteError("No recorded {} in {}".format(
+                    name, self.path))
+        if self._speed:
+            time.sleep(call['duration'] / self._speed)
+        return call['result']
+
+    def _record(self, endpoint, method, url, body, resp, content,
+                started, duration):
+        if isinstance(body, six.string_types + (six.binary_type, )):
+            body = _decode(body)
+            try:
+                body = json.loads(body)
+            except ValueError:
+                pass
+        interaction = {
+            'endpoint': endpoint,
+            'method': method,
+            'path': _request_path(url),
+            'body': body,
+            'status': resp.status,
+            'headers': {name: value for name, value in resp.items()
+                        if name != 'status'},
+            'content': _decode(content),
+            'offset': started - self._start,
+            'duration': duration,
+        }
+        with self._lock:
+            self._interactions.append(interaction)
+
+    def _find(self, endpoint, method, url):
+        """Find the recorded answer of a request.
+
+        The pending interactions are searched in their recorded order,
+        first for the same path and then for a path which differs only
+        by its ids and generated names.
+        """
+        path = _request_path(url)
+        key = (endpoint, method, VARIABLE_SEGMENT.sub('*', path))
+        with self._lock:
+            candidates = [
+                index for index in self._pending
+                if (self._interactions[index]['endpoint'],
+                    self._interactions[index]['method']) == (endpoint, method)]
+            for matches in (_same_path, _same_template):
+                for index in candidates:
+                    if matches(self._interactions[index]['path'], path):
+                        self._pending.remove(index)
+                        self._last[key] = index
+                        return self._interactions[index]
+            index = self._last.get(key)
+        if index is None:
+            raise CassetteError("No recorded answer for {} {} {}".format(
+                endpoint, method, path))
+        return self._interactions[index]
+
+    def _replay(self, endpoint, method, url):
+        interaction = self._find(endpoint, method, url)
+        if self._speed:
+            time.sleep(interaction['duration'] / self._speed)
+        resp = rest.Response(interaction['status'], interaction['headers'])
+        return resp, interaction['content'].encode('utf-8')
+
+    def wrap(self, client):
+        """Record or replay all the requests made by a REST client."""
+        endpoint = getattr(client, 'service', None) or type(client).__name__
+        raw_request = client.raw_request
+
+        if self.replaying:
+            # pylint: disable=unused-argument
+            def replayed(url, method, headers=None, body=None, **kwargs):
+                return self._replay(endpoint, method, url)
+
+            client.raw_request = replayed
+            return
+
+        def recorded(url, method, headers=None, body=None, **kwargs):
+            started = time.time()
+            resp, content = raw_request(url, method, headers=headers,
+                                        body=body, **kwargs)
+            self._record(endpoint, method, url, body, resp, content,
+                         started, time.time() - started)
+            return resp, content
+
+        client.raw_request = recorded
+
+    def save(self):
+        """Append the calls recorded so far to the cassette."""
+        if self.replaying:
+            return
+        with self._lock:
+            credentials, self._credentials = self._credentials, []
+            interactions, self._interactions = self._interactions, []
+            provider_calls, self._provider_calls = self._provider_calls, []
+        if not (credentials or interactions or provider_calls):
+            return
+        with self._file.transaction() as data:
+            data.setdefault('credentials', []).extend(credentials)
+            data.setdefault('interactions', []).extend(interactions)
+            data.setdefault('provider_calls', []).extend(provider_calls)
+        LOG.info("Recorded %d API calls to %s", len(interactions), self.path)
+
+
+class ReplayCredentialProvider(object):
+    """A credentials provider answering from a cassette.
+
+    It stands for the dynamic credentials provider of the recorded
+    run, with the recorded primary credentials and network resources.
+
+    :param cassette:
+        The replayed :class:`Cassette`.
+    """
+
+    def __init__(self, cassette):
+        self._cassette = cassette
+        self._creds = {'primary': cassette.replay_credentials()}
+
+    def get_primary_creds(self):
+        return self._creds['primary']
+
+    def _create_network_resources(self, tenant_id):
+        # pylint: disable=unused-argument
+        network, subnet, router = self._cassette.replay_provider_call(
+            '_create_network_resources')
+        return network, subnet, router
+
+    def clear_creds(self):
+        self._creds = {}
+        try:
+            self._cassette.replay_provider_call('clear_creds')
+        except CassetteError:
+            # The recorded run didn't get to clean up its credentials.
+            pass
+
+
+@util.run_once
+def get_cassette(conf):
+    """Get the cassette of this process, if one is configured."""
+    if not conf.argus.api_cassette:
+        return None
+    cassette = Cassette(conf.argus.api_cassette,
+                        conf.argus.api_cassette_mode,
+                        conf.argus.api_replay_speed)
+    atexit.register(cassette.save)
+    return cassette
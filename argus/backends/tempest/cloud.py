@@ -17,11 +17,6 @@ from argus.backends.tempest import tempest_backend
 from argus import exceptions
 from argus import util
 
-with util.restore_excepthook():
-    from tempest.common import dynamic_creds
-    from tempest.common import waiters
-
-
 SUBNET6_CIDR = "::ffff:a00:0/120"
 DNSES6 = ["::ffff:808:808", "::ffff:808:404"]
 
@@ -33,6 +28,10 @@ class NetworkWindowsBackend(tempest_backend.BaseWindowsTempestBackend):
     bound explicitly with the new created instance.
     """
 
+    # The additional network belongs to the tenant of each backend.
+    rebuildable = False
+    batchable = False
+
     def _get_isolated_network(self):
         """Returns the network itself from the isolated network resources.
 
@@ -112,8 +111,10 @@ class NetworkWindowsBackend(tempest_backend.BaseWindowsTempestBackend):
         # Just like a normal preparer, but this time
         # with explicitly specified attached networks.
 
-        if not isinstance(self._manager.isolated_creds,
-                          dynamic_creds.DynamicCredentialProvider):
+        # Only the dynamic credentials come with network resources,
+        # whether they are tempest's or the native ones.
+        if not hasattr(self._acquire_manager().isolated_creds,
+                       '_create_network_resources'):
             raise exceptions.ArgusError(
                 "Network resources are not available."
             )
@@ -123,23 +124,40 @@ class NetworkWindowsBackend(tempest_backend.BaseWindowsTempestBackend):
 
         super(NetworkWindowsBackend, self).setup_instance()
 
-    @staticmethod
-    def _find_ip_address(port, subnet_id):
-        for fixed_ip in port["fixed_ips"]:
-            if fixed_ip["subnet_id"] == subnet_id:
-                return fixed_ip["ip_address"]
+    def _index_addresses(self):
+        """Map the subnets of the instance's ports to (port, address) pairs."""
+        ports = self._manager.network_client.list_ports(
+            device_id=self.internal_instance_id())["ports"]
+        addresses = {}
+        for port in ports:
+            for fixed_ip in port["fixed_ips"]:
+                addresses.setdefault(fixed_ip["subnet_id"],
+                                     (port, fixed_ip["ip_address"]))
+        return addresses
 
     def get_network_interfaces(self):
-        """Retrieve and parse network details from the compute node."""
-        networks_client = self._manager.networks_client
-        network_client = self._manager.network_client
+        """Retrieve and parse network details from the compute node.
+
+        The networks, their subnets and the instance's ports are
+        fetched once, with filters, then indexed by their ids.
+        """
+        network_ids = [network["uuid"] for network in self._networks or []]
+        if not network_ids:
+            return []
+
+        networks = self._manager.networks_client.list_networks(
+            id=network_ids)["networks"]
+        networks = {network["id"]: network for network in networks}
+        subnets = self._manager.network_client.list_subnets(
+            network_id=network_ids)["subnets"]
+        subnets = {subnet["id"]: subnet for subnet in subnets}
+        addresses = self._index_addresses()
+
         guest_nics = []
-        for network in self._networks or []:
-            network_id = network["uuid"]
-            net_details = networks_client.show_network(network_id)["network"]
+        for network_id in network_ids:
             nic = dict.fromkeys(util.NETWORK_KEYS)
-            for subnet_id in net_details["subnets"]:
-                details = network_client.show_subnet(subnet_id)["subnet"]
+            for subnet_id in networks[network_id]["subnets"]:
+                details = subnets[subnet_id]
 
                 # The network interface should follow the format found under
                 # `windows.InstanceIntrospection.get_network_interfaces`
@@ -153,22 +171,12 @@ class NetworkWindowsBackend(tempest_backend.BaseWindowsTempestBackend):
                     details["cidr"].split("/")[1] if v6switch
                     else util.cidr2netmask(details["cidr"]))
 
-                # Find rest of the details under the ports using this subnet.
-                # There should be no conflicts because on the current
-                # architecture every instance is using its own router,
-                # subnet and network accessible only to it.
-                ports = network_client.list_ports()["ports"]
-                for port in ports:
-                    # Select instance related ports only, with the
-                    # corresponding subnet ID.
-                    if "compute" not in port["device_owner"]:
-                        continue
-                    ip_address = self._find_ip_address(port, subnet_id)
-                    if not ip_address:
-                        continue
+                # The rest of the details come from the instance's
+                # port using this subnet.
+                if subnet_id in addresses:
+                    port, ip_address = addresses[subnet_id]
                     nic["mac"] = port["mac_address"].upper()
                     nic["address" + v6suffix] = ip_address
-                    break
 
             guest_nics.append(nic)
         return guest_nics
@@ -184,14 +192,10 @@ class RescueWindowsBackend(tempest_backend.BaseWindowsTempestBackend):
             self.internal_instance_id(),
             adminPass=admin_pass)
 
-        waiters.wait_for_server_status(
-            self._manager.servers_client,
-            self.internal_instance_id(), 'RESCUE')
+        self._manager.wait_for_server(self.internal_instance_id(), 'RESCUE')
 
     def unrescue_server(self):
         """Unrescue the underlying instance."""
         self._manager.servers_client.unrescue_server(
             self.internal_instance_id())
-        waiters.wait_for_server_status(
-            self._manager.servers_client,
-            self.internal_instance_id(), 'ACTIVE')
+        self._manager.wait_for_server(self.internal_instance_id(), 'ACTIVE')
@@ -0,0 +1,181 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Reuse the floating IPs, the security group and the keypairs of a tenant.
+
+These resources belong to a tenant, so they are pooled together
+with it, by :class:`argus.backends.tempest.tenants.TenantPool`.
+The private keys of the pooled keypairs are kept only in memory.
+"""
+
+import threading
+
+from argus import util
+
+
+__all__ = (
+    'EdgePool',
+)
+
+LOG = util.get_logger()
+
+
+class EdgePool(object):
+    """The network edge resources of a tenant, kept between scenarios.
+
+    Every resource is checked before being leased again and the
+    unhealthy ones are replaced with new ones.
+
+    :param manager:
+        The :class:`argus.backends.tempest.manager.APIManager`
+        of the tenant owning the resources.
+    :param max_size:
+        How many idle floating IPs, respectively keypairs, are kept.
+        The ones released over this limit are deleted.
+    """
+
+    def __init__(self, manager, max_size):
+        self._manager = manager
+        self._max_size = max_size
+        self._idle_floating_ips = []
+        self._idle_keypairs = []
+        self._leased_floating_ips = {}
+        self._leased_keypairs = {}
+        self._security_group = None
+        self._lock = threading.Lock()
+
+    def _floating_ip_healthy(self, floating_ip):
+        try:
+            current = self._manager.floating_ips_client.show_floating_ip(
+                floating_ip['id'])['floating_ip']
+        except Exception as exc:
+            LOG.debug("Floating IP %s is unusable: %r",
+                      floating_ip['ip'], exc)
+            return False
+        return current.get('instance_id') is None
+
+    def _keypair_healthy(self, keypair):
+        try:
+            self._manager.keypairs_client.show_keypair(keypair.name)
+        except Exception as exc:
+            LOG.debug("Keypair %s is unusable: %r", keypair.name, exc)
+            return False
+        return True
+
+    def _security_group_healthy(self, rules_count):
+        client = self._manager.security_groups_client
+        try:
+            group = client.show_security_group(
+                self._security_group['id'])['security_group']
+        except Exception as exc:
+            LOG.debug("Security group %s is unusable: %r",
+                      self._security_group['name'], exc)
+            return False
+        return len(group['rules']) >= rules_count
+
+    def _pop_healthy(self, idle, healthy):
+        while True:
+            with self._lock:
+                if not idle:
+                    return None
+                resource = idle.pop(0)
+            if healthy(resource):
+                return resource
+
+    def lease_floating_ip(self):
+        floating_ip = self._pop_healthy(self._idle_floating_ips,
+                                        self._floating_ip_healthy)
+        if floating_ip is None:
+            floating_ip = self._manager.floating_ips_client.\
+                create_floating_ip()['floating_ip']
+        with self._lock:
+            self._leased_floating_ips[floating_ip['id']] = floating_ip
+        return floating_ip
+
+    def release_floating_ip(self, floating_ip_id):
+        with self._lock:
+            floating_ip = self._leased_floating_ips.pop(floating_ip_id)
+            if len(self._idle_floating_ips) < self._max_size:
+                self._idle_floating_ips.append(floating_ip)
+                return
+        self._manager.floating_ips_client.delete_floating_ip(floating_ip_id)
+
+    def lease_keypair(self, name):
+        keypair = self._pop_healthy(self._idle_keypairs,
+                                    self._keypair_healthy)
+        if keypair is None:
+            # The keypairs have to be unique inside a tenant.
+            keypair = self._manager.create_keypair(util.rand_name(name))
+        with self._lock:
+            self._leased_keypairs[keypair.name] = keypair
+        return keypair
+
+    def release_keypair(self, name):
+        with self._lock:
+            keypair = self._leased_keypairs.pop(name, None)
+            if keypair is None:
+                # Shared by the instances booted together.
+                return
+            if len(self._idle_keypairs) < self._max_size:
+                self._idle_keypairs.append(keypair)
+                return
+        keypair.destroy()
+
+    def security_group(self, create, rules_count):
+        """Get the security group shared by the instances of the tenant.
+
+        :param create:
+            A callable which creates the security group, with its rules.
+        :param rules_count:
+            How many rules the security group should have.
+        """
+        with self._lock:
+            if (self._security_group is None or
+                    not self._security_group_healthy(rules_count)):
+                if self._security_group is not None:
+                    self._delete_security_group()
+                self._security_group = create()
+            return self._security_group
+
+    def _delete_security_group(self):
+        try:
+            self._manager.security_groups_client.delete_security_group(
+                self._security_group['id'])
+        except Exception as exc:
+            LOG.warning("Deleting security group %s failed: %r",
+                        self._security_group['name'], exc)
+        self._security_group = None
+
+    def clear(self):
+        """Delete the idle resources and the security group."""
+        with self._lock:
+            floating_ips, self._idle_floating_ips = self._idle_floating_ips, []
+            keypairs, self._idle_keypairs = self._idle_keypairs, []
+        for floating_ip in floating_ips:
+            try:
+                self._manager.floating_ips_client.delete_floating_ip(
+                    floating_ip['id'])
+            except Exception as exc:
+                LOG.warning("Deleting floating IP %s failed: %r",
+                            floating_ip['ip'], exc)
+        for keypair in keypairs:
+            try:
+                keypair.destroy()
+            except Exception as exc:
+                LOG.warning("Deleting keypair %s failed: %r",
+                            keypair.name, exc)
+        with self._lock:
+            if self._security_group is not None:
+                self._delete_security_group()
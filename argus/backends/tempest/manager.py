@@ -14,21 +14,50 @@
 #    under the License.
 
 import contextlib
+import functools
 import os
 import tempfile
-
+import threading
+import time
+
+from argus.backends.tempest import cassette
+from argus.backends.tempest import rest
+from argus.backends.tempest import throttle
+from argus.backends.tempest import waiter
+from argus import cache
+from argus import exceptions
+from argus import identity
 from argus import util
 
-with util.restore_excepthook():
-    from tempest import clients
-    from tempest.common import credentials
-    from tempest.common import waiters
-
 
+NATIVE_CLIENT = 'native'
 OUTPUT_STATUS_OK = 200
 OUTPUT_SIZE = 128
 OUTPUT_EPSILON = int(OUTPUT_SIZE / 10)
+# How many of the last seen lines are used for finding
+# where the new console output starts.
+ANCHOR_LINES = 8
+# The clients whose calls go through the throttle, when it's enabled.
+THROTTLED_CLIENTS = (
+    'flavors_client', 'floating_ips_client', 'image_client',
+    'images_client', 'keypairs_client', 'availability_zone_client',
+    'security_groups_client', 'security_group_rules_client',
+    'servers_client', 'volumes_client', 'snapshots_client',
+    'interface_client', 'network_client', 'networks_client',
+    'orchestration_client',
+)
+IMAGE_TIMEOUT = 1800
+IMAGE_POLL_INTERVAL = 5
+# The file where the images and the flavors are cached.
+LOOKUPS_FILE = "lookups.json"
 LOG = util.get_logger()
+# The attributes which identify a set of credentials.
+CREDENTIALS_FIELDS = (
+    'username', 'password', 'user_id',
+    'tenant_name', 'tenant_id',
+    'project_name', 'project_id',
+    'user_domain_name', 'project_domain_name', 'domain_name',
+)
 
 
 @contextlib.contextmanager
@@ -42,14 +71,87 @@ def _create_tempfile(content):
         os.remove(path)
 
 
-class APIManager(object):
-    """Manager which uses tempest modules for interacting with the OpenStack API."""
+def dump_credentials(creds):
+    """Get the given credentials as a dictionary, e.g. for persisting them."""
+    return {field: getattr(creds, field) for field in CREDENTIALS_FIELDS
+            if getattr(creds, field, None) is not None}
+
+
+def _import_tempest():
+    """Import the tempest modules, only when they are used."""
+    # pylint: disable=import-error
+    with util.restore_excepthook():
+        from tempest import clients
+        from tempest.common import credentials
+    return clients, credentials
+
+
+@util.run_once
+def _get_lookup_cache(conf):
+    if not conf.argus.lookup_cache_ttl:
+        return None
+    return cache.ExpiringCache(cache.get_cache_path(conf, LOOKUPS_FILE))
+
+
+def _share_auth(auth_provider, token_cache, creds):
+    """Use the cached token of *creds* and cache the new ones."""
+    # pylint: disable=protected-access
+    key = identity.cache_key('tempest', auth_provider.auth_url,
+                             dump_credentials(creds))
+    cached = token_cache.get(key)
+    if cached is not None:
+        auth_provider.cache = tuple(cached)
+
+    get_auth = auth_provider._get_auth
+
+    def _get_auth():
+        auth = get_auth()
+        auth_data = auth[1]
+        expires = (auth_data.get('expires_at') or
+                   auth_data['token']['expires'])
+        token_cache.set(key, list(auth), identity.parse_expiry(expires))
+        return auth
+
+    auth_provider._get_auth = _get_auth
 
-    def __init__(self):
-        self.isolated_creds = credentials.get_credentials_provider(
-            self.__class__.__name__, network_resources={})
-        primary_credentials = self.primary_credentials()
-        self._manager = clients.Manager(credentials=primary_credentials)
+
+class APIManager(object):
+    """Manager which uses tempest modules for interacting with the OpenStack API.
+
+    When the *api_client* option is ``native``, the lean clients from
+    :mod:`argus.backends.tempest.rest` are used instead of tempest.
+    They are used as well when replaying an *api_cassette*, in which
+    case the credentials and their network resources are the recorded
+    ones, given by a
+    :class:`argus.backends.tempest.cassette.ReplayCredentialProvider`.
+
+    :param static_credentials:
+        A dictionary, as returned by :func:`dump_credentials`, with
+        the credentials to be used. By default, a new tenant with
+        its own credentials is created for each manager.
+    :param owner:
+        An object with a ``release`` method, such as
+        :class:`argus.backends.tempest.tenants.TenantPool`, which
+        takes back the credentials instead of them being deleted
+        by :meth:`cleanup_credentials`.
+    """
+
+    edge = None
+    """The :class:`argus.backends.tempest.edge.EdgePool` of the tenant, if any."""
+
+    def __init__(self, static_credentials=None, owner=None):
+        conf = util.get_config()
+        self._owner = owner
+        self._users = 1
+        self._users_lock = threading.Lock()
+        token_cache = identity.get_token_cache(conf)
+        self._cassette = cassette.get_cassette(conf)
+        if self._cassette is not None and self._cassette.replaying:
+            self._init_replay()
+        elif conf.argus.api_client == NATIVE_CLIENT:
+            self._init_native(static_credentials, token_cache)
+        else:
+            self._init_tempest(static_credentials, token_cache)
 
         # Underlying clients.
         self.flavors_client = self._manager.flavors_client
@@ -80,12 +182,176 @@ class APIManager(object):
         # Heat client
         self.orchestration_client = self._manager.orchestration_client
 
+        self._console_logs = {}
+        self._console_logs_lock = threading.Lock()
+        # The lookups of a cassette's run have to be made every time,
+        # otherwise replaying it depends on what was cached.
+        self._lookups = (_get_lookup_cache(conf)
+                         if self._cassette is None else None)
+        self._lookup_ttl = conf.argus.lookup_cache_ttl
+        self._servers = {}
+        self._servers_lock = threading.Lock()
+
+        replaying = self._cassette is not None and self._cassette.replaying
+        if self._cassette is not None:
+            if not replaying:
+                self._cassette.record_credentials(self.primary_credentials())
+                if self.isolated_creds is not None:
+                    self._cassette.wrap_provider(self.isolated_creds)
+            self._wrap_clients(self._cassette)
+        throttler = throttle.get_throttle(conf)
+        if throttler is not None and not replaying:
+            self._wrap_clients(throttler)
+
+        # All the waits for the servers of this tenant go through it.
+        self.server_waiter = waiter.ServerWaiter(self.servers_client)
+
+    def _init_tempest(self, static_credentials, token_cache):
+        clients, credentials = _import_tempest()
+        if static_credentials is None:
+            self.isolated_creds = credentials.get_credentials_provider(
+                self.__class__.__name__, network_resources={})
+            self._static_credentials = None
+        else:
+            self.isolated_creds = None
+            self._static_credentials = credentials.get_credentials(
+                **static_credentials)
+        primary_credentials = self.primary_credentials()
+        self._manager = clients.Manager(credentials=primary_credentials)
+        self._auth_url = self._manager.auth_provider.auth_url
+        if token_cache is not None:
+            _share_auth(self._manager.auth_provider, token_cache,
+                        primary_credentials)
+
+    def _init_native(self, static_credentials, token_cache):
+        if static_credentials is None:
+            self.isolated_creds = rest.get_credentials_provider(
+                self.__class__.__name__, token_cache=token_cache)
+            self._static_credentials = None
+        else:
+            self.isolated_creds = None
+            self._static_credentials = rest.get_credentials(
+                **static_credentials)
+        self._manager = rest.Manager(self.primary_credentials(),
+                                     token_cache)
+        self._auth_url = self._manager.auth_url
+
+    def _init_replay(self):
+        self.isolated_creds = cassette.ReplayCredentialProvider(
+            self._cassette)
+        self._static_credentials = None
+        self._manager = rest.Manager(self.primary_credentials(),
+                                     offline=True)
+        self._auth_url = self._manager.auth_url
+
+    def _wrap_clients(self, wrapper):
+        """Pass the requests of the clients through *wrapper*."""
+        for name in THROTTLED_CLIENTS:
+            client = getattr(self, name)
+            if client is not None:
+                wrapper.wrap(client)
+
+    def lease(self):
+        """Start using the manager again, with a single user.
+
+        Called by the owner of the manager when handing it out.
+        """
+        with self._users_lock:
+            self._users = 1
+        return self
+
+    def share(self):
+        """Let one more user, such as a backend, use this manager.
+
+        The credentials are cleaned up only when
+        :meth:`cleanup_credentials` is called by every user.
+        """
+        with self._users_lock:
+            self._users += 1
+        return self
+
     def cleanup_credentials(self):
-        """Cleanup any credentials created during the initialization."""
+        """Cleanup any credentials created during the initialization.
+
+        If the credentials have an owner, they are given back to it.
+        """
+        with self._users_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+        if self._owner is not None:
+            self._owner.release(self)
+            return
+        self.clear_credentials()
+
+    def clear_credentials(self):
+        """Delete the credentials created during the initialization."""
+        if self.isolated_creds is None:
+            # Nothing was created by us.
+            return
         self.isolated_creds.clear_creds()
 
+    def tenant_resources(self):
+        """Get the ids of the tenant, its user and its network resources.
+
+        They are persisted by :mod:`argus.backends.tempest.reaper`, for
+        deleting them from another process, with the admin clients.
+        Return None if the credentials weren't created by this manager.
+        """
+        if self.isolated_creds is None:
+            return None
+        creds = self.primary_credentials()
+        networks = []
+        # pylint: disable=protected-access
+        for item in self.isolated_creds._creds.values():
+            ids = [(getattr(item, kind, None) or {}).get('id')
+                   for kind in ('network', 'subnet', 'router')]
+            if any(ids):
+                networks.append(ids)
+        return {'tenant_id': creds.tenant_id,
+                'user_id': getattr(creds, 'user_id', None),
+                'networks': networks}
+
+    @staticmethod
+    def delete_tenant(resources):
+        """Delete a tenant created by another manager, given its ids.
+
+        The resources are deleted with the admin credentials of the
+        configured *api_client*: the ones of the environment for the
+        native clients and the ones of tempest's configuration for
+        tempest, whose provider is given the resources to forget.
+
+        :param resources:
+            A dictionary as given by :meth:`tenant_resources`.
+        """
+        if util.get_config().argus.api_client == NATIVE_CLIENT:
+            rest.get_credentials_provider('reaper').delete_tenant(resources)
+            return
+
+        _, credentials = _import_tempest()
+        provider = credentials.get_credentials_provider(
+            'reaper', network_resources={})
+        fields = ("network", "subnet", "router",
+                  "user_id", "tenant_id", "username", "tenant_name")
+        networks = [[{'id': item} if item else None for item in ids]
+                    for ids in resources['networks']] or [[None] * 3]
+        # The tenant and the user are given with its first network,
+        # the other networks as extra credentials, as NetworkWindowsBackend
+        # does for its private network.
+        # pylint: disable=protected-access
+        provider._creds['primary'] = util.get_namedtuple(
+            "TenantCreds", fields,
+            networks[0] + [resources['user_id'], resources['tenant_id'],
+                           None, None])
+        for index, network in enumerate(networks[1:]):
+            provider._creds["network-{}".format(index)] = util.get_namedtuple(
+                "TenantCreds", fields, network + [None] * 4)
+        provider.clear_creds()
+
     def primary_credentials(self):
         """Get the underlying :class:`tempest.common.isolated_creds.IsolatedCreds`."""
+        if self.isolated_creds is None:
+            return self._static_credentials
         return self.isolated_creds.get_primary_creds()
 
     def create_keypair(self, name):
@@ -107,9 +373,78 @@ class APIManager(object):
         """Reboot the instance with the given id."""
         self.servers_client.reboot_server(
             server_id=instance_id, reboot_type='soft')
-        waiters.wait_for_server_status(
-            self.servers_client,
-            instance_id, 'ACTIVE')
+        self.wait_for_server(instance_id, 'ACTIVE')
+
+    def wait_for_server(self, instance_id, status='ACTIVE'):
+        """Wait for the given instance to reach *status*.
+
+        Use :data:`argus.backends.tempest.waiter.DELETED` for waiting
+        until the instance is gone, after which the instance is
+        forgotten, see :meth:`forget_instance`. Every action changing
+        the state of an instance waits for it through this method,
+        which drops the details cached by :meth:`instance_server`.
+        """
+        try:
+            return self.server_waiter.wait(instance_id, status)
+        finally:
+            if status == waiter.DELETED:
+                self.forget_instance(instance_id)
+            else:
+                self.invalidate_server(instance_id)
+
+    def wait_for_servers(self, server_ids, status='ACTIVE'):
+        """Wait for several servers to reach the given status."""
+        futures = [self.server_waiter.watch(server_id, status)
+                   for server_id in server_ids]
+        try:
+            return [future.result() for future in futures]
+        finally:
+            for server_id in server_ids:
+                self.invalidate_server(server_id)
+
+    def rebuild_instance(self, instance_id, image_ref, **kwargs):
+        """Rebuild the instance from the given image.
+
+        The instance keeps its id, its ports and its floating IPs,
+        while its disk is created again. The keyword arguments, such
+        as *metadata*, are passed to the rebuild request. The console
+        output seen so far is forgotten, since it belongs to the
+        previous use of the instance.
+        """
+        self.forget_instance(instance_id)
+        self.servers_client.rebuild_server(instance_id, image_ref, **kwargs)
+        self.wait_for_server(instance_id, 'ACTIVE')
+
+    def create_snapshot(self, instance_id, name):
+        """Snapshot the given instance and wait for the image to be usable.
+
+        Return the id of the new image.
+        """
+        response = self.servers_client.create_image(instance_id, name=name)
+        image_id = response.get('image_id')
+        if not image_id:
+            # Older compute APIs are giving the image's location only.
+            image_id = response.response['location'].rsplit('/', 1)[-1]
+        self._wait_for_image(image_id)
+        return image_id
+
+    def _wait_for_image(self, image_id, timeout=IMAGE_TIMEOUT):
+        deadline = time.time() + timeout
+        while True:
+            status = self.images_client.show_image(image_id)['image']['status']
+            if status == 'ACTIVE':
+                return
+            if status == 'ERROR':
+                raise exceptions.ArgusError(
+                    "Image %s went into ERROR" % image_id)
+            if time.time() > deadline:
+                raise exceptions.ArgusTimeoutError(
+                    "Image %s isn't active yet" % image_id)
+            time.sleep(IMAGE_POLL_INTERVAL)
+
+    def delete_image(self, image_id):
+        """Delete the image with the given id."""
+        self.images_client.delete_image(image_id)
 
     def instance_password(self, instance_id, keypair):
         """Get the password posted by the given instance.
@@ -132,27 +467,200 @@ class APIManager(object):
         return self.servers_client.get_console_output(
             instance_id, limit)['output']
 
+    def _console_log(self, instance_id):
+        with self._console_logs_lock:
+            console_log = self._console_logs.get(instance_id)
+            if console_log is None:
+                console_log = self._console_logs[instance_id] = ConsoleLog(
+                    functools.partial(self._instance_output, instance_id))
+        return console_log
+
     def instance_output(self, instance_id, limit):
         """Get the console output, sent from the instance.
 
+        Only the output which wasn't seen yet is fetched,
+        see :class:`ConsoleLog`.
+
         :param instance_id:
             The id of the instance for which the output will
             be retrieved.
         :param limit:
             Number of lines to fetch from the end of console log.
         """
-        content = None
-        while True:
-            content = self._instance_output(instance_id, limit)
-            if len(content.splitlines()) >= (limit - OUTPUT_EPSILON):
-                limit *= 2
-            else:
-                break
-        return content
+        return self._console_log(instance_id).read(limit)
+
+    def instance_output_from(self, instance_id, offset, limit):
+        """Get the console output which follows *offset*.
+
+        Return the new complete lines of the output and the offset
+        of the next read, see :meth:`ConsoleLog.read_from`.
+        """
+        return self._console_log(instance_id).read_from(offset, limit)
 
     def instance_server(self, instance_id):
-        """Get more details about the given instance id."""
-        return self.servers_client.show_server(instance_id)['server']
+        """Get more details about the given instance id.
+
+        The details are kept until the instance changes its state,
+        see :meth:`invalidate_server`.
+        """
+        with self._servers_lock:
+            server = self._servers.get(instance_id)
+        if server is None:
+            server = self.servers_client.show_server(instance_id)['server']
+            with self._servers_lock:
+                self._servers[instance_id] = server
+        return server
+
+    def invalidate_server(self, instance_id):
+        """Forget the cached details of the given instance."""
+        with self._servers_lock:
+            self._servers.pop(instance_id, None)
+
+    def forget_instance(self, instance_id):
+        """Drop everything kept about an instance which is going away.
+
+        The file holding its console output is closed, which matters
+        for the managers living as long as the process, such as the
+        ones of the tenant pool.
+        """
+        self.invalidate_server(instance_id)
+        with self._console_logs_lock:
+            console_log = self._console_logs.pop(instance_id, None)
+        if console_log is not None:
+            console_log.close()
+
+    def _lookup(self, kind, resource_id, fetch):
+        """Get an immutable resource, through the lookup cache."""
+        if self._lookups is None:
+            return fetch()
+        key = "{} {} {}".format(self._auth_url, kind, resource_id)
+        value = self._lookups.get(key)
+        if value is None:
+            value = fetch()
+            self._lookups.set(key, value, time.time() + self._lookup_ttl)
+        return value
+
+    def show_image(self, image_id):
+        """Get the compute API's details about the given image."""
+        return self._lookup(
+            'image', image_id,
+            lambda: dict(self.images_client.show_image(image_id)))
+
+    def get_image_meta(self, image_id):
+        """Get the image service's metadata of the given image."""
+        return self._lookup(
+            'image_meta', image_id,
+            lambda: dict(self.image_client.get_image_meta(image_id)))
+
+    def show_flavor(self, flavor_id):
+        """Get the details about the given flavor."""
+        return self._lookup(
+            'flavor', flavor_id,
+            lambda: dict(self.flavors_client.show_flavor(flavor_id)))
+
+
+class ConsoleLog(object):
+    """The console output of an instance, fetched incrementally.
+
+    The tail of the console output is fetched and only the lines
+    following the last seen ones are appended to a local file,
+    which is used for serving the reads. The tail is extended only
+    when the last seen lines aren't part of it.
+
+    :param fetch:
+        A callable which receives a number of lines and returns
+        that many lines from the end of the console output.
+    """
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._file = tempfile.TemporaryFile()
+        self._anchor = []
+        self._partial = u''
+        # The size of the output dropped by the resets, which keeps
+        # the offsets given by read_from growing after a reset.
+        self._base = 0
+        self._lock = threading.Lock()
+
+    def _find_new(self, lines, complete):
+        """Get the index of the first new line or None if unknown.
+
+        The anchor is searched from the end, since the same lines
+        can show up several times in a console output.
+        """
+        if not self._anchor:
+            return 0 if complete else None
+        size = len(self._anchor)
+        for index in range(len(lines) - size, -1, -1):
+            if lines[index:index + size] == self._anchor:
+                return index + size
+        return None
+
+    def _reset(self):
+        LOG.debug("The console output was reset, starting over.")
+        self._file.seek(0, os.SEEK_END)
+        self._base += self._file.tell()
+        self._file.seek(0)
+        self._file.truncate()
+        self._anchor = []
+
+    def update(self, limit=OUTPUT_SIZE):
+        """Fetch the console output which wasn't seen yet."""
+        with self._lock:
+            while True:
+                content = self._fetch(limit)
+                if isinstance(content, bytes):
+                    content = content.decode('utf-8', 'replace')
+                lines = content.splitlines(True)
+                complete = len(lines) < limit - OUTPUT_EPSILON
+                start = self._find_new(lines, complete)
+                if start is not None:
+                    break
+                if complete:
+                    # Everything was fetched and there's no trace
+                    # of the seen lines, the log was started over.
+                    self._reset()
+                    start = 0
+                    break
+                limit *= 2
+
+            new = lines[start:]
+            # The last line can still grow, it's kept aside until
+            # it's complete and it shows up after the anchor.
+            self._partial = u''
+            if new and not new[-1].endswith('\n'):
+                self._partial = new.pop()
+            if new:
+                self._file.seek(0, os.SEEK_END)
+                self._file.write(u''.join(new).encode('utf-8'))
+                self._anchor = (self._anchor + new)[-ANCHOR_LINES:]
+
+    def read(self, limit=OUTPUT_SIZE):
+        """Update the console output and return all of it."""
+        self.update(limit)
+        with self._lock:
+            self._file.seek(0)
+            content = self._file.read().decode('utf-8')
+            return content + self._partial
+
+    def read_from(self, offset, limit=OUTPUT_SIZE):
+        """Update the console output and return what follows *offset*.
+
+        Only the complete lines are returned, together with the
+        offset where the next read should start. Pass 0 for reading
+        the output from the beginning. After a reset of the console
+        output, the reads continue from the start of the new output.
+        """
+        self.update(limit)
+        with self._lock:
+            self._file.seek(max(offset - self._base, 0))
+            content = self._file.read().decode('utf-8')
+            return content, self._base + self._file.tell()
+
+    def close(self):
+        """Delete the local copy of the console output."""
+        with self._lock:
+            self._file.close()
 
 
 class Keypair(object):
@@ -0,0 +1,323 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Background teardown of the resources created by the tempest backends.
+
+A backend describes what has to be destroyed through a
+:class:`Manifest`, a list of stages, each stage containing actions
+which don't depend on each other. The stages are run in order, while
+the actions of a stage are run in parallel. The manifests are
+persisted before anything is destroyed and every finished action is
+removed from the persisted copy, so the resources of a crashed argus
+process can be reclaimed by the next run.
+"""
+
+import atexit
+import errno
+import functools
+import os
+import threading
+import time
+import uuid
+
+import six
+
+from argus.backends.tempest import manager as api_manager
+from argus.backends.tempest import waiter
+from argus import cache
+from argus import util
+
+
+__all__ = (
+    'Manifest',
+    'Reaper',
+    'action',
+    'get_reaper',
+)
+
+LOG = util.get_logger()
+CACHE_FILE = "reaper.json"
+RETRY_COUNT = 5
+RETRY_DELAY = 2
+RECOVERY_ATTEMPTS = 5
+
+ACTIONS = {}
+
+
+def _register(name):
+    def decorator(func):
+        ACTIONS[name] = func
+        return func
+    return decorator
+
+
+@_register('delete_server')
+def _delete_server(manager, server_id):
+    manager.servers_client.delete_server(server_id)
+    manager.wait_for_server(server_id, waiter.DELETED)
+
+
+@_register('delete_keypair')
+def _delete_keypair(manager, name):
+    manager.keypairs_client.delete_keypair(name)
+
+
+@_register('delete_security_group')
+def _delete_security_group(manager, group_id):
+    manager.security_groups_client.delete_security_group(group_id)
+
+
+@_register('delete_floating_ip')
+def _delete_floating_ip(manager, floating_ip_id):
+    manager.floating_ips_client.delete_floating_ip(floating_ip_id)
+
+
+@_register('release_keypair')
+def _release_keypair(manager, name):
+    if manager.edge is None:
+        _delete_keypair(manager, name)
+    else:
+        manager.edge.release_keypair(name)
+
+
+@_register('release_floating_ip')
+def _release_floating_ip(manager, floating_ip_id):
+    if manager.edge is None:
+        _delete_floating_ip(manager, floating_ip_id)
+    else:
+        manager.edge.release_floating_ip(floating_ip_id)
+
+
+@_register('cleanup_credentials')
+def _cleanup_credentials(manager, resources=None):
+    if manager.isolated_creds is not None:
+        manager.cleanup_credentials()
+        return
+    if not resources:
+        # The credentials weren't created by argus.
+        return
+    # The manager was rebuilt from a manifest left by a dead process,
+    # so the tenant is deleted with the admin clients.
+    LOG.info("Deleting tenant %s of a dead process",
+             manager.primary_credentials().tenant_name)
+    manager.delete_tenant(resources)
+
+
+def action(name, *args):
+    """Describe the action *name*, which will be called with *args*."""
+    if name not in ACTIONS:
+        raise ValueError("Unknown action %r" % name)
+    return {'action': name, 'args': list(args)}
+
+
+def _is_not_found(exc):
+    # The location of the tempest exceptions differs between
+    # versions, but a resource which is already gone is fine.
+    return type(exc).__name__ == 'NotFound'
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno == errno.EPERM
+    return True
+
+
+class Manifest(object):
+    """The resources to be destroyed, grouped in dependency order.
+
+    :param credentials:
+        The credentials of the tenant owning the resources, as given
+        by :func:`argus.backends.tempest.manager.dump_credentials`.
+        They are persisted together with the manifest, in a file
+        readable only by its owner.
+    :param attempts:
+        How many times the manifest was recovered from dead processes.
+    """
+
+    def __init__(self, credentials, stages=None, manifest_id=None, pid=None,
+                 attempts=0):
+        self.id = manifest_id or uuid.uuid4().hex
+        self.credentials = credentials
+        self.stages = stages or []
+        self.pid = pid or os.getpid()
+        self.attempts = attempts
+
+    def add_stage(self, *actions):
+        """Add a stage with the given actions, skipping it if empty."""
+        actions = [item for item in actions if item]
+        if actions:
+            self.stages.append(actions)
+
+    def to_dict(self):
+        return {'credentials': self.credentials,
+                'stages': self.stages,
+                'pid': self.pid,
+                'attempts': self.attempts}
+
+    @classmethod
+    def from_dict(cls, manifest_id, data):
+        return cls(data['credentials'], data['stages'],
+                   manifest_id=manifest_id, pid=data['pid'],
+                   attempts=data.get('attempts', 0))
+
+
+class Reaper(object):
+    """Destroy the resources described by manifests, in the background.
+
+    :param path:
+        The file where the pending manifests are persisted.
+    :param workers:
+        How many manifests can be processed at the same time.
+    """
+
+    def __init__(self, path, workers=4, retry_count=RETRY_COUNT,
+                 retry_delay=RETRY_DELAY,
+                 recovery_attempts=RECOVERY_ATTEMPTS):
+        self._pending = cache.FileCache(path)
+        self._workers = workers
+        self._retry_count = retry_count
+        self._retry_delay = retry_delay
+        self._recovery_attempts = recovery_attempts
+        self._queue = six.moves.queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            manifest, manager = self._queue.get()
+            try:
+                self.reap(manifest, manager)
+            except Exception:
+                LOG.exception("Reaping manifest %s failed, it will be "
+                              "retried by the next run.", manifest.id)
+            finally:
+                self._queue.task_done()
+
+    def _persist(self, manifest):
+        self._pending.set(manifest.id, manifest.to_dict())
+
+    def _done(self, manifest, stage_index, item):
+        with self._pending.transaction() as pending:
+            entry = pending.get(manifest.id)
+            if entry is None:
+                return
+            stage = entry['stages'][stage_index]
+            if item in stage:
+                stage.remove(item)
+
+    def _run_action(self, manager, item):
+        func = ACTIONS[item['action']]
+        for attempt in range(1, self._retry_count + 1):
+            try:
+                func(manager, *item['args'])
+                return
+            except Exception as exc:
+                if _is_not_found(exc):
+                    LOG.debug("%s%r: already gone", item['action'],
+                              tuple(item['args']))
+                    return
+                if attempt == self._retry_count:
+                    raise
+                LOG.warning("%s%r failed with %r, retrying",
+                            item['action'], tuple(item['args']), exc)
+                time.sleep(self._retry_delay * 2 ** (attempt - 1))
+
+    def _run_stage(self, manifest, manager, stage_index):
+        def run(item):
+            self._run_action(manager, item)
+            self._done(manifest, stage_index, item)
+
+        util.run_concurrently(*[functools.partial(run, item)
+                                for item in manifest.stages[stage_index]])
+
+    def reap(self, manifest, manager=None):
+        """Destroy the resources of *manifest*, in the current thread.
+
+        :param manager:
+            The :class:`argus.backends.tempest.manager.APIManager`
+            which created the resources. A new one, using the
+            credentials from the manifest, is used if not given.
+        """
+        self._persist(manifest)
+        if manager is None:
+            manager = api_manager.APIManager(
+                static_credentials=manifest.credentials)
+        for stage_index in range(len(manifest.stages)):
+            # The next stages depend on this one, so a failure stops
+            # the reaping, keeping the manifest for a later run.
+            self._run_stage(manifest, manager, stage_index)
+        self._pending.pop(manifest.id)
+        LOG.debug("Manifest %s reaped.", manifest.id)
+
+    def submit(self, manifest, manager=None):
+        """Destroy the resources of *manifest* in the background."""
+        self._persist(manifest)
+        self._start()
+        self._queue.put((manifest, manager))
+
+    def recover(self):
+        """Resubmit the manifests left behind by dead argus processes.
+
+        A manifest which couldn't be reaped after being recovered
+        *recovery_attempts* times is dropped, logging its resources
+        for them to be deleted by hand.
+        """
+        for manifest_id, data in self._pending.load().items():
+            manifest = Manifest.from_dict(manifest_id, data)
+            if manifest.pid == os.getpid() or _is_alive(manifest.pid):
+                continue
+            if manifest.attempts >= self._recovery_attempts:
+                LOG.error("Dropping manifest %s of tenant %s, not reaped "
+                          "after %d attempts, with the stages %s",
+                          manifest_id,
+                          manifest.credentials.get('tenant_name'),
+                          manifest.attempts, manifest.stages)
+                self._pending.pop(manifest_id)
+                continue
+            LOG.info("Recovering manifest %s left by process %s",
+                     manifest_id, manifest.pid)
+            manifest.pid = os.getpid()
+            manifest.attempts += 1
+            self.submit(manifest)
+
+    def drain(self):
+        """Wait until all the submitted manifests are processed."""
+        if self._threads:
+            LOG.info("Waiting for the pending cleanups to finish...")
+        self._queue.join()
+
+
+@util.run_once
+def get_reaper(conf):
+    """Get the reaper of this process.
+
+    The manifests of dead processes are resubmitted and the reaper
+    is drained when the process exits.
+    """
+    reaper = Reaper(cache.get_cache_path(conf, CACHE_FILE),
+                    workers=conf.argus.reaper_workers)
+    reaper.recover()
+    atexit.register(reaper.drain)
+    return reaper
@@ -0,0 +1,633 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Thin clients for the OpenStack APIs used by argus.
+
+They cover only the calls made by
+:class:`argus.backends.tempest.manager.APIManager` and by the
+backends, with the names and the arguments of the tempest clients,
+so they can be used instead of tempest, which is expensive to
+import. The requests go through keystone sessions, which pool
+their HTTP connections.
+
+The admin credentials, used for creating the isolated tenants,
+are taken from the usual ``OS_*`` environment variables and they
+need the identity API v3.
+"""
+
+import json
+import os
+import random
+import threading
+import uuid
+
+from keystoneclient.v3 import client as keystone_client
+import six
+from six.moves import urllib_parse as urlparse
+
+from argus.backends import keystone
+from argus import exceptions
+from argus import util
+
+
+__all__ = (
+    'Credentials',
+    'DynamicCredentialProvider',
+    'Manager',
+    'NotFound',
+    'RestError',
+    'get_credentials',
+    'get_credentials_provider',
+)
+
+LOG = util.get_logger()
+# The tenant networks are /28 subnets of 10.100.0.0/16.
+SUBNETS_COUNT = 4096
+SUBNET_ATTEMPTS = 16
+MEMBER_ROLES = ('member', '_member_', 'Member')
+# The oldest compute API which can change the userdata on rebuilds.
+USER_DATA_REBUILD_VERSION = '2.57'
+
+
+class RestError(exceptions.ArgusError):
+    """An API request failed."""
+
+    def __init__(self, status, body):
+        super(RestError, self).__init__(
+            "Request failed with status %s: %s" % (status, body))
+        self.status = status
+        self.body = body
+
+
+class NotFound(RestError):
+    """The requested resource doesn't exist."""
+
+
+class Response(dict):
+    """The headers of a response, with lowercase names, and its status."""
+
+    def __init__(self, status, headers):
+        super(Response, self).__init__(
+            (name.lower(), value) for name, value in headers.items())
+        self.status = status
+
+
+class ResponseBody(dict):
+    """The decoded body of a response, which is kept as *response*."""
+
+    def __init__(self, response, body=None):
+        super(ResponseBody, self).__init__(body or {})
+        self.response = response
+
+
+class RestClient(object):
+    """Base class for the clients of an API.
+
+    :param session:
+        The keystone session used for the requests.
+    """
+
+    service = None
+    """The service type of the API, as found in the catalog."""
+
+    prefix = ''
+    """Prepended to the paths, for the unversioned endpoints."""
+
+    def __init__(self, session, interface='public', region=None):
+        self._session = session
+        self._endpoint_filter = {
+            'service_type': self.service,
+            'interface': interface,
+            'region_name': region,
+        }
+
+    def raw_request(self, url, method, headers=None, body=None):
+        """Make a request, returning its :class:`Response` and its content.
+
+        Every request goes through this method, which is the one
+        wrapped by :meth:`argus.backends.tempest.throttle.Throttle.wrap`.
+        """
+        resp = self._session.request(
+            url, method, headers=headers, json=body,
+            endpoint_filter=self._endpoint_filter, raise_exc=False)
+        return Response(resp.status_code, resp.headers), resp.content
+
+    def _request(self, method, path, body=None, params=None, headers=None):
+        url = self.prefix + path
+        if params:
+            url += "?" + urlparse.urlencode(sorted(params.items()),
+                                            doseq=True)
+        resp, content = self.raw_request(url, method, headers=headers,
+                                         body=body)
+        if isinstance(content, six.binary_type):
+            content = content.decode('utf-8', 'replace')
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        if resp.status == 404:
+            raise NotFound(resp.status, data or content)
+        if resp.status >= 400:
+            raise RestError(resp.status, data or content)
+        return ResponseBody(resp, data)
+
+
+class ServersClient(RestClient):
+    service = 'compute'
+
+    def _action(self, server_id, name, info=None, headers=None):
+        return self._request('POST', 'servers/%s/action' % server_id,
+                             {name: info}, headers=headers)
+
+    def create_server(self, **kwargs):
+        if 'disk_config' in kwargs:
+            kwargs['OS-DCF:diskConfig'] = kwargs.pop('disk_config')
+        if 'meta' in kwargs:
+            kwargs['metadata'] = kwargs.pop('meta')
+        server = {key: value for key, value in kwargs.items()
+                  if value is not None}
+        return self._request('POST', 'servers', {'server': server})
+
+    def show_server(self, server_id):
+        return self._request('GET', 'servers/%s' % server_id)
+
+    def list_servers(self, detail=False, **params):
+        path = 'servers/detail' if detail else 'servers'
+        return self._request('GET', path, params=params)
+
+    def delete_server(self, server_id):
+        return self._request('DELETE', 'servers/%s' % server_id)
+
+    def reboot_server(self, server_id, reboot_type):
+        return self._action(server_id, 'reboot', {'type': reboot_type})
+
+    def rebuild_server(self, server_id, image_ref, **kwargs):
+        kwargs['imageRef'] = image_ref
+        headers = None
+        if 'user_data' in kwargs:
+            headers = {'OpenStack-API-Version':
+                       'compute ' + USER_DATA_REBUILD_VERSION}
+        return self._action(server_id, 'rebuild', kwargs, headers)
+
+    def rescue_server(self, server_id, **kwargs):
+        return self._action(server_id, 'rescue', kwargs)
+
+    def unrescue_server(self, server_id):
+        return self._action(server_id, 'unrescue')
+
+    def get_console_output(self, server_id, length):
+        return self._action(server_id, 'os-getConsoleOutput',
+                            {'length': length})
+
+    def get_password(self, server_id):
+        return self._request('GET',
+                             'servers/%s/os-server-password' % server_id)
+
+    def create_image(self, server_id, name, **kwargs):
+        kwargs['name'] = name
+        return self._action(server_id, 'createImage', kwargs)
+
+    def add_security_group(self, server_id, name):
+        return self._action(server_id, 'addSecurityGroup', {'name': name})
+
+
+class KeypairsClient(RestClient):
+    service = 'compute'
+
+    def create_keypair(self, **kwargs):
+        return self._request('POST', 'os-keypairs', {'keypair': kwargs})
+
+    def show_keypair(self, name):
+        return self._request('GET', 'os-keypairs/%s' % name)
+
+    def delete_keypair(self, name):
+        return self._request('DELETE', 'os-keypairs/%s' % name)
+
+
+class FloatingIPsClient(RestClient):
+    service = 'compute'
+
+    def create_floating_ip(self, **kwargs):
+        return self._request('POST', 'os-floating-ips', kwargs)
+
+    def show_floating_ip(self, floating_ip_id):
+        return self._request('GET', 'os-floating-ips/%s' % floating_ip_id)
+
+    def delete_floating_ip(self, floating_ip_id):
+        return self._request('DELETE', 'os-floating-ips/%s' % floating_ip_id)
+
+    def associate_floating_ip_to_server(self, floating_ip, server_id):
+        return self._request('POST', 'servers/%s/action' % server_id,
+                             {'addFloatingIp': {'address': floating_ip}})
+
+
+class SecurityGroupsClient(RestClient):
+    service = 'compute'
+
+    def create_security_group(self, **kwargs):
+        return self._request('POST', 'os-security-groups',
+                             {'security_group': kwargs})
+
+    def show_security_group(self, group_id):
+        return self._request('GET', 'os-security-groups/%s' % group_id)
+
+    def delete_security_group(self, group_id):
+        return self._request('DELETE', 'os-security-groups/%s' % group_id)
+
+
+class SecurityGroupRulesClient(RestClient):
+    service = 'compute'
+
+    def create_security_group_rule(self, **kwargs):
+        return self._request('POST', 'os-security-group-rules',
+                             {'security_group_rule': kwargs})
+
+
+class AvailabilityZoneClient(RestClient):
+    service = 'compute'
+
+    def list_availability_zones(self, detail=False):
+        path = 'os-availability-zone'
+        return self._request('GET', path + '/detail' if detail else path)
+
+
+class FlavorsClient(RestClient):
+    service = 'compute'
+
+    def show_flavor(self, flavor_id):
+        return self._request('GET', 'flavors/%s' % flavor_id)
+
+
+class ImagesClient(RestClient):
+    """The images, as seen by the compute API."""
+
+    service = 'compute'
+
+    def show_image(self, image_id):
+        return self._request('GET', 'images/%s' % image_id)
+
+    def delete_image(self, image_id):
+        return self._request('DELETE', 'images/%s' % image_id)
+
+
+class ImageClient(RestClient):
+    """The image service."""
+
+    service = 'image'
+    prefix = 'v2/'
+
+    def get_image_meta(self, image_id):
+        return self._request('GET', 'images/%s' % image_id)
+
+
+class NetworkClient(RestClient):
+    """The network API, with both tempest's network and networks clients."""
+
+    service = 'network'
+    prefix = 'v2.0/'
+
+    def _create(self, resource, **kwargs):
+        return self._request('POST', resource + 's', {resource: kwargs})
+
+    def _show(self, resource, resource_id):
+        return self._request('GET', '%ss/%s' % (resource, resource_id))
+
+    def _update(self, resource, resource_id, **kwargs):
+        return self._request('PUT', '%ss/%s' % (resource, resource_id),
+                             {resource: kwargs})
+
+    def _delete(self, resource, resource_id):
+        return self._request('DELETE', '%ss/%s' % (resource, resource_id))
+
+    def create_network(self, **kwargs):
+        return self._create('network', **kwargs)
+
+    def list_networks(self, **params):
+        return self._request('GET', 'networks', params=params)
+
+    def delete_network(self, network_id):
+        return self._delete('network', network_id)
+
+    def create_subnet(self, **kwargs):
+        return self._create('subnet', **kwargs)
+
+    def show_subnet(self, subnet_id):
+        return self._show('subnet', subnet_id)
+
+    def update_subnet(self, subnet_id, **kwargs):
+        return self._update('subnet', subnet_id, **kwargs)
+
+    def list_subnets(self, **params):
+        return self._request('GET', 'subnets', params=params)
+
+    def list_ports(self, **params):
+        return self._request('GET', 'ports', params=params)
+
+    def create_router(self, **kwargs):
+        return self._create('router', **kwargs)
+
+    def delete_router(self, router_id):
+        return self._delete('router', router_id)
+
+    def add_router_interface(self, router_id, subnet_id):
+        return self._request('PUT',
+                             'routers/%s/add_router_interface' % router_id,
+                             {'subnet_id': subnet_id})
+
+    def remove_router_interface(self, router_id, subnet_id):
+        return self._request('PUT',
+                             'routers/%s/remove_router_interface' % router_id,
+                             {'subnet_id': subnet_id})
+
+    def list_security_groups(self, **params):
+        return self._request('GET', 'security-groups', params=params)
+
+    def delete_security_group(self, group_id):
+        return self._request('DELETE', 'security-groups/%s' % group_id)
+
+
+class Credentials(object):
+    """A set of credentials, with the network resources made for them."""
+
+    FIELDS = (
+        'username', 'password', 'user_id',
+        'tenant_name', 'tenant_id',
+        'project_name', 'project_id',
+        'user_domain_name', 'project_domain_name', 'domain_name',
+        'network', 'subnet', 'router',
+    )
+
+    def __init__(self, **kwargs):
+        for field in self.FIELDS:
+            setattr(self, field, kwargs.pop(field, None))
+        if kwargs:
+            raise exceptions.ArgusError(
+                "Unknown credentials fields %s" % sorted(kwargs))
+        # The tenant is the project of the identity API v3.
+        self.tenant_name = self.tenant_name or self.project_name
+        self.tenant_id = self.tenant_id or self.project_id
+        self.project_name = self.tenant_name
+        self.project_id = self.tenant_id
+
+    def auth_kwargs(self):
+        """Get the arguments for :func:`argus.backends.keystone.get_session`."""
+        return {
+            'username': self.username,
+            'user_id': self.user_id,
+            'password': self.password,
+            'project_id': self.tenant_id,
+            'project_name': self.tenant_name,
+            'user_domain_name': self.user_domain_name or self.domain_name,
+            'project_domain_name': (self.project_domain_name or
+                                    self.domain_name),
+        }
+
+
+def get_credentials(**kwargs):
+    """Get the :class:`Credentials` with the given fields."""
+    return Credentials(**kwargs)
+
+
+def admin_credentials():
+    """Get the admin credentials, as given by the environment."""
+    env = os.environ
+    return Credentials(
+        username=env.get('OS_USERNAME'),
+        password=env.get('OS_PASSWORD'),
+        tenant_name=env.get('OS_PROJECT_NAME') or env.get('OS_TENANT_NAME'),
+        user_domain_name=env.get('OS_USER_DOMAIN_NAME', 'Default'),
+        project_domain_name=env.get('OS_PROJECT_DOMAIN_NAME', 'Default'))
+
+
+class Manager(object):
+    """The clients of a set of credentials, as tempest's ``clients.Manager``.
+
+    All the clients share the same session.
+
+    :param credentials:
+        The :class:`Credentials` used by the clients.
+    :param token_cache:
+        An optional :class:`argus.identity.TokenCache`.
+    :param offline:
+        Don't authenticate, when the requests are answered by an
+        :class:`argus.backends.tempest.cassette.Cassette`.
+    """
+
+    def __init__(self, credentials, token_cache=None, offline=False):
+        self.credentials = credentials
+        self.auth_url = keystone.auth_url()
+        if offline:
+            self.session = self.auth = None
+        else:
+            self.session, self.auth = keystone.get_session(
+                self.auth_url, token_cache=token_cache,
+                **credentials.auth_kwargs())
+
+        self.servers_client = ServersClient(self.session)
+        self.keypairs_client = KeypairsClient(self.session)
+        self.floating_ips_client = FloatingIPsClient(self.session)
+        self.security_groups_client = SecurityGroupsClient(self.session)
+        self.security_group_rules_client = SecurityGroupRulesClient(
+            self.session)
+        self.availability_zone_client = AvailabilityZoneClient(self.session)
+        self.flavors_client = FlavorsClient(self.session)
+        self.images_client = ImagesClient(self.session)
+        self.image_client = ImageClient(self.session)
+        self.network_client = self.networks_client = NetworkClient(
+            self.session)
+
+        # Not used by argus.
+        self.volumes_client = None
+        self.snapshots_client = None
+        self.interfaces_client = None
+        self.orchestration_client = None
+
+
+def _ignore_missing(func, *args):
+    try:
+        func(*args)
+    except Exception as exc:
+        # The identity client has its own NotFound.
+        if type(exc).__name__ != 'NotFound':
+            raise
+
+
+class DynamicCredentialProvider(object):
+    """Create a tenant and a user, with their own network and router.
+
+    This mirrors the tempest provider with the same name, including
+    :meth:`_create_network_resources` and the ``_creds`` mapping,
+    which are used by the backends and by the tenant pool.
+
+    :param name:
+        Used as a prefix for the names of the created resources.
+    """
+
+    def __init__(self, name, network_resources=None, token_cache=None):
+        # pylint: disable=unused-argument
+        self.name = name
+        self._creds = {}
+        self._lock = threading.Lock()
+        self._admin = Manager(admin_credentials(), token_cache)
+        self._identity = keystone_client.Client(session=self._admin.session)
+        self._public_network_id = None
+
+    def get_primary_creds(self):
+        with self._lock:
+            if 'primary' not in self._creds:
+                self._creds['primary'] = self._create_creds()
+            return self._creds['primary']
+
+    def _member_role(self):
+        for role in self._identity.roles.list():
+            if role.name in MEMBER_ROLES:
+                return role
+        raise exceptions.ArgusError(
+            "None of the roles %s exists" % (MEMBER_ROLES, ))
+
+    def _create_creds(self):
+        name = util.rand_name(self.name)
+        admin_credentials = self._admin.credentials
+        domain_id = self._admin.auth.get_access(
+            self._admin.session).project_domain_id
+        project = self._identity.projects.create(
+            name=name + "-tenant", domain=domain_id,
+            description=name + " tenant")
+        password = uuid.uuid4().hex
+        try:
+            user = self._identity.users.create(
+                name=name + "-user", password=password, domain=domain_id,
+                default_project=project)
+            self._identity.roles.grant(self._member_role(), user=user,
+                                       project=project)
+        except Exception:
+            self._identity.projects.delete(project)
+            raise
+
+        creds = Credentials(
+            username=user.name, password=password, user_id=user.id,
+            tenant_name=project.name, tenant_id=project.id,
+            user_domain_name=admin_credentials.project_domain_name,
+            project_domain_name=admin_credentials.project_domain_name)
+        try:
+            creds.network, creds.subnet, creds.router = (
+                self._create_network_resources(project.id))
+        except Exception:
+            self._clear_creds(creds)
+            raise
+        return creds
+
+    def _public_network(self):
+        if self._public_network_id is None:
+            networks = self._admin.network_client.list_networks(
+                **{'router:external': True})['networks']
+            if not networks:
+                raise exceptions.ArgusError("There's no external network.")
+            self._public_network_id = networks[0]['id']
+        return self._public_network_id
+
+    def _create_subnet(self, network_id, tenant_id, name):
+        client = self._admin.network_client
+        start = random.randrange(SUBNETS_COUNT)
+        for attempt in range(SUBNET_ATTEMPTS):
+            index = (start + attempt) % SUBNETS_COUNT
+            cidr = "10.100.%d.%d/28" % (index // 16, index % 16 * 16)
+            try:
+                return client.create_subnet(
+                    network_id=network_id, tenant_id=tenant_id,
+                    name=name + "-subnet", cidr=cidr,
+                    ip_version=4)['subnet']
+            except RestError as exc:
+                if exc.status not in (400, 409):
+                    raise
+                LOG.debug("Subnet %s is unusable: %s", cidr, exc)
+        raise exceptions.ArgusError(
+            "Couldn't find a free subnet for %s" % name)
+
+    def _create_network_resources(self, tenant_id):
+        """Create a network, a subnet and a router for the tenant."""
+        client = self._admin.network_client
+        name = util.rand_name(self.name)
+        network = client.create_network(
+            name=name + "-network", tenant_id=tenant_id)['network']
+        subnet = router = None
+        try:
+            subnet = self._create_subnet(network['id'], tenant_id, name)
+            router = client.create_router(
+                name=name + "-router", tenant_id=tenant_id,
+                external_gateway_info={
+                    'network_id': self._public_network()})['router']
+            client.add_router_interface(router['id'], subnet['id'])
+        except Exception:
+            self._clear_network(network, subnet, router)
+            raise
+        return network, subnet, router
+
+    def _clear_network(self, network, subnet, router):
+        client = self._admin.network_client
+        if router is not None:
+            if subnet is not None:
+                _ignore_missing(client.remove_router_interface,
+                                router['id'], subnet['id'])
+            _ignore_missing(client.delete_router, router['id'])
+        if network is not None:
+            # Its subnets are deleted together with it.
+            _ignore_missing(client.delete_network, network['id'])
+
+    def _clear_creds(self, creds):
+        self._clear_network(getattr(creds, 'network', None),
+                            getattr(creds, 'subnet', None),
+                            getattr(creds, 'router', None))
+        if getattr(creds, 'user_id', None):
+            _ignore_missing(self._identity.users.delete, creds.user_id)
+        tenant_id = getattr(creds, 'tenant_id', None)
+        if tenant_id:
+            groups = self._admin.network_client.list_security_groups(
+                tenant_id=tenant_id, name='default')['security_groups']
+            for group in groups:
+                _ignore_missing(
+                    self._admin.network_client.delete_security_group,
+                    group['id'])
+            _ignore_missing(self._identity.projects.delete, tenant_id)
+
+    def delete_tenant(self, resources):
+        """Delete a tenant created by another provider, given its ids.
+
+        :param resources:
+            A dictionary as given by
+            :meth:`argus.backends.tempest.manager.APIManager.tenant_resources`.
+        """
+        for ids in resources['networks']:
+            network, subnet, router = [{'id': item} if item else None
+                                       for item in ids]
+            self._clear_network(network, subnet, router)
+        self._clear_creds(Credentials(tenant_id=resources['tenant_id'],
+                                      user_id=resources['user_id']))
+
+    def clear_creds(self):
+        """Delete everything created by this provider."""
+        with self._lock:
+            creds, self._creds = self._creds, {}
+        # The extra network resources go first, the tenant last.
+        for key in sorted(creds, key=lambda key: key == 'primary'):
+            try:
+                self._clear_creds(creds[key])
+            except Exception:
+                LOG.exception("Deleting the %s credentials failed", key)
+
+
+def get_credentials_provider(name, network_resources=None, token_cache=None):
+    """Get a :class:`DynamicCredentialProvider`, as tempest does."""
+    return DynamicCredentialProvider(name, network_resources, token_cache)
@@ -16,18 +16,20 @@
 
 import abc
 import base64
+import collections
+import functools
 
 import six
 
 from argus.backends import base as base_backend
+from argus.backends import parking
 from argus.backends import windows
 from argus.backends.tempest import manager as api_manager
+from argus.backends.tempest import reaper
+from argus.backends.tempest import tenants
+from argus import exceptions
 from argus import util
 
-with util.restore_excepthook():
-    from tempest.common import waiters
-
-
 LOG = util.get_logger()
 
 # Starting size as number of lines and tolerance.
@@ -55,7 +57,19 @@ class BaseTempestBackend(base_backend.CloudBackend):
     :param availability_zone:
         The availability zone in which the underlying instance
         will be available.
+
+    When *tempest_rebuild* is enabled, the server isn't deleted when
+    the backend is cleaned up. The next backend of the same type,
+    flavor and availability zone takes it over and rebuilds it,
+    keeping its floating IP, security group and keypair.
     """
+
+    rebuildable = True
+    """Whether the server can be taken over by another backend."""
+
+    batchable = True
+    """Whether the instance can be set up by :meth:`setup_instances`."""
+
     def __init__(self, conf, name, userdata, metadata, availability_zone):
         if userdata:
             userdata = base64.encodestring(userdata)
@@ -69,11 +83,56 @@ class BaseTempestBackend(base_backend.CloudBackend):
         self._routers = []
         self._floating_ip = None
         self._networks = None    # list with UUIDs for future attached NICs
+        self._manager = None
 
         # set some members from the configuration file needed by recipes
         self.image_ref = self._conf.openstack.image_ref
         self.flavor_ref = self._conf.openstack.flavor_ref
-        self._manager = api_manager.APIManager()
+        self._previous_userdata = None
+
+        if self._rebuilds():
+            parked = parking.get_parked_backends().take(self._rebuild_key())
+            if parked is not None:
+                self._adopt(parked)
+
+    def _acquire_manager(self):
+        """Get the API manager of the backend, acquiring it if needed.
+
+        It is called by the thread setting up the instance, before
+        the concurrent steps using the manager start. The backends set
+        up together by :meth:`setup_instances` use the tenant of the
+        first one, so theirs are never acquired.
+        """
+        if self._manager is None:
+            self._manager = tenants.acquire_manager(self._conf)
+        return self._manager
+
+    def _rebuilds(self):
+        return self.rebuildable and self._conf.argus.tempest_rebuild
+
+    def _rebuild_key(self):
+        return (type(self), self.flavor_ref, self._availability_zone)
+
+    def _adopt(self, parked):
+        """Take over the server and the resources of a parked backend."""
+        # pylint: disable=protected-access
+        LOG.info("Taking over server %s", parked.internal_instance_id())
+        self._manager = parked._manager
+        # The console output of the previous scenario isn't ours.
+        self._manager.forget_instance(parked.internal_instance_id())
+        self._server = parked._server
+        self._keypair = parked._keypair
+        self._security_group = parked._security_group
+        self._security_groups_rules = parked._security_groups_rules
+        self._floating_ip = parked._floating_ip
+        self._previous_userdata = parked.userdata
+
+    def _forget_resources(self):
+        self._server = None
+        self._keypair = None
+        self._security_group = None
+        self._security_groups_rules = []
+        self._floating_ip = None
 
     def _configure_networking(self):
         subnet_id = self._manager.primary_credentials().subnet["id"]
@@ -81,27 +140,57 @@ class BaseTempestBackend(base_backend.CloudBackend):
             subnet_id,
             dns_nameservers=self._conf.argus.dns_nameservers)
 
-    def _create_server(self, wait_until='ACTIVE', **kwargs):
+    def _boot_server(self, **kwargs):
+        """Ask for a new server, without waiting for it to be built."""
         server = self._manager.servers_client.create_server(
             name=util.rand_name(self._name) + "-instance",
-            imageRef=self.image_ref,
+            imageRef=self.golden_image or self.image_ref,
             flavorRef=self.flavor_ref,
             **kwargs)
-        waiters.wait_for_server_status(
-            self._manager.servers_client, server['server']['id'], wait_until)
         return server['server']
 
-    def _assign_floating_ip(self):
+    def _server_options(self):
+        return {
+            'key_name': self._keypair.name,
+            'disk_config': 'AUTO',
+            'user_data': self.userdata,
+            'meta': self.metadata,
+            'networks': self._networks,
+            'availability_zone': self._availability_zone,
+        }
+
+    def _batch_key(self):
+        """The servers with the same key can be booted by one request."""
+        return repr((self.golden_image or self.image_ref, self.flavor_ref,
+                     self._availability_zone, self._networks,
+                     self.userdata, self.metadata))
+
+    def _wait_for_server(self, wait_until='ACTIVE'):
+        self._manager.wait_for_server(self.internal_instance_id(),
+                                      wait_until)
+
+    def _create_keypair(self):
+        if self._manager.edge:
+            self._keypair = self._manager.edge.lease_keypair(
+                self.__class__.__name__)
+            return
+        self._keypair = self._manager.create_keypair(
+            name=self.__class__.__name__)
+
+    def _allocate_floating_ip(self):
+        if self._manager.edge:
+            self._floating_ip = self._manager.edge.lease_floating_ip()
+            return
         floating_ip = self._manager.floating_ips_client.create_floating_ip()
-        floating_ip = floating_ip['floating_ip']
+        self._floating_ip = floating_ip['floating_ip']
 
+    def _associate_floating_ip(self):
         self._manager.floating_ips_client.associate_floating_ip_to_server(
-            floating_ip['ip'], self.internal_instance_id())
-        return floating_ip
+            self._floating_ip['ip'], self.internal_instance_id())
 
-    def _add_security_group_exceptions(self, secgroup_id):
-        _client = self._manager.security_group_rules_client
-        rulesets = [
+    @staticmethod
+    def _security_group_rulesets():
+        return [
             {
                 # http RDP
                 'ip_protocol': 'tcp',
@@ -138,82 +227,258 @@ class BaseTempestBackend(base_backend.CloudBackend):
                 'cidr': '0.0.0.0/0',
             },
         ]
-        for ruleset in rulesets:
+
+    def _add_security_group_exceptions(self, secgroup_id):
+        _client = self._manager.security_group_rules_client
+
+        def create_rule(ruleset):
             sg_rule = _client.create_security_group_rule(
                 parent_group_id=secgroup_id, **ruleset)['security_group_rule']
-            yield sg_rule
+            # Recorded as soon as possible, for cleaning it up.
+            self._security_groups_rules.append(sg_rule['id'])
+            return sg_rule
+
+        return util.run_concurrently(*[
+            functools.partial(create_rule, ruleset)
+            for ruleset in self._security_group_rulesets()])
 
-    def _create_security_groups(self):
+    def _new_security_group(self):
         sg_name = util.rand_name(self.__class__.__name__)
         sg_desc = sg_name + " description"
-        secgroup = self._manager.security_groups_client.create_security_group(
-            name=sg_name, description=sg_desc)['security_group']
+        security_group = (
+            self._manager.security_groups_client.create_security_group(
+                name=sg_name, description=sg_desc)['security_group'])
 
         # Add rules to the security group.
-        for rule in self._add_security_group_exceptions(secgroup['id']):
-            self._security_groups_rules.append(rule['id'])
+        self._add_security_group_exceptions(security_group['id'])
+        return security_group
+
+    def _create_security_group(self):
+        if self._manager.edge:
+            # All the instances of the tenant share the same one.
+            self._security_group = self._manager.edge.security_group(
+                self._new_security_group,
+                len(self._security_group_rulesets()))
+            return
+        self._security_group = self._new_security_group()
+
+    def _attach_security_group(self):
         self._manager.servers_client.add_security_group(
             self.internal_instance_id(),
-            secgroup['name'])
-        return secgroup
+            self._security_group['name'])
+
+    def _cleanup_manifest(self):
+        """Describe the resources which have to be destroyed.
+
+        The server, the keypair and the floating IP are independent,
+        while the security group can be deleted, together with its
+        rules, only after the server is gone. The tenant goes last.
+        The pooled resources are released only after the server
+        is gone, while the shared security group is kept.
+        """
+        manifest = reaper.Manifest(api_manager.dump_credentials(
+            self._manager.primary_credentials()))
+        if self._manager.edge:
+            manifest.add_stage(
+                self._server and reaper.action('delete_server',
+                                               self.internal_instance_id()))
+            manifest.add_stage(
+                self._keypair and reaper.action('release_keypair',
+                                                self._keypair.name),
+                self._floating_ip and reaper.action('release_floating_ip',
+                                                    self._floating_ip['id']))
+            manifest.add_stage(reaper.action(
+                'cleanup_credentials', self._manager.tenant_resources()))
+            return manifest
+
+        manifest.add_stage(
+            self._server and reaper.action('delete_server',
+                                           self.internal_instance_id()),
+            self._keypair and reaper.action('delete_keypair',
+                                            self._keypair.name),
+            self._floating_ip and reaper.action('delete_floating_ip',
+                                                self._floating_ip['id']))
+        manifest.add_stage(
+            self._security_group and reaper.action(
+                'delete_security_group', self._security_group['id']))
+        manifest.add_stage(reaper.action(
+            'cleanup_credentials', self._manager.tenant_resources()))
+        return manifest
 
     def cleanup(self):
         """Cleanup the underlying instance.
 
         In order for the backend to be useful again,
         call :meth:`setup_instance` method for preparing another
-        underlying instance.
+        underlying instance. When *async_cleanup* is enabled,
+        the resources are destroyed in the background, by
+        :func:`argus.backends.tempest.reaper.get_reaper`.
         """
-
+        if (self._rebuilds() and self._server and self._floating_ip and
+                self._security_group):
+            # The reaper has to outlive the parked backends at exit.
+            reaper.get_reaper(self._conf)
+            LOG.info("Keeping server %s for the next scenario",
+                     self.internal_instance_id())
+            parking.get_parked_backends().park(
+                self._rebuild_key(), self, self._destroy)
+            return
+        self._destroy()
+
+    def _destroy(self):
+        if self._manager is None:
+            # Nothing was created, not even a tenant.
+            return
         LOG.info("Cleaning up...")
 
-        if self._security_groups_rules:
-            for rule in self._security_groups_rules:
-                self._manager.security_group_rules_client.delete_security_group_rule(rule)
-
-        if self._security_group:
-            self._manager.servers_client.remove_security_group(
-                self.internal_instance_id(),
-                self._security_group['name'])
-
+        manifest = self._cleanup_manifest()
         if self._server:
-            self._manager.servers_client.delete_server(
-                self.internal_instance_id())
-            waiters.wait_for_server_termination(
-                self._manager.servers_client,
-                self.internal_instance_id())
-
-        if self._floating_ip:
-            self._manager.floating_ips_client.delete_floating_ip(
-                self._floating_ip['id'])
-
-        if self._keypair:
-            self._keypair.destroy()
-
-        self._manager.cleanup_credentials()
+            self._manager.forget_instance(self.internal_instance_id())
+        cleanup_reaper = reaper.get_reaper(self._conf)
+        if self._conf.argus.async_cleanup:
+            cleanup_reaper.submit(manifest, self._manager)
+        else:
+            cleanup_reaper.reap(manifest, self._manager)
 
     def setup_instance(self):
-        # pylint: disable=attribute-defined-outside-init
+        """Create the instance and the resources it needs.
+
+        The independent resources are created concurrently: the
+        floating IP and the security group are created while the
+        server is building and they are associated with it once
+        it becomes active. Everything which was created is tracked
+        right away, so that :meth:`cleanup` can undo a partial setup.
+        A server taken over from another backend is rebuilt instead.
+        """
+        if self._server is not None:
+            try:
+                self._rebuild_server()
+                return
+            except Exception:
+                LOG.exception("Rebuilding server %s failed, creating "
+                              "a new one", self.internal_instance_id())
+                self._destroy()
+                self._forget_resources()
+                self._manager = None
+
+        self._acquire_manager()
         LOG.info("Creating server...")
 
-        self._configure_networking()
-        self._keypair = self._manager.create_keypair(
-            name=self.__class__.__name__)
-        self._server = self._create_server(
-            wait_until='ACTIVE',
-            key_name=self._keypair.name,
-            disk_config='AUTO',
-            user_data=self.userdata,
-            meta=self.metadata,
-            networks=self._networks,
-            availability_zone=self._availability_zone)
-        self._floating_ip = self._assign_floating_ip()
-        self._security_group = self._create_security_groups()
+        util.run_concurrently(self._configure_networking,
+                              self._create_keypair)
+        self._server = self._boot_server(**self._server_options())
+        util.run_concurrently(self._wait_for_server,
+                              self._allocate_floating_ip,
+                              self._create_security_group)
+        util.run_concurrently(self._associate_floating_ip,
+                              self._attach_security_group)
+
+    def _setup_edge(self):
+        util.run_concurrently(self._allocate_floating_ip,
+                              self._create_security_group)
+        util.run_concurrently(self._associate_floating_ip,
+                              self._attach_security_group)
+
+    @staticmethod
+    def _boot_servers(backends):
+        """Boot the servers of the given identical backends at once."""
+        leader = backends[0]
+        if len(backends) == 1:
+            leader._server = leader._boot_server(**leader._server_options())
+            return
+
+        servers_client = leader._manager.servers_client
+        response = servers_client.create_server(
+            name=util.rand_name(leader._name) + "-instance",
+            imageRef=leader.golden_image or leader.image_ref,
+            flavorRef=leader.flavor_ref,
+            min_count=len(backends),
+            max_count=len(backends),
+            return_reservation_id=True,
+            **leader._server_options())
+        servers = servers_client.list_servers(
+            reservation_id=response['reservation_id'])['servers']
+        if len(servers) != len(backends):
+            raise exceptions.ArgusError(
+                "Expected %d servers, got %d"
+                % (len(backends), len(servers)))
+        for backend, server in zip(backends, servers):
+            backend._server = server
+
+    @classmethod
+    def setup_instances(cls, backends):
+        """Set up the instances of several backends together.
+
+        The backends share the tenant and the keypair of the first
+        one. The servers which are identical, including their
+        userdata and metadata, are booted through a single request,
+        the others through parallel requests, and all of them are
+        waited for by listing the servers of the tenant. The backends
+        which can't be part of a batch are set up on their own.
+        """
+        # pylint: disable=protected-access
+        batch = [backend for backend in backends
+                 if backend.batchable and backend._server is None]
+        alone = [backend for backend in backends if backend not in batch]
+        if len(batch) < 2:
+            alone, batch = backends, []
+
+        funcs = [backend.setup_instance for backend in alone]
+        if batch:
+            funcs.append(functools.partial(cls._setup_batch, batch))
+        util.run_concurrently(*funcs)
+
+    @classmethod
+    def _setup_batch(cls, backends):
+        # pylint: disable=protected-access
+        LOG.info("Creating %d servers...", len(backends))
+        leader = backends[0]
+        manager = leader._acquire_manager()
+        for backend in backends[1:]:
+            backend._manager = manager.share()
+
+        util.run_concurrently(leader._configure_networking,
+                              leader._create_keypair)
+        for backend in backends[1:]:
+            backend._keypair = leader._keypair
+
+        groups = collections.OrderedDict()
+        for backend in backends:
+            groups.setdefault(backend._batch_key(), []).append(backend)
+        util.run_concurrently(*[functools.partial(cls._boot_servers, group)
+                                for group in groups.values()])
+
+        leader._manager.wait_for_servers(
+            [backend.internal_instance_id() for backend in backends])
+        util.run_concurrently(*[backend._setup_edge
+                                for backend in backends])
+
+    def _rebuild_server(self):
+        """Rebuild the server with the image, userdata and metadata of this backend.
+
+        Changing the userdata through a rebuild needs a recent
+        compute API, otherwise the rebuild fails.
+        """
+        LOG.info("Rebuilding server %s...", self.internal_instance_id())
+        kwargs = {'metadata': self.metadata or {}}
+        if self.userdata != self._previous_userdata:
+            kwargs['user_data'] = self.userdata
+        self._manager.rebuild_instance(
+            self.internal_instance_id(),
+            self.golden_image or self.image_ref,
+            **kwargs)
 
     def reboot_instance(self):
         # Delegate to the manager to reboot the instance
         return self._manager.reboot_instance(self.internal_instance_id())
 
+    def snapshot_instance(self, name):
+        return self._manager.create_snapshot(self.internal_instance_id(),
+                                             name)
+
+    def delete_snapshot(self, image_id):
+        self._manager.delete_image(image_id)
+
     def instance_password(self):
         # Delegate to the manager to find out the instance password
         return self._manager.instance_password(
@@ -229,6 +494,11 @@ class BaseTempestBackend(base_backend.CloudBackend):
             self.internal_instance_id(),
             limit)
 
+    def instance_output_from(self, offset):
+        """Get the new console output, read incrementally."""
+        return self._manager.instance_output_from(
+            self.internal_instance_id(), offset, OUTPUT_SIZE)
+
     def instance_server(self):
         """Get the instance server object."""
         return self._manager.instance_server(self.internal_instance_id())
@@ -240,7 +510,7 @@ class BaseTempestBackend(base_backend.CloudBackend):
         return self._keypair.private_key
 
     def get_image_by_ref(self):
-        image = self._manager.images_client.show_image(self._conf.openstack.image_ref)
+        image = self._manager.show_image(self._conf.openstack.image_ref)
         return image['image']
 
     def floating_ip(self):
@@ -0,0 +1,198 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Reuse the isolated tenants between scenarios.
+
+Every :class:`argus.backends.tempest.manager.APIManager` creates
+a tenant, a user, a network, a subnet and a router, which are all
+deleted when the scenario finishes. The pool creates these in
+advance and takes them back after a scenario, so that they can be
+leased to the next one.
+"""
+
+import atexit
+import threading
+
+from argus.backends.tempest import edge
+from argus.backends.tempest import manager as api_manager
+from argus import util
+
+
+__all__ = (
+    'TenantPool',
+    'acquire_manager',
+    'get_tenant_pool',
+)
+
+LOG = util.get_logger()
+
+
+class TenantPool(object):
+    """A pool of API managers, each one with its isolated tenant.
+
+    :param size:
+        How many idle tenants are kept ready for the next leases.
+    :param dns_nameservers:
+        The DNS nameservers which are set on a tenant's subnet
+        when it is given back to the pool.
+    :param edge_pool_size:
+        If given, the floating IPs, the security group and the
+        keypairs of a tenant are kept as well, through an
+        :class:`argus.backends.tempest.edge.EdgePool` of this size.
+    """
+
+    def __init__(self, size, dns_nameservers, edge_pool_size=0):
+        self._size = size
+        self._dns_nameservers = dns_nameservers
+        self._edge_pool_size = edge_pool_size
+        self._idle = []
+        self._pending = 0
+        self._allocation_pools = {}
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _create(self):
+        manager = api_manager.APIManager(owner=self)
+        subnet_id = manager.primary_credentials().subnet["id"]
+        subnet = manager.network_client.show_subnet(subnet_id)["subnet"]
+        # Remember the pristine state of the subnet, for resetting it.
+        self._allocation_pools[manager] = subnet["allocation_pools"]
+        if self._edge_pool_size:
+            manager.edge = edge.EdgePool(manager, self._edge_pool_size)
+        return manager
+
+    def _create_idle(self):
+        try:
+            manager = self._create()
+        except Exception:
+            LOG.exception("Creating a tenant for the pool failed")
+            manager = None
+
+        with self._cond:
+            self._pending -= 1
+            if manager is not None and not self._closed:
+                self._idle.append(manager)
+                manager = None
+            self._cond.notify_all()
+        if manager is not None:
+            # The pool was closed meanwhile.
+            self._discard(manager)
+
+    def fill(self):
+        """Create tenants in background, until there are enough idle ones."""
+        with self._cond:
+            if self._closed:
+                return
+            missing = self._size - len(self._idle) - self._pending
+            self._pending += max(missing, 0)
+        for _ in range(missing):
+            thread = threading.Thread(target=self._create_idle)
+            thread.daemon = True
+            thread.start()
+
+    def acquire(self):
+        """Lease an API manager, with its own tenant."""
+        with self._cond:
+            while not self._idle and self._pending:
+                self._cond.wait()
+            manager = self._idle.pop(0) if self._idle else None
+        if manager is None:
+            manager = self._create()
+        self.fill()
+        LOG.debug("Leased tenant %s",
+                  manager.primary_credentials().tenant_name)
+        # A manager given back to the pool has no users left.
+        return manager.lease()
+
+    def _reset(self, manager):
+        """Bring the tenant back to the state it had when created.
+
+        Return False if this isn't possible, in which case the
+        tenant shouldn't be leased again.
+        """
+        # pylint: disable=protected-access
+        extra = set(manager.isolated_creds._creds) - {'primary'}
+        if extra:
+            # Additional network resources were created for this
+            # tenant, it's simpler to start over with a new one.
+            LOG.debug("Not reusing tenant with extra resources %s", extra)
+            return False
+
+        subnet_id = manager.primary_credentials().subnet["id"]
+        try:
+            manager.network_client.update_subnet(
+                subnet_id,
+                enable_dhcp=True,
+                dns_nameservers=self._dns_nameservers,
+                allocation_pools=self._allocation_pools[manager])
+        except Exception as exc:
+            LOG.warning("Resetting subnet %s failed: %r", subnet_id, exc)
+            return False
+        return True
+
+    def _discard(self, manager):
+        self._allocation_pools.pop(manager, None)
+        try:
+            if manager.edge is not None:
+                # These would outlive the tenant otherwise.
+                manager.edge.clear()
+            manager.clear_credentials()
+        except Exception:
+            LOG.exception("Deleting tenant %s failed",
+                          manager.primary_credentials().tenant_name)
+
+    def release(self, manager):
+        """Take back a leased manager, after its resources are deleted."""
+        if self._closed or not self._reset(manager):
+            self._discard(manager)
+            return
+        with self._cond:
+            self._idle.append(manager)
+            self._cond.notify_all()
+        LOG.debug("Tenant %s returned to the pool",
+                  manager.primary_credentials().tenant_name)
+
+    def close(self):
+        """Delete the idle tenants; the leased ones are deleted on release."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for manager in idle:
+            self._discard(manager)
+
+
+@util.run_once
+def get_tenant_pool(conf):
+    """Get the tenant pool of this process, if it is enabled."""
+    if not conf.argus.tenant_pool_size:
+        return None
+    tenant_pool = TenantPool(conf.argus.tenant_pool_size,
+                             conf.argus.dns_nameservers,
+                             conf.argus.edge_pool_size)
+    tenant_pool.fill()
+    atexit.register(tenant_pool.close)
+    return tenant_pool
+
+
+def acquire_manager(conf):
+    """Get an API manager, leased from the tenant pool if it is enabled.
+
+    In both cases, the manager's tenant is given back through
+    :meth:`argus.backends.tempest.manager.APIManager.cleanup_credentials`.
+    """
+    tenant_pool = get_tenant_pool(conf)
+    if tenant_pool is None:
+        return api_manager.APIManager()
+    return tenant_pool.acquire()
@@ -0,0 +1,184 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Throttle the OpenStack API calls made by argus.
+
+Every endpoint, such as compute or network, has a token bucket which
+is kept in the cache directory, so the calls made by all the threads
+and all the argus processes sharing that directory draw from the
+same buckets. When the cloud answers with a Retry-After header, the
+whole endpoint is paused for that long, not only the rejected call.
+"""
+
+import atexit
+import collections
+import email.utils
+import functools
+import threading
+import time
+
+from argus import cache
+from argus import util
+
+
+__all__ = (
+    'Throttle',
+    'get_throttle',
+    'retry_after',
+)
+
+LOG = util.get_logger()
+CACHE_FILE = "throttle.json"
+# The responses of the clouds which are rate limiting the calls.
+RATE_LIMITED = (413, 429)
+RETRY_COUNT = 5
+
+
+def retry_after(resp):
+    """Get the number of seconds requested by the Retry-After header.
+
+    Return None if the response doesn't have a usable one.
+    """
+    value = resp.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+    return max(email.utils.mktime_tz(date) - time.time(), 0)
+
+
+class Throttle(object):
+    """Token buckets for the API endpoints, shared between processes.
+
+    :param path:
+        The file where the state of the buckets is kept.
+    :param rate:
+        How many calls per second are allowed for an endpoint.
+    :param burst:
+        How many calls can be made at once, after a quiet period.
+    """
+
+    def __init__(self, path, rate, burst):
+        self._cache = cache.FileCache(path)
+        self._rate = float(rate)
+        self._burst = max(burst, 1)
+        self._stats = collections.defaultdict(collections.Counter)
+        self._stats_lock = threading.Lock()
+
+    def _bucket(self, data, endpoint, now):
+        bucket = data.get(endpoint) or {
+            'tokens': self._burst, 'stamp': now, 'blocked_until': 0}
+        elapsed = max(now - bucket['stamp'], 0)
+        bucket['tokens'] = min(self._burst,
+                               bucket['tokens'] + elapsed * self._rate)
+        bucket['stamp'] = now
+        data[endpoint] = bucket
+        return bucket
+
+    def _take(self, endpoint):
+        """Take a token, return how long to wait if there is none."""
+        now = time.time()
+        with self._cache.transaction() as data:
+            bucket = self._bucket(data, endpoint, now)
+            if now < bucket['blocked_until']:
+                return bucket['blocked_until'] - now
+            if bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                return 0
+            return (1 - bucket['tokens']) / self._rate
+
+    def _record(self, endpoint, **counters):
+        with self._stats_lock:
+            self._stats[endpoint].update(counters)
+
+    def acquire(self, endpoint):
+        """Wait until a call to *endpoint* is allowed."""
+        waited = 0
+        while True:
+            delay = self._take(endpoint)
+            if not delay:
+                break
+            waited += delay
+            time.sleep(delay)
+        self._record(endpoint, calls=1, delayed=int(waited > 0),
+                     delay=waited)
+
+    def block(self, endpoint, delay):
+        """Don't allow any call to *endpoint* for *delay* seconds."""
+        now = time.time()
+        with self._cache.transaction() as data:
+            bucket = self._bucket(data, endpoint, now)
+            bucket['blocked_until'] = max(bucket['blocked_until'],
+                                          now + delay)
+            bucket['tokens'] = 0
+
+    def wrap(self, client):
+        """Throttle all the requests made by a tempest REST client.
+
+        The calls which are rate limited by the cloud are retried
+        after the delay it asked for. Without a Retry-After header,
+        the response is left to the client to handle.
+        """
+        endpoint = getattr(client, 'service', None) or type(client).__name__
+        raw_request = client.raw_request
+
+        @functools.wraps(raw_request)
+        def throttled(*args, **kwargs):
+            for attempt in range(RETRY_COUNT + 1):
+                self.acquire(endpoint)
+                resp, body = raw_request(*args, **kwargs)
+                if resp.status not in RATE_LIMITED:
+                    break
+                self._record(endpoint, rate_limited=1)
+                delay = retry_after(resp)
+                if delay is None or attempt == RETRY_COUNT:
+                    break
+                LOG.debug("Endpoint %s is rate limited, retrying in %.1fs",
+                          endpoint, delay)
+                self.block(endpoint, delay)
+            return resp, body
+
+        client.raw_request = throttled
+
+    def stats(self):
+        """Get the throttling counters of this process, by endpoint."""
+        with self._stats_lock:
+            return {endpoint: dict(counters)
+                    for endpoint, counters in self._stats.items()}
+
+    def log_stats(self):
+        for endpoint, counters in sorted(self.stats().items()):
+            LOG.info("API calls to %s: %d, delayed: %d (%.1fs), "
+                     "rate limited by the cloud: %d",
+                     endpoint, counters.get('calls', 0),
+                     counters.get('delayed', 0), counters.get('delay', 0),
+                     counters.get('rate_limited', 0))
+
+
+@util.run_once
+def get_throttle(conf):
+    """Get the throttle of this process, if it is enabled."""
+    if not conf.argus.api_rate_limit:
+        return None
+    throttle = Throttle(cache.get_cache_path(conf, CACHE_FILE),
+                        conf.argus.api_rate_limit,
+                        conf.argus.api_rate_burst)
+    atexit.register(throttle.log_stats)
+    return throttle
@@ -0,0 +1,212 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Wait for many servers through a single polling loop.
+
+Instead of each waiter polling its own server, the servers of a
+tenant are tracked by a :class:`ServerWaiter`, which checks all of
+them with one ``list_servers`` call per iteration.
+"""
+
+import threading
+import time
+
+from argus import exceptions
+from argus import util
+
+
+__all__ = (
+    'DELETED',
+    'ServerFuture',
+    'ServerWaiter',
+)
+
+LOG = util.get_logger()
+
+DELETED = 'DELETED'
+ERROR = 'ERROR'
+TASK_STATE = 'OS-EXT-STS:task_state'
+DEFAULT_TIMEOUT = 1800
+MIN_INTERVAL = 1
+MAX_INTERVAL = 15
+# How fast the interval grows while nothing changes.
+INTERVAL_FACTOR = 1.5
+
+
+class ServerFuture(object):
+    """The pending result of waiting for a server to reach a status.
+
+    :param callback:
+        If given, it is called with the future when it is done.
+    """
+
+    def __init__(self, server_id, status, deadline, callback=None):
+        self.server_id = server_id
+        self.status = status
+        self.deadline = deadline
+        self._callback = callback
+        self._done = threading.Event()
+        self._server = None
+        self._error = None
+
+    def done(self):
+        return self._done.is_set()
+
+    def finish(self, server=None, error=None):
+        self._server = server
+        self._error = error
+        self._done.set()
+        if self._callback:
+            try:
+                self._callback(self)
+            except Exception:
+                LOG.exception("Callback for server %s failed",
+                              self.server_id)
+
+    def result(self, timeout=None):
+        """Wait for the future and return the server, as last listed.
+
+        The server is None when waiting for its deletion.
+        """
+        if not self._done.wait(timeout):
+            raise exceptions.ArgusTimeoutError(
+                "Server %s isn't %s yet" % (self.server_id, self.status))
+        if self._error:
+            raise self._error
+        return self._server
+
+
+class ServerWaiter(object):
+    """Track the status of the servers of a tenant.
+
+    The polling is fast right after a tracked server changes
+    its state and it slows down while nothing changes, such as
+    during a long build.
+
+    :param servers_client:
+        The servers client of the tenant.
+    """
+
+    def __init__(self, servers_client, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL):
+        self._servers_client = servers_client
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._futures = []
+        self._states = {}
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def watch(self, server_id, status='ACTIVE', timeout=DEFAULT_TIMEOUT,
+              callback=None):
+        """Start waiting for *server_id* to reach *status*.
+
+        Use :data:`DELETED` for waiting until the server is gone.
+        Return a :class:`ServerFuture`.
+        """
+        future = ServerFuture(server_id, status, time.time() + timeout,
+                              callback)
+        with self._lock:
+            self._futures.append(future)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            else:
+                # Check the new server right away.
+                self._wakeup.set()
+        return future
+
+    def wait(self, server_id, status='ACTIVE', timeout=DEFAULT_TIMEOUT):
+        """Wait for *server_id* to reach *status*."""
+        return self.watch(server_id, status, timeout).result()
+
+    def _check(self, future, servers, now):
+        server = servers.get(future.server_id)
+        if server is None:
+            if future.status == DELETED:
+                future.finish()
+            else:
+                future.finish(error=exceptions.ArgusError(
+                    "Server %s disappeared" % future.server_id))
+            return True
+
+        if (server['status'] == future.status and
+                server.get(TASK_STATE) is None):
+            future.finish(server)
+        elif server['status'] == ERROR and future.status != ERROR:
+            future.finish(error=exceptions.ArgusError(
+                "Server %s went into ERROR" % future.server_id))
+        elif now > future.deadline:
+            future.finish(error=exceptions.ArgusTimeoutError(
+                "Server %s didn't become %s, it is %s"
+                % (future.server_id, future.status, server['status'])))
+        else:
+            return False
+        return True
+
+    def _poll(self):
+        """Check all the tracked servers, return True if any changed."""
+        servers = self._servers_client.list_servers(detail=True)['servers']
+        servers = {server['id']: server for server in servers}
+        states = {server_id: (server['status'], server.get(TASK_STATE))
+                  for server_id, server in servers.items()}
+        changed = states != self._states
+        self._states = states
+
+        now = time.time()
+        with self._lock:
+            futures = list(self._futures)
+        finished = [future for future in futures
+                    if self._check(future, servers, now)]
+        with self._lock:
+            for future in finished:
+                self._futures.remove(future)
+        return changed or bool(finished)
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [future for future in self._futures
+                       if now > future.deadline]
+            for future in expired:
+                self._futures.remove(future)
+        for future in expired:
+            future.finish(error=exceptions.ArgusTimeoutError(
+                "Server %s didn't become %s"
+                % (future.server_id, future.status)))
+
+    def _run(self):
+        interval = self._min_interval
+        while True:
+            try:
+                changed = self._poll()
+            except Exception as exc:
+                LOG.debug("Listing the servers failed with %r", exc)
+                self._expire()
+                changed = False
+
+            with self._lock:
+                if not self._futures:
+                    self._thread = None
+                    return
+            if changed:
+                interval = self._min_interval
+            else:
+                interval = min(interval * INTERVAL_FACTOR,
+                               self._max_interval)
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
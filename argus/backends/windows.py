@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from argus.backends import reboot
+from argus.client import transcript
 from argus.client import windows
 from argus import util
 
@@ -29,8 +31,24 @@ class WindowsBackendMixin(object):
             username = self._conf.openstack.image_username
         if password is None:
             password = self._conf.openstack.image_password
+        recorder = transcript.get_transcript(self._conf)
+        if recorder is not None:
+            return recorder.client(self.floating_ip(), username, password,
+                                   transport_protocol=protocol)
         return windows.WinRemoteClient(self.floating_ip(),
                                        username, password,
                                        transport_protocol=protocol)
 
     remote_client = util.cached_property(get_remote_client, 'remote_client')
+
+    def reboot_instance(self):
+        """Reboot the instance and wait until it is really back.
+
+        The API reports the instance as active long before the
+        guest finishes rebooting, so the boot id of the guest is
+        used for knowing when it went down and came back.
+        """
+        tracker = reboot.RebootTracker(self.remote_client)
+        tracker.record()
+        super(WindowsBackendMixin, self).reboot_instance()
+        tracker.wait()
@@ -0,0 +1,192 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Persistent caches shared between argus processes."""
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from argus import util
+
+
+__all__ = (
+    'ExpiringCache',
+    'FileCache',
+    'get_cache_path',
+)
+
+LOG = util.get_logger()
+# The cache files are readable only by their owner.
+PRIVATE_MODE = 0o600
+
+
+def get_cache_path(conf, name):
+    """Get the path of the cache file *name*, creating its directory."""
+    directory = conf.argus.cache_directory
+    try:
+        os.makedirs(directory)
+    except OSError:
+        pass
+    return os.path.join(directory, name)
+
+
+class FileCache(object):
+    """A mapping persisted as a JSON file.
+
+    The file is guarded by an advisory lock, so the same cache
+    can be used by multiple threads and multiple argus processes
+    at the same time. Every modification should be done through
+    :meth:`transaction`, which gives exclusive access to the data
+    and writes it back when the block finishes.
+
+    :param path:
+        The location of the file where the data is kept.
+    """
+
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, path):
+        self._path = path
+        with self._thread_locks_guard:
+            self._thread_lock = self._thread_locks.setdefault(
+                os.path.abspath(path), threading.RLock())
+
+    @property
+    def path(self):
+        return self._path
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            with open(self._path + ".lock", "a") as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self._path) as stream:
+                return json.load(stream)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            LOG.warning("Cache file %s is corrupted, ignoring it.",
+                        self._path)
+            return {}
+
+    def _write(self, data):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        # Some caches hold secrets, such as the keystone tokens and
+        # the passwords of the reaper's manifests.
+        os.chmod(tmp, PRIVATE_MODE)
+        with os.fdopen(fd, "w") as stream:
+            json.dump(data, stream, indent=2, sort_keys=True)
+        os.rename(tmp, self._path)
+
+    def load(self):
+        """Get a snapshot of the cache's content."""
+        with self._locked():
+            return self._read()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Give exclusive access to the cache's content.
+
+        The yielded dictionary can be modified in place and it will
+        be saved when the block exits without an error.
+        """
+        with self._locked():
+            data = self._read()
+            yield data
+            self._write(data)
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def set(self, key, value):
+        with self.transaction() as data:
+            data[key] = value
+
+    def pop(self, key, default=None):
+        with self.transaction() as data:
+            return data.pop(key, default)
+
+
+class ExpiringCache(object):
+    """A :class:`FileCache` whose entries have their own expiry.
+
+    The entries are memoized in the process as well, so a valid
+    one is read from the disk only once.
+
+    :param path:
+        The file where the entries are persisted.
+    :param margin:
+        How many seconds before their expiry the entries
+        are no longer handed out.
+    """
+
+    def __init__(self, path, margin=0):
+        self._cache = FileCache(path)
+        self._margin = margin
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry):
+        return (entry is not None and
+                entry['expires'] - self._margin > time.time())
+
+    def get(self, key):
+        """Get the value of *key*, None if it is missing or expiring."""
+        with self._lock:
+            entry = self._memory.get(key)
+        if not self._fresh(entry):
+            entry = self._cache.get(key)
+            if not self._fresh(entry):
+                return None
+            with self._lock:
+                self._memory[key] = entry
+        return entry['value']
+
+    def set(self, key, value, expires):
+        """Remember *value* for *key*, until the *expires* timestamp."""
+        entry = {'value': value, 'expires': expires}
+        with self._lock:
+            self._memory[key] = entry
+        now = time.time()
+        with self._cache.transaction() as data:
+            for stale in [name for name, item in data.items()
+                          if item['expires'] < now]:
+                del data[stale]
+            data[key] = entry
+
+    def forget(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        self._cache.pop(key)
@@ -0,0 +1,112 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Facts about an image which don't change between its instances.
+
+Things such as the OS architecture, the OS version or the location
+where cloudbaseinit gets installed are the same for every instance
+booted from an image, so they are discovered once and persisted,
+instead of being probed again by every scenario.
+"""
+
+from argus import cache
+from argus import util
+
+
+__all__ = (
+    'ImageCapabilities',
+    'get_image_capabilities',
+)
+
+LOG = util.get_logger()
+CACHE_FILE = "capabilities.json"
+
+
+class ImageCapabilities(object):
+    """Persistent cache of the facts discovered about an image.
+
+    There are two kinds of facts, the ones which depend only on
+    the image and the ones which depend on the installed
+    cloudbaseinit as well, such as the installation directory,
+    which depends on the installer's architecture.
+
+    :param path:
+        The file where the facts are persisted.
+    :param image_key:
+        Identifies the image.
+    :param install_key:
+        Identifies the image together with the cloudbaseinit installer.
+    """
+
+    def __init__(self, path, image_key, install_key):
+        self._cache = cache.FileCache(path)
+        self._image_key = image_key
+        self._install_key = install_key
+        # Facts already validated against the current instance.
+        self._validated = set()
+
+    def _key(self, per_install):
+        return self._install_key if per_install else self._image_key
+
+    def lookup(self, name, per_install=False):
+        """Get the value of the fact *name* or None if it isn't known."""
+        facts = self._cache.get(self._key(per_install), {})
+        return facts.get(name)
+
+    def store(self, name, value, per_install=False):
+        """Remember *value* for the fact *name*."""
+        with self._cache.transaction() as data:
+            data.setdefault(self._key(per_install), {})[name] = value
+
+    def forget(self, name, per_install=False):
+        self._validated.discard((name, per_install))
+        with self._cache.transaction() as data:
+            data.get(self._key(per_install), {}).pop(name, None)
+
+    def get(self, name, discover, validate=None, per_install=False):
+        """Get the fact *name*, discovering it if needed.
+
+        :param discover:
+            A callable which finds out the value of the fact.
+        :param validate:
+            An optional callable, which receives the known value and
+            tells if it can still be used. It should be cheaper than
+            *discover*, otherwise there's no point in caching the fact.
+            A fact is validated only once by the same object.
+        """
+        value = self.lookup(name, per_install)
+        if value is not None:
+            if ((name, per_install) in self._validated or
+                    validate is None or validate(value)):
+                self._validated.add((name, per_install))
+                return value
+            LOG.debug("The cached %r for %r is invalid", value, name)
+
+        value = discover()
+        if value is not None:
+            self.store(name, value, per_install)
+            self._validated.add((name, per_install))
+        return value
+
+
+def get_image_capabilities(conf):
+    """Get the capabilities cache for the configured image, if enabled."""
+    if not conf.argus.capabilities_cache:
+        return None
+    image_key = conf.openstack.image_ref
+    install_key = "{}/{}/{}".format(image_key, conf.argus.build,
+                                    conf.argus.arch)
+    return ImageCapabilities(cache.get_cache_path(conf, CACHE_FILE),
+                             image_key, install_key)
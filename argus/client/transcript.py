@@ -0,0 +1,268 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Record the commands run on the instances and replay them.
+
+When recording, every command run by a :class:`RecordingRemoteClient`
+is written to a transcript, with its output, its exit code and its
+duration. A :class:`ReplayRemoteClient` answers the same commands
+from the transcript, without any instance, so the recipes and the
+introspection can be run and profiled offline. Together with a
+replayed :mod:`argus.backends.tempest.cassette`, a whole scenario
+runs without a cloud.
+"""
+
+import atexit
+import importlib
+import re
+import threading
+import time
+
+import six
+
+from argus.client import windows
+from argus import cache
+from argus import exceptions
+from argus import util
+
+
+__all__ = (
+    'RecordingRemoteClient',
+    'ReplayRemoteClient',
+    'Transcript',
+    'TranscriptError',
+    'get_transcript',
+)
+
+LOG = util.get_logger()
+RECORD = 'record'
+REPLAY = 'replay'
+# The parts of a command which change from run to run, such as the
+# numbers of util.rand_name, the timestamps and the uuids.
+VARIABLE_PARTS = re.compile(
+    r'[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}|\d+')
+
+
+class TranscriptError(exceptions.ArgusError):
+    """The transcript doesn't have the answer of a command."""
+
+
+def _skeleton(command):
+    """Get *command* without the parts which change between runs."""
+    return VARIABLE_PARTS.sub('#', command)
+
+
+def _rebuild_error(error):
+    """Get an exception of the recorded class, with the recorded message."""
+    try:
+        module = importlib.import_module(error['module'])
+        error_class = getattr(module, error['type'])
+    except (ImportError, AttributeError):
+        return TranscriptError("Recorded {module}.{type}: {message}"
+                               .format(**error))
+    try:
+        return error_class(error['message'])
+    except TypeError:
+        # The exception takes other arguments, but only its class
+        # and its message matter to the callers.
+        exc = error_class.__new__(error_class)
+        exc.args = (error['message'], )
+        return exc
+
+
+class Transcript(object):
+    """The commands run on the instances, persisted as a JSON file.
+
+    :param path:
+        The location of the transcript. The commands recorded by every
+        argus process using the same transcript are appended to it.
+    :param mode:
+        Either ``record`` or ``replay``.
+    :param speed:
+        When replaying, how many times faster than recorded the
+        commands finish, 0 for finishing them instantly.
+    """
+
+    def __init__(self, path, mode=RECORD, speed=0):
+        if mode not in (RECORD, REPLAY):
+            raise exceptions.ArgusError(
+                "Unknown transcript mode {!r}".format(mode))
+        self._file = cache.FileCache(path)
+        self._mode = mode
+        self._speed = speed
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._commands = []
+        # The last entry given for a command, which is given again
+        # when the transcript runs out of them, as for polling.
+        self._last = {}
+        if mode == REPLAY:
+            self._commands = self._file.load().get('commands')
+            if not self._commands:
+                raise TranscriptError("Transcript {} is empty".format(path))
+        self._pending = list(range(len(self._commands)))
+
+    @property
+    def path(self):
+        return self._file.path
+
+    @property
+    def replaying(self):
+        return self._mode == REPLAY
+
+    def record(self, hostname, command, stdout, stderr, exit_code,
+               started, duration, error=None):
+        """Remember a command which was run on *hostname*.
+
+        :param error:
+            The exception raised by the transport instead of giving
+            the result of the command, as when the instance restarts
+            while running it. It is raised again when replaying.
+        """
+        # The output is bytes with some versions of pywinrm,
+        # which is given back as such when replaying.
+        binary = isinstance(stdout, six.binary_type)
+        if binary:
+            stdout = stdout.decode('utf-8', 'replace')
+            stderr = stderr.decode('utf-8', 'replace')
+        entry = {
+            'hostname': hostname,
+            'command': command,
+            'stdout': stdout,
+            'stderr': stderr,
+            'binary': binary,
+            'exit_code': exit_code,
+            'offset': started - self._start,
+            'duration': duration,
+        }
+        if error is not None:
+            entry['error'] = {
+                'module': type(error).__module__,
+                'type': type(error).__name__,
+                'message': str(error),
+            }
+        with self._lock:
+            self._commands.append(entry)
+
+    def _find(self, command):
+        """Find the recorded entry of *command*.
+
+        The pending entries are searched in their recorded order,
+        first for the same command and then for one differing only
+        by the parts matched by :data:`VARIABLE_PARTS`.
+        """
+        skeleton = _skeleton(command)
+        with self._lock:
+            for matches in (command.__eq__,
+                            lambda other: _skeleton(other) == skeleton):
+                for index in self._pending:
+                    if matches(self._commands[index]['command']):
+                        self._pending.remove(index)
+                        self._last[skeleton] = index
+                        return self._commands[index]
+            index = self._last.get(skeleton)
+        if index is None:
+            raise TranscriptError(
+                "No recorded answer for command {!r}".format(command))
+        return self._commands[index]
+
+    def replay(self, command):
+        """Get the recorded stdout, stderr and exit code of *command*.
+
+        If the command failed with a transport error, the same kind
+        of exception is raised instead.
+        """
+        entry = self._find(command)
+        if self._speed:
+            time.sleep(entry['duration'] / self._speed)
+        if entry.get('error'):
+            raise _rebuild_error(entry['error'])
+        stdout, stderr = entry['stdout'], entry['stderr']
+        if entry['binary']:
+            stdout, stderr = stdout.encode('utf-8'), stderr.encode('utf-8')
+        return stdout, stderr, entry['exit_code']
+
+    def client(self, hostname, username, password, **kwargs):
+        """Get a remote client recording or replaying this transcript."""
+        client_class = (ReplayRemoteClient if self.replaying
+                        else RecordingRemoteClient)
+        return client_class(hostname, username, password, self, **kwargs)
+
+    def save(self):
+        """Append the commands recorded so far to the transcript."""
+        if self.replaying:
+            return
+        with self._lock:
+            commands, self._commands = self._commands, []
+        if not commands:
+            return
+        with self._file.transaction() as data:
+            data.setdefault('commands', []).extend(commands)
+        LOG.info("Recorded %d remote commands to %s", len(commands),
+                 self.path)
+
+
+class RecordingRemoteClient(windows.WinRemoteClient):
+    """A remote client writing every command it runs to a transcript."""
+
+    def __init__(self, hostname, username, password, transcript, **kwargs):
+        super(RecordingRemoteClient, self).__init__(hostname, username,
+                                                    password, **kwargs)
+        self._transcript = transcript
+
+    def _run_command(self, protocol_client, shell_id, command):
+        started = time.time()
+        try:
+            stdout, stderr, exit_code = self._execute(protocol_client,
+                                                      shell_id, command)
+        except Exception as exc:
+            self._transcript.record(self._address, command, None, None,
+                                    None, started, time.time() - started,
+                                    error=exc)
+            raise
+        self._transcript.record(self._address, command, stdout, stderr,
+                                exit_code, started, time.time() - started)
+        return self._check_result(command, stdout, stderr, exit_code)
+
+
+class ReplayRemoteClient(windows.WinRemoteClient):
+    """A remote client answering the commands from a transcript."""
+
+    def __init__(self, hostname, username, password, transcript, **kwargs):
+        super(ReplayRemoteClient, self).__init__(hostname, username,
+                                                 password, **kwargs)
+        self._transcript = transcript
+
+    def _run_commands(self, commands):
+        return [self._check_result(command, *self._transcript.replay(command))
+                for command in commands]
+
+    def _probe_port(self):
+        return True
+
+    def _probe_auth(self):
+        return True
+
+
+@util.run_once
+def get_transcript(conf):
+    """Get the transcript of this process, if one is configured."""
+    if not conf.argus.remote_transcript:
+        return None
+    transcript = Transcript(conf.argus.remote_transcript,
+                            conf.argus.remote_transcript_mode,
+                            conf.argus.remote_replay_speed)
+    atexit.register(transcript.save)
+    return transcript
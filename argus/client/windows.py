@@ -17,6 +17,7 @@
 
 import base64
 import functools
+import socket
 import time
 
 import six
@@ -29,6 +30,12 @@ from argus import util
 
 LOG = util.get_logger()
 
+# Timeout in seconds for checking that the WinRM port is open.
+PORT_PROBE_TIMEOUT = 1
+# Initial and maximum delays between the probes of a readiness stage.
+PORT_PROBE_BACKOFF = (0.25, 5)
+AUTH_PROBE_BACKOFF = (1, 10)
+
 
 def _base64_read_file(filepath, size=8192):
     with open(filepath, 'rb') as stream:
@@ -41,6 +48,24 @@ def _base64_read_file(filepath, size=8192):
             yield encoded
 
 
+class _Backoff(object):
+    """An escalating delay, between *initial* and *maximum* seconds."""
+
+    def __init__(self, initial, maximum, factor=2):
+        self._initial = initial
+        self._maximum = maximum
+        self._factor = factor
+        self._current = initial
+
+    def next(self):
+        delay = self._current
+        self._current = min(self._current * self._factor, self._maximum)
+        return delay
+
+    def reset(self):
+        self._current = self._initial
+
+
 class WinRemoteClient(base.BaseClient):
     """Get a remote client to a Windows instance.
 
@@ -59,36 +84,50 @@ class WinRemoteClient(base.BaseClient):
                  transport_protocol='http',
                  cert_pem=None, cert_key=None):
         super(WinRemoteClient, self).__init__(hostname)
+        self._address = hostname
+        self._port = 5985 if transport_protocol == 'http' else 5986
         self._hostname = "{protocol}://{hostname}:{port}/wsman".format(
             protocol=transport_protocol,
             hostname=hostname,
-            port=5985 if transport_protocol == 'http' else 5986)
+            port=self._port)
         self._username = username
         self._password = password
         self._cert_pem = cert_pem
         self._cert_key = cert_key
+        self._ready = False
+        self._port_backoff = _Backoff(*PORT_PROBE_BACKOFF)
+        self._auth_backoff = _Backoff(*AUTH_PROBE_BACKOFF)
 
     @staticmethod
-    def _run_command(protocol_client, shell_id, command):
+    def _check_result(command, stdout, stderr, exit_code):
+        """Return the result of *command*, raising if it failed."""
+        if exit_code:
+            output = "\n\n".join([out for out in (stdout, stderr) if out])
+            raise exceptions.ArgusError(
+                "Executing command {command!r} failed with "
+                "exit code {exit_code!r} and output {output!r}."
+                .format(command=command,
+                        exit_code=exit_code,
+                        output=output))
+        return stdout, stderr, exit_code
+
+    @staticmethod
+    def _execute(protocol_client, shell_id, command):
+        """Run *command* in the shell, whatever its exit code."""
         command_id = None
         try:
             command_id = protocol_client.run_command(shell_id, command)
-            stdout, stderr, exit_code = protocol_client.get_command_output(
-                shell_id, command_id)
-            if exit_code:
-                output = "\n\n".join([out for out in (stdout, stderr) if out])
-                raise exceptions.ArgusError(
-                    "Executing command {command!r} failed with "
-                    "exit code {exit_code!r} and output {output!r}."
-                    .format(command=command,
-                            exit_code=exit_code,
-                            output=output))
-
-            return stdout, stderr, exit_code
+            return protocol_client.get_command_output(shell_id, command_id)
         finally:
             protocol_client.cleanup_command(shell_id, command_id)
 
+    def _run_command(self, protocol_client, shell_id, command):
+        stdout, stderr, exit_code = self._execute(protocol_client, shell_id,
+                                                  command)
+        return self._check_result(command, stdout, stderr, exit_code)
+
     def _run_commands(self, commands):
+        """Run the commands in a single shell, the only way to the remote."""
         protocol_client = self._get_protocol()
         shell_id = protocol_client.open_shell()
         try:
@@ -107,6 +146,78 @@ class WinRemoteClient(base.BaseClient):
                                  cert_pem=self._cert_pem,
                                  cert_key_pem=self._cert_key)
 
+    def _probe_port(self):
+        """Check that something listens on the WinRM port."""
+        try:
+            sock = socket.create_connection((self._address, self._port),
+                                            timeout=PORT_PROBE_TIMEOUT)
+        except (socket.error, socket.timeout):
+            return False
+        sock.close()
+        return True
+
+    def _probe_auth(self):
+        """Check that WinRM accepts our credentials, without running anything."""
+        try:
+            protocol_client = self._get_protocol()
+            shell_id = protocol_client.open_shell()
+            protocol_client.close_shell(shell_id)
+        except Exception as exc:
+            LOG.debug("WinRM is not ready yet: %r", exc)
+            return False
+        return True
+
+    def is_reachable(self):
+        """Check that the WinRM port of the remote is open."""
+        return self._probe_port()
+
+    def mark_not_ready(self):
+        """Go through the readiness probes again before the next command.
+
+        Useful when the remote is known to be restarting.
+        """
+        self._ready = False
+
+    def wait_until_ready(self, timeout):
+        """Wait at most *timeout* seconds for the remote to accept commands.
+
+        The readiness is checked with increasingly expensive probes,
+        first that the WinRM port is open and then that a shell can
+        be opened with our credentials. Each stage has its own backoff,
+        so a guest which isn't reachable yet costs only a TCP connect
+        per probe, instead of a full WinRM timeout.
+        Return True if the remote is ready, False otherwise.
+        """
+        if self._ready:
+            return True
+
+        deadline = time.time() + timeout
+        stages = ((self._probe_port, self._port_backoff),
+                  (self._probe_auth, self._auth_backoff))
+        for probe, backoff in stages:
+            while not probe():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(backoff.next(), remaining))
+            backoff.reset()
+
+        self._ready = True
+        return True
+
+    def _run_when_ready(self, cmd, timeout):
+        if not self.wait_until_ready(timeout):
+            raise exceptions.ArgusTimeoutError(
+                "The remote {} is not ready.".format(self._hostname))
+        try:
+            return self.run_command(cmd)
+        except exceptions.ArgusError:
+            # The command was executed, so the remote is fine.
+            raise
+        except Exception:
+            self._ready = False
+            raise
+
     def run_remote_cmd(self, cmd):
         """Run the given remote command.
 
@@ -190,7 +301,7 @@ class WinRemoteClient(base.BaseClient):
 
         while True:
             try:
-                return self.run_command(cmd)
+                return self._run_when_ready(cmd, delay)
             except Exception as exc:  # pylint: disable=broad-except
                 LOG.debug("Command failed with %r.", exc)
                 # A negative `count` means no count at all.
@@ -201,7 +312,9 @@ class WinRemoteClient(base.BaseClient):
                         "Command {!r} failed too many times."
                         .format(cmd))
                 LOG.debug("Retrying...")
-                time.sleep(delay)
+                if self._ready:
+                    # Otherwise the readiness probes are doing the waiting.
+                    time.sleep(delay)
 
     def run_command_until_condition(self, cmd, cond,
                                     retry_count=util.RETRY_COUNT,
@@ -225,7 +338,7 @@ class WinRemoteClient(base.BaseClient):
 
         while True:
             try:
-                stdout, stderr, _ = self.run_command(cmd)
+                stdout, stderr, _ = self._run_when_ready(cmd, delay)
             except Exception as exc:  # pylint: disable=broad-except
                 LOG.debug("Command failed with %r.", exc)
             else:
@@ -241,7 +354,9 @@ class WinRemoteClient(base.BaseClient):
             if retry_count > 0:
                 retry_count -= 1
                 LOG.debug("Retrying...")
-                time.sleep(delay)
+                if self._ready:
+                    # Otherwise the readiness probes are doing the waiting.
+                    time.sleep(delay)
             else:
                 raise exceptions.ArgusTimeoutError(
                     "Command {!r} failed too many times."
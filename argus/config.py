@@ -41,6 +41,27 @@ def _get_default(parser, section, option, default=None):
         return default
 
 
+def _get_default_int(parser, section, option, default=None):
+    try:
+        return parser.getint(section, option)
+    except six.moves.configparser.NoOptionError:
+        return default
+
+
+def _get_default_float(parser, section, option, default=None):
+    try:
+        return parser.getfloat(section, option)
+    except six.moves.configparser.NoOptionError:
+        return default
+
+
+def _get_default_bool(parser, section, option, default=False):
+    try:
+        return parser.getboolean(section, option)
+    except six.moves.configparser.NoOptionError:
+        return default
+
+
 class ConfigurationParser(object):
     """A parser class which knows how to parse argus configurations."""
 
@@ -56,7 +77,31 @@ class ConfigurationParser(object):
                                        'resources pause '
                                        'file_log log_format dns_nameservers '
                                        'output_directory build arch '
-                                       'patch_install git_command')
+                                       'patch_install git_command '
+                                       'cache_directory golden_images '
+                                       'golden_images_max '
+                                       'golden_images_max_age '
+                                       'boot_console_marker '
+                                       'cbinit_console_marker '
+                                       'console_poll_interval '
+                                       'capabilities_cache '
+                                       'async_cleanup reaper_workers '
+                                       'instance_pool_size '
+                                       'instance_pool_max_in_flight '
+                                       'tenant_pool_size edge_pool_size '
+                                       'console_collector '
+                                       'console_collector_max_interval '
+                                       'console_log_max_bytes '
+                                       'console_log_compress '
+                                       'heat_stack_reuse tempest_rebuild '
+                                       'instance_pool_batch '
+                                       'api_rate_limit api_rate_burst '
+                                       'token_cache lookup_cache_ttl '
+                                       'api_client api_cassette '
+                                       'api_cassette_mode api_replay_speed '
+                                       'remote_transcript '
+                                       'remote_transcript_mode '
+                                       'remote_replay_speed')
         resources = _get_default(
             self._parser, 'argus', 'resources',
             'https://raw.githubusercontent.com/PCManticore/'
@@ -75,10 +120,89 @@ class ConfigurationParser(object):
         arch = _get_default(self._parser, 'argus', 'arch', 'x64')
         patch_install = _get_default(self._parser, 'argus', 'patch_install')
         git_command = _get_default(self._parser, 'argus', 'git_command')
+        cache_directory = _get_default(self._parser, 'argus',
+                                       'cache_directory', '.argus')
+        golden_images = _get_default_bool(self._parser, 'argus',
+                                          'golden_images')
+        golden_images_max = _get_default_int(self._parser, 'argus',
+                                             'golden_images_max', 5)
+        golden_images_max_age = _get_default_int(
+            self._parser, 'argus', 'golden_images_max_age', 7 * 24 * 3600)
+        boot_console_marker = _get_default(self._parser, 'argus',
+                                           'boot_console_marker')
+        cbinit_console_marker = _get_default(
+            self._parser, 'argus', 'cbinit_console_marker',
+            'argus: cloudbaseinit finished normal')
+        console_poll_interval = _get_default_int(
+            self._parser, 'argus', 'console_poll_interval', 5)
+        capabilities_cache = _get_default_bool(
+            self._parser, 'argus', 'capabilities_cache', True)
+        async_cleanup = _get_default_bool(self._parser, 'argus',
+                                          'async_cleanup')
+        reaper_workers = _get_default_int(self._parser, 'argus',
+                                          'reaper_workers', 4)
+        instance_pool_size = _get_default_int(self._parser, 'argus',
+                                              'instance_pool_size', 0)
+        instance_pool_max_in_flight = _get_default_int(
+            self._parser, 'argus', 'instance_pool_max_in_flight', 2)
+        tenant_pool_size = _get_default_int(self._parser, 'argus',
+                                            'tenant_pool_size', 0)
+        edge_pool_size = _get_default_int(self._parser, 'argus',
+                                          'edge_pool_size', 0)
+        console_collector = _get_default_bool(self._parser, 'argus',
+                                              'console_collector')
+        console_collector_max_interval = _get_default_int(
+            self._parser, 'argus', 'console_collector_max_interval', 60)
+        console_log_max_bytes = _get_default_int(
+            self._parser, 'argus', 'console_log_max_bytes', 10 * 1024 * 1024)
+        console_log_compress = _get_default_bool(self._parser, 'argus',
+                                                 'console_log_compress')
+        heat_stack_reuse = _get_default_bool(self._parser, 'argus',
+                                             'heat_stack_reuse')
+        tempest_rebuild = _get_default_bool(self._parser, 'argus',
+                                            'tempest_rebuild')
+        instance_pool_batch = _get_default_bool(self._parser, 'argus',
+                                                'instance_pool_batch')
+        api_rate_limit = _get_default_int(self._parser, 'argus',
+                                          'api_rate_limit', 0)
+        api_rate_burst = _get_default_int(self._parser, 'argus',
+                                          'api_rate_burst', 10)
+        token_cache = _get_default_bool(self._parser, 'argus',
+                                        'token_cache', True)
+        lookup_cache_ttl = _get_default_int(self._parser, 'argus',
+                                            'lookup_cache_ttl', 3600)
+        api_client = _get_default(self._parser, 'argus', 'api_client',
+                                  'tempest')
+        api_cassette = _get_default(self._parser, 'argus', 'api_cassette')
+        api_cassette_mode = _get_default(self._parser, 'argus',
+                                         'api_cassette_mode', 'record')
+        api_replay_speed = _get_default_float(self._parser, 'argus',
+                                              'api_replay_speed', 0)
+        remote_transcript = _get_default(self._parser, 'argus',
+                                         'remote_transcript')
+        remote_transcript_mode = _get_default(self._parser, 'argus',
+                                              'remote_transcript_mode',
+                                              'record')
+        remote_replay_speed = _get_default_float(self._parser, 'argus',
+                                                 'remote_replay_speed', 0)
 
         return argus(resources, pause, file_log, log_format,
                      dns_nameservers, output_directory, build, arch,
-                     patch_install, git_command)
+                     patch_install, git_command, cache_directory,
+                     golden_images, golden_images_max,
+                     golden_images_max_age, boot_console_marker,
+                     cbinit_console_marker, console_poll_interval,
+                     capabilities_cache, async_cleanup, reaper_workers,
+                     instance_pool_size, instance_pool_max_in_flight,
+                     tenant_pool_size, edge_pool_size, console_collector,
+                     console_collector_max_interval, console_log_max_bytes,
+                     console_log_compress, heat_stack_reuse,
+                     tempest_rebuild, instance_pool_batch,
+                     api_rate_limit, api_rate_burst, token_cache,
+                     lookup_cache_ttl, api_client, api_cassette,
+                     api_cassette_mode, api_replay_speed,
+                     remote_transcript, remote_transcript_mode,
+                     remote_replay_speed)
 
     @property
     def cloudbaseinit(self):
@@ -0,0 +1,182 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache of golden images, instances already prepared by a recipe.
+
+Preparing an instance for testing cloudbaseinit is the most
+expensive part of a scenario and it is identical for every scenario
+which uses the same image, installer and recipe. A golden image
+is a snapshot taken right before sysprepping, which can be used
+for booting new instances, skipping the preparation steps.
+"""
+
+import hashlib
+import os
+import time
+
+from argus import cache
+from argus import util
+
+
+__all__ = (
+    'GoldenImages',
+    'get_golden_images',
+)
+
+LOG = util.get_logger()
+CACHE_FILE = "golden_images.json"
+
+
+def _qualified_name(klass):
+    return "{}.{}".format(klass.__module__, klass.__name__)
+
+
+def _patch_bundle_hash(link):
+    """Get a hash for the patch bundle given through *patch_install*.
+
+    If the bundle is accessible locally, then its content is hashed,
+    otherwise the link itself identifies the bundle.
+    """
+    if not link:
+        return None
+    digest = hashlib.sha1()
+    if os.path.isfile(link):
+        with open(link, 'rb') as stream:
+            for chunk in iter(lambda: stream.read(65536), b''):
+                digest.update(chunk)
+    else:
+        digest.update(link.encode())
+    return digest.hexdigest()
+
+
+class GoldenImages(object):
+    """Keep track of the golden images created by argus.
+
+    :param conf:
+        The argus configuration object.
+    :param path:
+        The file where the known golden images are stored.
+    :param max_size:
+        How many golden images can exist at the same time. When this
+        number is exceeded, the least recently used ones are evicted.
+    :param max_age:
+        The number of seconds after which a golden image is considered
+        stale and it is evicted.
+    """
+
+    def __init__(self, conf, path, max_size, max_age):
+        self._conf = conf
+        self._cache = cache.FileCache(path)
+        self._max_size = max_size
+        self._max_age = max_age
+
+    def key(self, recipe_type, service_type=None):
+        """Get the key of the golden image for the given recipe type.
+
+        The *service_type* given to the recipe is part of the key,
+        since it is written into the configuration of cloudbaseinit,
+        and so is what the recipe type itself writes into the image,
+        as given by its ``golden_image_key`` class method.
+        """
+        parts = (
+            self._conf.openstack.image_ref,
+            self._conf.argus.build,
+            self._conf.argus.arch,
+            _qualified_name(recipe_type),
+            service_type,
+            recipe_type.golden_image_key(),
+            _patch_bundle_hash(self._conf.argus.patch_install),
+            self._conf.argus.git_command,
+        )
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def _is_stale(self, entry, now):
+        return now - entry['created'] > self._max_age
+
+    def lookup(self, recipe_type, service_type=None):
+        """Get the golden image id for the given recipe type, if any."""
+        key = self.key(recipe_type, service_type)
+        now = time.time()
+        with self._cache.transaction() as images:
+            entry = images.get(key)
+            if not entry or self._is_stale(entry, now):
+                return None
+            entry['last_used'] = now
+            return entry['image_id']
+
+    def register(self, recipe_type, image_id, delete_image,
+                 service_type=None):
+        """Register a new golden image for the given recipe type.
+
+        :param delete_image:
+            A callable, which receives an image id, used for
+            destroying the images which are evicted from the cache.
+        :param service_type:
+            The service type the recipe prepared the instance for.
+        """
+        key = self.key(recipe_type, service_type)
+        now = time.time()
+        with self._cache.transaction() as images:
+            previous = images.pop(key, None)
+            images[key] = {
+                'image_id': image_id,
+                'recipe': _qualified_name(recipe_type),
+                'service_type': service_type,
+                'created': now,
+                'last_used': now,
+            }
+            evicted = self._evict(images, now)
+        if previous and previous['image_id'] != image_id:
+            evicted.append(previous)
+
+        for entry in evicted:
+            LOG.info("Evicting golden image %s", entry['image_id'])
+            try:
+                delete_image(entry['image_id'])
+            except Exception as exc:
+                LOG.warning("Could not delete golden image %s: %r",
+                            entry['image_id'], exc)
+
+    def _evict(self, images, now):
+        evicted = [images.pop(key) for key, entry in list(images.items())
+                   if self._is_stale(entry, now)]
+        by_usage = sorted(images, key=lambda key: images[key]['last_used'])
+        while len(images) > self._max_size:
+            evicted.append(images.pop(by_usage.pop(0)))
+        return evicted
+
+    def forget(self, recipe_type, image_id, service_type=None):
+        """Remove the golden image of the given recipe type from the cache.
+
+        It is removed only if it is still *image_id*, since another
+        process could have registered a new one meanwhile. Return
+        True if it was removed.
+        """
+        key = self.key(recipe_type, service_type)
+        with self._cache.transaction() as images:
+            entry = images.get(key)
+            if not entry or entry['image_id'] != image_id:
+                return False
+            del images[key]
+        return True
+
+
+def get_golden_images(conf):
+    """Get the golden images cache, if it is enabled through the config."""
+    if not conf.argus.golden_images:
+        return None
+    return GoldenImages(conf, cache.get_cache_path(conf, CACHE_FILE),
+                        conf.argus.golden_images_max,
+                        conf.argus.golden_images_max_age)
@@ -0,0 +1,109 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Share the keystone tokens and the version discovery between backends.
+
+Authenticating and discovering the identity API versions is done
+by every backend, for every scenario, although the results are the
+same as long as the tokens are valid. They are kept in a cache,
+keyed by the auth URL and a digest of the credentials, which is
+shared by all the argus processes using the same cache directory.
+The credentials themselves aren't persisted, but the tokens are,
+so the cache file is readable only by its owner.
+"""
+
+import calendar
+import datetime
+import hashlib
+import json
+import os
+import time
+
+from argus import cache
+from argus import util
+
+
+__all__ = (
+    'TokenCache',
+    'cache_key',
+    'get_token_cache',
+    'parse_expiry',
+)
+
+LOG = util.get_logger()
+CACHE_FILE = "tokens.json"
+# The tokens which expire sooner than this aren't handed out.
+STALE_SECONDS = 300
+DISCOVERY_TTL = 24 * 3600
+EXPIRY_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def cache_key(kind, auth_url, credentials=None):
+    """Get the key of an entry, without exposing the credentials.
+
+    :param kind:
+        What the entry holds, for instance the tokens of a given client.
+    :param credentials:
+        A JSON serializable object with the credentials.
+    """
+    blob = json.dumps([kind, auth_url, credentials], sort_keys=True)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def parse_expiry(value):
+    """Get the timestamp of an ISO 8601 expiry, as given by keystone."""
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    value = value.rstrip('Z').split('.')[0]
+    expiry = datetime.datetime.strptime(value, EXPIRY_FORMAT)
+    return calendar.timegm(expiry.utctimetuple())
+
+
+class TokenCache(cache.ExpiringCache):
+    """Cache of identity data, each entry with its own expiry.
+
+    :param path:
+        The file where the entries are persisted.
+    """
+
+    def __init__(self, path):
+        super(TokenCache, self).__init__(path, margin=STALE_SECONDS)
+        # The tokens can be used in place of the credentials, the
+        # file is made private even if it wasn't written by argus.
+        if os.path.exists(path):
+            os.chmod(path, cache.PRIVATE_MODE)
+
+    def discovery(self, auth_url, discover):
+        """Get the result of the version discovery for *auth_url*.
+
+        :param discover:
+            A callable doing the discovery, which is called only
+            if its result isn't known. The result has to be JSON
+            serializable.
+        """
+        key = cache_key('discovery', auth_url)
+        value = self.get(key)
+        if value is None:
+            value = discover()
+            self.set(key, value, time.time() + DISCOVERY_TTL)
+        return value
+
+
+@util.run_once
+def get_token_cache(conf):
+    """Get the token cache of this process, if it is enabled."""
+    if not conf.argus.token_cache:
+        return None
+    return TokenCache(cache.get_cache_path(conf, CACHE_FILE))
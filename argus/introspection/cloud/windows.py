@@ -22,6 +22,7 @@ import re
 import shutil
 import tempfile
 
+from argus import capabilities as image_capabilities
 from argus.introspection.cloud import base
 from argus import exceptions
 from argus import util
@@ -123,41 +124,72 @@ def _get_nic_details(details):
     return NICDetails(**nic_details)
 
 
-def get_cbinit_dir(execute_function):
+def _path_exists(execute_function, path):
+    status = execute_function(
+        'powershell Test-Path "{}"'.format(escape_path(path)))
+    return status.strip().lower() == "true"
+
+
+def _cached(capabilities, name, discover, validate=None, per_install=False):
+    if capabilities is None:
+        return discover()
+    return capabilities.get(name, discover, validate=validate,
+                            per_install=per_install)
+
+
+def get_os_architecture(execute_function, capabilities=None):
+    """Get the architecture of the instance's OS, e.g. *64-bit*."""
+    def discover():
+        stdout = execute_function(
+            'powershell "(Get-WmiObject  Win32_OperatingSystem).'
+            'OSArchitecture"')
+        return stdout.strip()
+    return _cached(capabilities, 'os_architecture', discover)
+
+
+def get_program_files_dirs(execute_function, capabilities=None):
+    """Get the locations of the *Program Files* directories."""
+    def discover():
+        locations = [execute_function('powershell "$ENV:ProgramFiles"')]
+        architecture = get_os_architecture(execute_function, capabilities)
+        if architecture == '64-bit':
+            location = execute_function(
+                'powershell "${ENV:ProgramFiles(x86)}"')
+            locations.append(location)
+        return [location.strip() for location in locations]
+    return _cached(capabilities, 'program_files', discover)
+
+
+def get_cbinit_dir(execute_function, capabilities=None):
     """Get the location of cloudbase-init from the instance."""
-    stdout = execute_function(
-        'powershell "(Get-WmiObject  Win32_OperatingSystem).'
-        'OSArchitecture"')
-    architecture = stdout.strip()
-
-    locations = [execute_function('powershell "$ENV:ProgramFiles"')]
-    if architecture == '64-bit':
-        location = execute_function(
-            'powershell "${ENV:ProgramFiles(x86)}"')
-        locations.append(location)
-
-    for location in locations:
-        location = location.strip()
-        _location = escape_path(location)
-        status = execute_function(
-            'powershell Test-Path "{}\\Cloudbase` Solutions"'.format(
-                _location)).strip().lower()
-
-        if status == "true":
-            return ntpath.join(
-                location,
-                "Cloudbase Solutions",
-                "Cloudbase-Init"
-            )
-
-    raise exceptions.ArgusError('cloudbase-init installation dir not found')
-
-
-def set_config_option(option, value, execute_function):
+    def discover():
+        for location in get_program_files_dirs(execute_function,
+                                               capabilities):
+            _location = escape_path(location)
+            status = execute_function(
+                'powershell Test-Path "{}\\Cloudbase` Solutions"'.format(
+                    _location)).strip().lower()
+
+            if status == "true":
+                return ntpath.join(
+                    location,
+                    "Cloudbase Solutions",
+                    "Cloudbase-Init"
+                )
+
+        raise exceptions.ArgusError(
+            'cloudbase-init installation dir not found')
+
+    return _cached(capabilities, 'cbinit_dir', discover,
+                   validate=lambda path: _path_exists(execute_function, path),
+                   per_install=True)
+
+
+def set_config_option(option, value, execute_function, capabilities=None):
     """Set the value for the given *option* to *value*."""
 
     line = "{} = {}".format(option, value)
-    cbdir = get_cbinit_dir(execute_function)
+    cbdir = get_cbinit_dir(execute_function, capabilities)
     conf = ntpath.join(cbdir, "conf", "cloudbase-init.conf")
 
     cmd = ('powershell "((Get-Content {0!r}) + {1!r}) |'
@@ -165,32 +197,49 @@ def set_config_option(option, value, execute_function):
     execute_function(cmd)
 
 
-def get_python_dir(execute_function):
+def get_python_dir(execute_function, capabilities=None):
     """Find python directory from the cb-init installation."""
-    cbinit_dir = get_cbinit_dir(execute_function)
-    command = 'dir "{}" /b'.format(cbinit_dir)
-    stdout = execute_function(command).strip()
-    names = list(filter(None, stdout.splitlines()))
-    for name in names:
-        if "python" in name.lower():
-            return ntpath.join(cbinit_dir, name)
+    def discover():
+        cbinit_dir = get_cbinit_dir(execute_function, capabilities)
+        command = 'dir "{}" /b'.format(cbinit_dir)
+        stdout = execute_function(command).strip()
+        names = list(filter(None, stdout.splitlines()))
+        for name in names:
+            if "python" in name.lower():
+                return ntpath.join(cbinit_dir, name)
+
+    return _cached(capabilities, 'python_dir', discover,
+                   validate=lambda path: _path_exists(execute_function, path),
+                   per_install=True)
 
 
-def get_cbinit_key(execute_function):
+def get_cbinit_key(execute_function, capabilities=None):
     """Get the proper registry key for Cloudbase-init."""
-    key = ("HKLM:SOFTWARE\\Cloudbase` Solutions\\"
-           "Cloudbase-init")
-    key_x64 = ("HKLM:SOFTWARE\\Wow6432Node\\Cloudbase` Solutions\\"
+    def discover():
+        key = ("HKLM:SOFTWARE\\Cloudbase` Solutions\\"
                "Cloudbase-init")
-    cmd = 'powershell "Test-Path {}"'.format(key)
-    if execute_function(cmd).strip().lower() == "true":
-        return key
-    return key_x64
+        key_x64 = ("HKLM:SOFTWARE\\Wow6432Node\\Cloudbase` Solutions\\"
+                   "Cloudbase-init")
+        cmd = 'powershell "Test-Path {}"'.format(key)
+        if execute_function(cmd).strip().lower() == "true":
+            return key
+        return key_x64
+
+    def validate(key):
+        cmd = 'powershell "Test-Path {}"'.format(key)
+        return execute_function(cmd).strip().lower() == "true"
+
+    return _cached(capabilities, 'cbinit_key', discover,
+                   validate=validate, per_install=True)
 
 
 class InstanceIntrospection(base.CloudInstanceIntrospection):
     """Utilities for introspecting a Windows instance."""
 
+    @util.cached_property
+    def _capabilities(self):
+        return image_capabilities.get_image_capabilities(self._conf)
+
     def get_disk_size(self):
         cmd = ('powershell (Get-WmiObject "win32_logicaldisk | '
                'where -Property DeviceID -Match C:").Size')
@@ -302,10 +351,13 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
          Return a tuple of two elements, the major and the minor
          version.
         """
-        cmd = "powershell (Get-CimInstance Win32_OperatingSystem).Version"
-        stdout = self.remote_client.run_command_verbose(cmd)
-        elems = stdout.split(".")
-        return list(map(int, elems))[:2]
+        def discover():
+            cmd = "powershell (Get-CimInstance Win32_OperatingSystem).Version"
+            stdout = self.remote_client.run_command_verbose(cmd)
+            elems = stdout.split(".")
+            return list(map(int, elems))[:2]
+
+        return _cached(self._capabilities, 'os_version', discover)
 
     def get_cloudconfig_executed_plugins(self):
         expected = {
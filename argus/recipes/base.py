@@ -64,6 +64,18 @@ class BaseRecipe(object):
         self._backend.remote_client.run_command_until_condition(
             cmd, cond, retry_count=count, delay=delay)
 
+    def _wait_console_event(self, event, timeout):
+        """Wait for an event from the instance's console output.
+
+        Return False if the event didn't fire in *timeout* seconds
+        or if the backend doesn't know about it, in which case the
+        caller should fall back to polling the instance.
+        """
+        watcher = getattr(self._backend, 'console', None)
+        if watcher is None or not watcher.has_event(event):
+            return False
+        return watcher.wait(event, timeout)
+
     @abc.abstractmethod
     def prepare(self, **kwargs):
         """Call this method to provision an instance.
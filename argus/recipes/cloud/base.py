@@ -19,6 +19,7 @@ import abc
 
 import six
 
+from argus import golden
 from argus.recipes import base
 from argus import util
 
@@ -84,6 +85,43 @@ class BaseCloudbaseinitRecipe(base.BaseRecipe):
     def replace_code(self):
         """Do whatever is necessary to replace the code for cloudbaseinit."""
 
+    @classmethod
+    def golden_image_key(cls):
+        """Get what the recipe writes into the image from its environment.
+
+        It is part of the key of the golden images, besides the recipe
+        type and the configuration, so an image isn't reused once it
+        doesn't match the environment anymore.
+        """
+        return None
+
+    def save_golden_image(self, service_type=None):
+        """Snapshot the prepared instance, if golden images are enabled.
+
+        The snapshot can be used by the next scenarios using the same
+        recipe and the same *service_type* for skipping the
+        installation of CloudbaseInit. It is only an optimization,
+        so a failure to create it is logged and otherwise ignored.
+        """
+        golden_images = golden.get_golden_images(self._conf)
+        if not golden_images:
+            return
+
+        name = util.rand_name("argus-golden-" + type(self).__name__)
+        LOG.info("Creating golden image %s...", name)
+        try:
+            image_id = self._backend.snapshot_instance(name)
+        except NotImplementedError:
+            LOG.warning("The backend %s can't create golden images.",
+                        type(self._backend).__name__)
+            return
+        except Exception:
+            LOG.exception("Creating golden image %s failed", name)
+            return
+        golden_images.register(type(self), image_id,
+                               self._backend.delete_snapshot,
+                               service_type=service_type)
+
     def prepare(self, service_type=None, **kwargs):
         """Prepare the underlying instance.
 
@@ -93,15 +131,24 @@ class BaseCloudbaseinitRecipe(base.BaseRecipe):
         * get an installation script for CloudbaseInit
         * install CloudbaseInit by running the previously downloaded file.
         * wait until the instance is up and running.
+
+        If the instance was booted from a golden image, then
+        CloudbaseInit is already installed, so only the sysprep
+        part is executed.
         """
         LOG.info("Preparing instance...")
         self.wait_for_boot_completion()
-        self.execution_prologue()
-        self.get_installation_script()
-        self.install_cbinit(service_type)
-        self.replace_install()
-        self.replace_code()
-        self.pre_sysprep()
+        if self._backend.golden_image:
+            LOG.info("Instance booted from golden image %s, skipping "
+                     "the installation.", self._backend.golden_image)
+        else:
+            self.execution_prologue()
+            self.get_installation_script()
+            self.install_cbinit(service_type)
+            self.replace_install()
+            self.replace_code()
+            self.pre_sysprep()
+            self.save_golden_image(service_type)
         if self._conf.argus.pause:
             six.moves.input("Press Enter to continue...")
 
@@ -18,9 +18,13 @@
 import ntpath
 import os
 import socket
+import time
 
 from winrm import exceptions as winrm_exceptions
 
+from argus.backends import console
+from argus.backends import reboot
+from argus import capabilities
 from argus import exceptions
 from argus.introspection.cloud import windows as introspection
 from argus.recipes.cloud import base
@@ -31,13 +35,24 @@ LOG = util.get_logger()
 # Default values for an instance under booting step.
 COUNT = 20
 DELAY = 20
+# The installer has to fail through WinRM this many times in a row
+# before the scheduled task is used right away, which lasts until
+# the last failure is older than the given number of seconds.
+WINRM_INSTALL_FAILURES = 2
+WINRM_INSTALL_RETRY = 7 * 24 * 3600
 
 
 class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
     """Recipe for preparing a Windows instance."""
 
+    @util.cached_property
+    def _capabilities(self):
+        return capabilities.get_image_capabilities(self._conf)
+
     def wait_for_boot_completion(self):
         LOG.info("Waiting for boot completion...")
+        if self._wait_console_event(console.BOOT_COMPLETED, COUNT * DELAY):
+            return
 
         wait_cmd = ('powershell "(Get-WmiObject Win32_Account | '
                     'where -Property Name -contains {0}).Name"'
@@ -78,18 +93,57 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
         cmd = ('powershell "C:\\\\installcbinit.ps1 -serviceType {} '
                '-installer {}"'.format(service_type, installer))
-        try:
-            self._execute(cmd, count=5, delay=5)
-        except exceptions.ArgusError:
-            # This can happen for multiple reasons,
-            # but one of them is the fact that the installer
-            # can't be installed through WinRM on some OSes
-            # for whatever reason. In this case, we're falling back
-            # to use a scheduled task.
+        if self._installs_over_winrm() is False:
+            LOG.info("The installer is known not to work through WinRM "
+                     "on this image, using a scheduled task.")
             self._deploy_using_scheduled_task(installer, service_type)
+        else:
+            try:
+                self._execute(cmd, count=5, delay=5)
+            except exceptions.ArgusError:
+                # This can happen for multiple reasons,
+                # but one of them is the fact that the installer
+                # can't be installed through WinRM on some OSes
+                # for whatever reason. In this case, we're falling back
+                # to use a scheduled task.
+                self._remember_install_method(over_winrm=False)
+                self._deploy_using_scheduled_task(installer, service_type)
+            else:
+                self._remember_install_method(over_winrm=True)
 
         self._grab_cbinit_installation_log()
 
+    def _installs_over_winrm(self):
+        """Tell if the installer works through WinRM, None if unknown.
+
+        A failure can be a transient one, such as a failed download,
+        so it is known not to work only after repeated failures, and
+        only until they expire.
+        """
+        if not self._capabilities:
+            return None
+        known = self._capabilities.lookup('msi_over_winrm')
+        if not isinstance(known, dict):
+            # Either True or unknown.
+            return known or None
+        if (known['failures'] >= WINRM_INSTALL_FAILURES and
+                time.time() - known['last'] < WINRM_INSTALL_RETRY):
+            return False
+        return None
+
+    def _remember_install_method(self, over_winrm):
+        if not self._capabilities:
+            return
+        if over_winrm:
+            self._capabilities.store('msi_over_winrm', True)
+            return
+        known = self._capabilities.lookup('msi_over_winrm')
+        failures = known['failures'] if isinstance(known, dict) else 0
+        self._capabilities.store('msi_over_winrm', {
+            'failures': failures + 1,
+            'last': time.time(),
+        })
+
     def _deploy_using_scheduled_task(self, installer, service_type):
         cmd = ("powershell Invoke-webrequest -uri "
                "{}/windows/schedule_installer.bat -outfile "
@@ -148,7 +202,8 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         self._execute(cmd)
 
         LOG.debug("Replace old files with the new ones.")
-        cbdir = introspection.get_cbinit_dir(self._execute)
+        cbdir = introspection.get_cbinit_dir(
+            self._execute, self._capabilities)
         self._execute('xcopy /y /e /q "C:\\install\\Cloudbase-Init"'
                       ' "{}"'.format(cbdir))
 
@@ -162,7 +217,8 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
         LOG.info("Getting cloudbase-init location...")
         # Get cb-init python location.
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = introspection.get_python_dir(
+            self._execute, self._capabilities)
 
         # Remove everything from the cloudbaseinit installation.
         LOG.info("Removing recursively cloudbaseinit...")
@@ -204,14 +260,16 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         """
         introspection.set_config_option(
             option="first_logon_behaviour", value="no",
-            execute_function=self._execute)
+            execute_function=self._execute,
+            capabilities=self._capabilities)
 
         # Patch the installation of cloudbaseinit in order to create
         # a file when the execution ends. We're doing this instead of
         # monitoring the service, because on some OSes, just checking
         # if the service is stopped leads to errors, due to the
         # fact that the service starts later on.
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = introspection.get_python_dir(
+            self._execute, self._capabilities)
         cbinit = ntpath.join(python_dir, 'Lib', 'site-packages',
                              'cloudbaseinit')
 
@@ -234,6 +292,9 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
                "{}/windows/sysprep.ps1 -outfile 'C:\\sysprep.ps1'"
                .format(self._conf.argus.resources))
         self._execute(cmd)
+
+        tracker = reboot.RebootTracker(self._backend.remote_client)
+        tracker.record()
         try:
             self._backend.remote_client.run_command(
                 'powershell C:\\sysprep.ps1')
@@ -243,6 +304,12 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
             # Any other error should propagate.
             pass
 
+        # Make sure that the next steps are not talking with
+        # the instance as it was before sysprepping.
+        if not tracker.wait_down(COUNT * DELAY):
+            raise exceptions.ArgusTimeoutError(
+                "The instance didn't restart after running sysprep.")
+
     def wait_cbinit_finalization(self):
         """Wait for the finalization of CloudbaseInit.
 
@@ -250,14 +317,18 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         """
         LOG.info("Waiting for the finalization of CloudbaseInit execution...")
 
-        # Check if the service actually started.
-        unattended_cmd = 'powershell Test-Path C:\\cloudbaseinit_unattended'
-        normal_cmd = 'powershell Test-Path C:\\cloudbaseinit_normal'
-        for check_cmd in (unattended_cmd, normal_cmd):
-            self._execute_until_condition(
-                check_cmd,
-                lambda out: out.strip() == 'True',
-                count=COUNT, delay=DELAY)
+        # The patched shell announces through the console when
+        # cloudbaseinit finished, otherwise check if the service
+        # actually started.
+        if not self._wait_console_event(console.CBINIT_FINISHED,
+                                        COUNT * DELAY):
+            unattended_cmd = 'powershell Test-Path C:\\cloudbaseinit_unattended'
+            normal_cmd = 'powershell Test-Path C:\\cloudbaseinit_normal'
+            for check_cmd in (unattended_cmd, normal_cmd):
+                self._execute_until_condition(
+                    check_cmd,
+                    lambda out: out.strip() == 'True',
+                    count=COUNT, delay=DELAY)
 
         # Check if the service finished
         wait_cmd = ('powershell (Get-Service "| where -Property Name '
@@ -311,7 +382,8 @@ class BaseNextLogonRecipe(CloudbaseinitRecipe):
         introspection.set_config_option(
             option="first_logon_behaviour",
             value=self.behaviour,
-            execute_function=self._execute)
+            execute_function=self._execute,
+            capabilities=self._capabilities)
 
 
 class AlwaysChangeLogonPasswordRecipe(BaseNextLogonRecipe):
@@ -332,6 +404,11 @@ class CloudbaseinitMockServiceRecipe(CloudbaseinitRecipe):
     config_entry = None
     pattern = "{}"
 
+    @classmethod
+    def golden_image_key(cls):
+        # The address of the mocked service is written into the image.
+        return util.get_local_ip()
+
     def pre_sysprep(self):
         super(CloudbaseinitMockServiceRecipe, self).pre_sysprep()
         LOG.info("Inject guest IP for mocked service access.")
@@ -340,7 +417,8 @@ class CloudbaseinitMockServiceRecipe(CloudbaseinitRecipe):
         address = self.pattern.format(util.get_local_ip())
         introspection.set_config_option(option=self.config_entry,
                                         value=address,
-                                        execute_function=self._execute)
+                                        execute_function=self._execute,
+                                        capabilities=self._capabilities)
 
 
 class CloudbaseinitEC2Recipe(CloudbaseinitMockServiceRecipe):
@@ -359,7 +437,8 @@ class CloudbaseinitCloudstackRecipe(CloudbaseinitMockServiceRecipe):
     def pre_sysprep(self):
         super(CloudbaseinitCloudstackRecipe, self).pre_sysprep()
 
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = introspection.get_python_dir(
+            self._execute, self._capabilities)
         cbinit = ntpath.join(python_dir, 'Lib', 'site-packages',
                              'cloudbaseinit')
 
@@ -398,7 +477,8 @@ class CloudbaseinitMaasRecipe(CloudbaseinitMockServiceRecipe):
 
         for field in required_fields:
             introspection.set_config_option(option=field, value="secret",
-                                            execute_function=self._execute)
+                                            execute_function=self._execute,
+                                            capabilities=self._capabilities)
 
 
 class CloudbaseinitWinrmRecipe(CloudbaseinitCreateUserRecipe):
@@ -412,7 +492,8 @@ class CloudbaseinitWinrmRecipe(CloudbaseinitCreateUserRecipe):
                   "ConfigWinRMCertificateAuthPlugin,"
                   "cloudbaseinit.plugins.windows.winrmlistener."
                   "ConfigWinRMListenerPlugin",
-            execute_function=self._execute)
+            execute_function=self._execute,
+            capabilities=self._capabilities)
 
 
 class CloudbaseinitHTTPRecipe(CloudbaseinitMockServiceRecipe):
@@ -440,7 +521,8 @@ class CloudbaseinitKeysRecipe(CloudbaseinitHTTPRecipe,
                   "ConfigWinRMListenerPlugin,"
                   "cloudbaseinit.plugins.windows.winrmcertificateauth."
                   "ConfigWinRMCertificateAuthPlugin",
-            execute_function=self._execute)
+            execute_function=self._execute,
+            capabilities=self._capabilities)
 
 
 class CloudbaseinitLocalScriptsRecipe(CloudbaseinitRecipe):
@@ -450,7 +532,8 @@ class CloudbaseinitLocalScriptsRecipe(CloudbaseinitRecipe):
         super(CloudbaseinitLocalScriptsRecipe, self).pre_sysprep()
         LOG.info("Download reboot-required local script.")
 
-        cbdir = introspection.get_cbinit_dir(self._execute)
+        cbdir = introspection.get_cbinit_dir(
+            self._execute, self._capabilities)
         cmd = ("powershell Invoke-WebRequest -uri "
                "{}/windows/reboot.cmd -outfile "
                "'C:\\Scripts\\reboot.cmd'")
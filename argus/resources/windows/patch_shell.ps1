@@ -4,6 +4,7 @@ param
 )
 
 $patch_code = @'
+import logging
 import os
 from cloudbaseinit.original_shell import main
 
@@ -17,12 +18,17 @@ def heart_beat():
 
     if not os.path.exists(first):
         create_file(first)
+        return "unattended"
     else:
         create_file(second)
+        return "normal"
 
-heart_beat()
+stage = heart_beat()
 if __name__ == '__main__':
     main()
+    # Goes to the serial port as well, watched by argus.
+    logging.getLogger('cloudbaseinit').info(
+        'argus: cloudbaseinit finished %s', stage)
 '@
 
 mv $cloudbaseinitdir\shell.py $cloudbaseinitdir\original_shell.py -ErrorAction ignore
@@ -19,6 +19,8 @@ import unittest
 
 import six
 
+from argus import golden
+from argus.scenarios import pool
 from argus import util
 
 
@@ -138,11 +140,17 @@ class BaseScenario(unittest.TestCase):
             except OSError:
                 pass
 
+        # The backend inherited from a base scenario was already
+        # cleaned up, it is neither reused nor cleaned up again.
+        cls.backend = None
         try:
-            cls.backend = cls.backend_type(cls.conf, cls.__name__,
-                                           cls.userdata, cls.metadata,
-                                           cls.availability_zone)
-            cls.backend.setup_instance()
+            instance_pool = pool.get_instance_pool(cls.conf)
+            backend = instance_pool.acquire(cls) if instance_pool else None
+            if backend is None:
+                cls.boot_backend()
+            else:
+                cls.backend = backend
+            cls.backend.start_console_collector()
 
             cls.prepare_instance()
 
@@ -153,6 +161,69 @@ class BaseScenario(unittest.TestCase):
             cls.tearDownClass()
             raise
 
+    @classmethod
+    def boot_backend(cls):
+        """Create the backend of this scenario and set up its instance.
+
+        When the instance can't be booted from a golden image, which
+        could have been deleted or be broken, the image is evicted
+        and the instance is booted from the configured image instead.
+        """
+        cls.backend = cls.create_backend()
+        image_id = cls.backend.golden_image
+        try:
+            cls.backend.setup_instance()
+            return
+        except Exception:
+            if not image_id:
+                raise
+            LOG.exception("Booting from golden image %s failed, "
+                          "evicting it", image_id)
+
+        try:
+            cls.backend.cleanup()
+        except Exception:
+            LOG.exception("Cleaning up the instance of golden image %s "
+                          "failed", image_id)
+        evicted = golden.get_golden_images(cls.conf).forget(
+            cls.recipe_type, image_id, cls.recipe_service_type())
+        cls.backend = cls.create_backend()
+        cls.backend.setup_instance()
+        if evicted:
+            try:
+                cls.backend.delete_snapshot(image_id)
+            except Exception as exc:
+                LOG.warning("Could not delete golden image %s: %r",
+                            image_id, exc)
+
+    @classmethod
+    def create_backend(cls):
+        """Create the backend of this scenario, without an instance yet."""
+        backend = cls.backend_type(cls.conf, cls.__name__,
+                                   cls.userdata, cls.metadata,
+                                   cls.availability_zone)
+        cls.use_golden_image(backend)
+        return backend
+
+    @classmethod
+    def use_golden_image(cls, backend):
+        """Boot the instance from a golden image, if one is available.
+
+        The golden image is looked up by the recipe used by this
+        scenario, so that the recipe can skip the steps which
+        are already done.
+        """
+        golden_images = golden.get_golden_images(cls.conf)
+        if not golden_images:
+            return
+
+        image_id = golden_images.lookup(cls.recipe_type,
+                                        cls.recipe_service_type())
+        if image_id:
+            LOG.info("Using golden image %s for scenario %s",
+                     image_id, cls.__name__)
+            backend.golden_image = image_id
+
     @classmethod
     def prepare_instance(cls):
         """Prepare the underlying instance."""
@@ -163,6 +234,15 @@ class BaseScenario(unittest.TestCase):
         cls.prepare_recipe()
         cls.backend.save_instance_output()
 
+    @classmethod
+    def recipe_service_type(cls):
+        """Get the service type given to the recipe, if any.
+
+        The golden images are looked up by it, since the recipe
+        configures cloudbaseinit for it.
+        """
+        return None
+
     @classmethod
     def prepare_recipe(cls):
         """Call the *prepare* method of the underlying recipe
@@ -180,4 +260,5 @@ class BaseScenario(unittest.TestCase):
         :meth:`setUpClass` needs to be destroyed here.
         """
         if cls.backend:
+            cls.backend.stop_console_collector()
             cls.backend.cleanup()
@@ -22,7 +22,11 @@ class CloudScenario(base.BaseScenario):
 
     service_type = 'http'
 
+    @classmethod
+    def recipe_service_type(cls):
+        return cls.service_type
+
     @classmethod
     def prepare_recipe(cls):
         """Prepare the underlying recipe using custom behavior tailored to cloudbaseinit."""
-        return cls.recipe.prepare(service_type=cls.service_type)
+        return cls.recipe.prepare(service_type=cls.recipe_service_type())
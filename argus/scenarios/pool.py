@@ -0,0 +1,233 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Boot the instances of the upcoming scenarios ahead of time.
+
+Booting an instance is the longest wait of a scenario, so the pool
+looks at the scenarios which are going to run and keeps the
+instances of the next ones booting, while the current one is
+running its tests.
+"""
+
+import collections
+import threading
+import unittest
+
+from argus import util
+
+
+__all__ = (
+    'InstancePool',
+    'get_instance_pool',
+    'iter_scenarios',
+)
+
+LOG = util.get_logger()
+
+
+def iter_scenarios(suite):
+    """Get the scenario classes of a test suite, in their running order."""
+    seen = set()
+    for test in _iter_tests(suite):
+        klass = type(test)
+        if klass not in seen:
+            seen.add(klass)
+            yield klass
+
+
+def _iter_tests(suite):
+    if isinstance(suite, unittest.TestSuite):
+        for test in suite:
+            for item in _iter_tests(test):
+                yield item
+    else:
+        yield suite
+
+
+class _Slot(object):
+    """An instance booted in advance for a scenario."""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.backend = None
+        self.error = None
+        self.claimed = False
+        self.finished = threading.Event()
+
+
+class InstancePool(object):
+    """Keep the instances of the upcoming scenarios booting.
+
+    The instances are booted exactly like :meth:`BaseScenario.setUpClass`
+    would do it, through :meth:`BaseScenario.create_backend`, so an
+    instance from the pool has the backend type, image, flavor,
+    availability zone, userdata and metadata of the scenario it was
+    booted for and it is used only by that scenario.
+
+    :param size:
+        How many scenarios, after the running one, should have
+        an instance booting or ready at any time.
+    :param max_in_flight:
+        How many instances can be booting at the same time.
+    :param batch:
+        Whether the instances of the scenarios using the same backend
+        type are set up together, through the backend's
+        ``setup_instances`` class method, if it has one.
+    """
+
+    def __init__(self, size, max_in_flight, batch=False):
+        self._size = size
+        self._max_in_flight = max_in_flight
+        self._batch = batch
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._in_flight_lock = threading.Lock()
+        self._plan = []
+        self._slots = {}
+        self._position = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def plan(self, scenarios):
+        """Give the scenarios which are going to run, in order."""
+        with self._lock:
+            self._plan = [scenario for scenario in scenarios
+                          if hasattr(scenario, 'create_backend') and
+                          scenario.is_final() and
+                          not getattr(scenario, '__unittest_skip__', False)]
+            self._position = 0
+            LOG.info("Planned %d scenarios for the instance pool.",
+                     len(self._plan))
+            self._fill()
+
+    def _fill(self):
+        # The running scenario and the next ones.
+        upcoming = self._plan[self._position:self._position + self._size + 1]
+        new_slots = []
+        for scenario in upcoming:
+            if scenario not in self._slots:
+                slot = self._slots[scenario] = _Slot(scenario)
+                new_slots.append(slot)
+
+        for batch in self._batches(new_slots):
+            thread = threading.Thread(target=self._provision, args=(batch, ))
+            thread.daemon = True
+            thread.start()
+
+    def _batches(self, slots):
+        """Group the slots whose instances can be set up together."""
+        if not self._batch:
+            return [[slot] for slot in slots]
+        groups = collections.OrderedDict()
+        for slot in slots:
+            backend_type = slot.scenario.backend_type
+            key = (backend_type if hasattr(backend_type, 'setup_instances')
+                   else slot)
+            groups.setdefault(key, []).append(slot)
+        return [group[index:index + self._max_in_flight]
+                for group in groups.values()
+                for index in range(0, len(group), self._max_in_flight)]
+
+    def _acquire_in_flight(self, count):
+        # Taken all at once, so that batches don't block each other.
+        with self._in_flight_lock:
+            for _ in range(count):
+                self._in_flight.acquire()
+
+    def _release_in_flight(self, count):
+        for _ in range(count):
+            self._in_flight.release()
+
+    def _provision(self, slots):
+        self._acquire_in_flight(len(slots))
+        backends = []
+        try:
+            if self._closed:
+                return
+            names = ", ".join(slot.scenario.__name__ for slot in slots)
+            LOG.info("Booting ahead for %s", names)
+            try:
+                backends = [slot.scenario.create_backend() for slot in slots]
+                if len(backends) == 1:
+                    backends[0].setup_instance()
+                else:
+                    type(backends[0]).setup_instances(backends)
+            except Exception as exc:
+                LOG.exception("Booting ahead for %s failed", names)
+                for slot in slots:
+                    slot.error = exc
+                for backend in backends:
+                    self._discard(backend)
+                return
+            for slot, backend in zip(slots, backends):
+                slot.backend = backend
+        finally:
+            self._release_in_flight(len(slots))
+            for slot in slots:
+                slot.finished.set()
+
+    @staticmethod
+    def _discard(backend):
+        try:
+            backend.cleanup()
+        except Exception:
+            LOG.exception("Cleaning up an unused instance failed")
+
+    def acquire(self, scenario):
+        """Get the backend with the instance booted for *scenario*.
+
+        Return None if there is no such instance, in which case the
+        scenario has to boot its own.
+        """
+        with self._lock:
+            if self._closed or scenario not in self._plan:
+                return None
+            self._position = max(self._position,
+                                 self._plan.index(scenario))
+            self._fill()
+            slot = self._slots.get(scenario)
+        if slot is None:
+            return None
+
+        slot.finished.wait()
+        with self._lock:
+            if slot.claimed or slot.backend is None:
+                return None
+            slot.claimed = True
+        LOG.info("Using the instance booted ahead for %s",
+                 scenario.__name__)
+        return slot.backend
+
+    def close(self):
+        """Stop booting and clean up the instances which weren't used."""
+        with self._lock:
+            self._closed = True
+            slots = list(self._slots.values())
+        for slot in slots:
+            slot.finished.wait()
+            if not slot.claimed and slot.backend is not None:
+                LOG.info("Cleaning up the unused instance of %s",
+                         slot.scenario.__name__)
+                slot.claimed = True
+                self._discard(slot.backend)
+
+
+@util.run_once
+def get_instance_pool(conf):
+    """Get the instance pool of this process, if it is enabled."""
+    if not conf.argus.instance_pool_size:
+        return None
+    return InstancePool(conf.argus.instance_pool_size,
+                        conf.argus.instance_pool_max_in_flight,
+                        conf.argus.instance_pool_batch)
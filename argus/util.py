@@ -24,6 +24,7 @@ import socket
 import struct
 import subprocess
 import sys
+import threading
 
 import six
 
@@ -43,6 +44,7 @@ __all__ = (
     'rand_name',
     'get_public_keys',
     'get_certificate',
+    'run_concurrently',
 )
 
 DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -132,6 +134,34 @@ def run_once(func, state={}, errors={}):
     return wrapper
 
 
+def run_concurrently(*funcs):
+    """Run the given callables in parallel, each one in its own thread.
+
+    Return a list with their results, in the same order as the callables.
+    If any of them fails, the error is raised after all of them finished,
+    so that the callers know exactly what was done.
+    """
+    results = [None] * len(funcs)
+    errors = []
+
+    def run(index, func):
+        try:
+            results[index] = func()
+        except Exception:
+            errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=run, args=(index, func))
+               for index, func in enumerate(funcs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        six.reraise(*errors[0])
+    return results
+
+
 def get_resource(resource):
     """Get the given resource from the list of known resources."""
     return pkgutil.get_data('argus.resources', resource)
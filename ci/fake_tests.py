@@ -0,0 +1,52 @@
+# Copyright 2015 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Scenarios running against the in-process fake cloud.
+
+They go through the whole lifecycle of a scenario, without a cloud
+and without an instance, for measuring the overhead of argus itself:
+
+    python -m unittest ci.fake_tests
+"""
+
+from argus.backends import fake
+from argus.introspection.cloud import windows as introspection
+from argus.recipes.cloud import windows as recipe
+from argus.scenarios.cloud import base
+from argus.tests.cloud import smoke
+
+
+class FakeWindowsBackend(fake.FakeCloudBackend):
+    """A fake cloud with the latencies of a fast real one."""
+
+    api_latency = (0.2, 0.05)
+    boot_latency = (2, 0.5)
+    reboot_latency = (1, 0.2)
+    command_latency = (0.1, 0.02)
+
+
+class BaseFakeWindowsScenario(base.CloudScenario):
+
+    backend_type = FakeWindowsBackend
+    introspection_type = introspection.InstanceIntrospection
+    recipe_type = recipe.CloudbaseinitRecipe
+    userdata = None
+    metadata = {}
+
+
+class ScenarioFakeSmoke(BaseFakeWindowsScenario):
+
+    test_classes = (smoke.TestCreatedUser, smoke.TestNoError)
+
@@ -16,12 +16,14 @@
 import unittest
 
 from argus.backends.heat import heat_backend
-from argus.backends.tempest import manager
+from argus.backends.tempest import reaper
 from argus.backends.tempest import cloud as tempest_cloud_backend
 from argus.backends.tempest import tempest_backend
+from argus.backends.tempest import tenants
 from argus.introspection.cloud import windows as introspection
 from argus.recipes.cloud import windows as recipe
 from argus.scenarios import base
+from argus.scenarios import pool
 from argus.scenarios.cloud import windows as windows_scenarios
 from argus.tests.cloud import smoke
 from argus.tests.cloud.windows import test_smoke
@@ -29,7 +31,8 @@ from argus import util
 
 
 def _availability_zones():
-    api_manager = manager.APIManager()
+    # The tenant is given back to the pool, for the first scenario.
+    api_manager = tenants.acquire_manager(util.get_config())
     try:
         zones = api_manager.availability_zone_client.list_availability_zones()
         info = zones['availabilityZoneInfo']
@@ -40,6 +43,23 @@ def _availability_zones():
 AVAILABILITY_ZONES = _availability_zones()
 
 
+def load_tests(loader, tests, pattern):
+    # pylint: disable=unused-argument
+    instance_pool = pool.get_instance_pool(util.get_config())
+    if instance_pool:
+        instance_pool.plan(pool.iter_scenarios(tests))
+    return tests
+
+
+def tearDownModule():
+    conf = util.get_config()
+    instance_pool = pool.get_instance_pool(conf)
+    if instance_pool:
+        instance_pool.close()
+    # Wait for the teardown of the last scenarios, when done in background.
+    reaper.get_reaper(conf).drain()
+
+
 class BaseWindowsScenario(base.BaseScenario):
 
     backend_type = tempest_backend.BaseWindowsTempestBackend